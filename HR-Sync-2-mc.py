@@ -1,7 +1,19 @@
+import os
+import hmac
 import json
+import math
 import time
+import zlib
+import runpy
+import bisect
+import signal
+import urllib.parse
 import requests
 import threading
+import multiprocessing
+import multiprocessing.connection
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import paho.mqtt.client as mqtt
 from mcrcon import MCRcon
 
@@ -14,6 +26,10 @@ RCON_PASS = '123456'
 
 # 2. 玩家数据源列表 (关键！)
 # 格式：'玩家ID': {'type': '类型', 'source': '地址'}
+# 玩家多、需要随时增减时，把同样格式的 JSON 写进 PLAYERS_FILE：文件存在时取代下面的字典，
+# 运行中修改会自动重新加载 (已有的数据源保持连接不中断)
+PLAYERS_FILE = os.environ.get('HR_PLAYERS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'players.json'))
+RELOAD_CHECK_INTERVAL = 2.0  # 每隔多少秒检查一次玩家列表文件 (秒)
 PLAYERS_CONFIG = {
     # === 你的配置 (HTTP/IPv6 模式) ===
     'xiao_qv_angel': {
@@ -27,83 +43,824 @@ PLAYERS_CONFIG = {
 
     # === 朋友B (如果他用网页/MQTT) ===
     # 'Friend_B': {'type': 'mqtt', 'topic': 'iqoo_watch_share/hr_data'},
+
+    # === 朋友C (在 NAT 后面，由他的 hr.py 主动推送: --push http://网关:8090/ingest/Friend_C --push-token 令牌) ===
+    # 'Friend_C': {'type': 'push', 'token': '换成一串随机字符'},
 }
 
 # 3. MQTT 公共配置 (如果有玩家用MQTT)
-MQTT_BROKER = 'broker.emqx.io'
-MQTT_PORT = 1883
+# 可用环境变量覆盖，例如本地测试: HR_MQTT_BROKER=127.0.0.1
+MQTT_BROKER = os.environ.get('HR_MQTT_BROKER', 'broker.emqx.io')
+MQTT_PORT = int(os.environ.get('HR_MQTT_PORT', 1883))
+MQTT_SUBSCRIPTION = None   # None = 按各玩家 topic 的公共前缀自动生成一个通配订阅，如 'iqoo_watch_share/#'
+
+# 4. HTTP 轮询节奏
+POLL_INTERVAL = 1.0    # 每轮间隔 (秒)
+POLL_DEADLINE = 0.8    # 单个数据源的截止时间 (秒)，超时只错过它自己这一轮
+STATS_INTERVAL = 60    # 每隔多少秒打印一次各数据源耗时统计 (0 = 关闭)
+POLL_WORKERS = 0       # 0 = 在本进程内用线程轮询；N = 按玩家分到 N 个工作进程 (几百个 HTTP 玩家时分摊请求和 JSON 解析的 CPU)
+POLL_THREADS = 0       # 每个进程的轮询线程上限，0 = 每个数据源一个线程 (慢源不会挤占别人)
+
+# 5. RCON 写入
+RCON_RETRY_DELAY = 5       # 连接断开后的重连间隔 (秒)
+RCON_RESEND_INTERVAL = 60  # 值不变时也每隔多少秒重写一次，防止计分板被手动清掉
+RCON_WRITE_BUDGET = 0.5    # 每轮写 RCON 最多占用多少秒，剩下的留到下一轮优先写 (0 = 不限)
+                           # mcrcon 每条指令后固定等 3 ms (MC-72390)，一个连接每秒最多约 300 条；玩家很多时靠它保住轮询节拍
+
+# 6. Prometheus 指标 (http://本机:端口/metrics)
+METRICS_PORT = 9109        # 0 = 关闭
+
+# 7. 推送接入 (type 为 push 的玩家：POST /ingest/<玩家ID>，Authorization: Bearer <令牌>)
+INGEST_PORT = 8090         # 0 = 关闭
+INGEST_MAX_BODY = 65536    # 单个请求体上限 (字节)
+PUSH_FLUSH_DELAY = 0.02    # 收到推送后等这么久再写计分板，把同时到达的推送合成一批 (秒)
 # ============================================
 
-def update_score(player, hr):
-    """ 发送 RCON 指令的核心函数 """
-    if not hr: return
-    try:
-        with MCRcon(RCON_HOST, RCON_PASS, port=RCON_PORT) as mcr:
-            mcr.command(f'scoreboard players set {player} heart_rate {hr}')
+# --- 指标：计数器挂在各对象上，只有被抓取时才格式化 ---
+# Histogram 与 hr.py 中的一字不差，改时两边一起改 (导出见模块4)
+class Histogram:
+    """固定桶直方图：observe 是一次二分查找 + 几次加法，导出时再累加成 Prometheus 的累计桶"""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1) # 最后一格是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+POLL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.8, 1, 2)
+TICK_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.8, 1, 2)
+RCON_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+E2E_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+
+# --- RCON 写入：常驻会话 + 每轮合并 ---
+class RconWriter:
+    """ 一个长期保持的 RCON 连接。update_score 只登记最新值，
+    每轮由 flush() 统一发送：同一玩家每轮最多一条指令，值没变就不发。
+    注意：mcrcon 在非 Windows 上用 SIGALRM 做超时，所以 flush() 必须在主线程调用。 """
+    def __init__(self, host, password, port):
+        self.host = host
+        self.password = password
+        self.port = port
+        self.mcr = None
+        self.lock = threading.Lock()
+        self.pending = {}       # 玩家 -> (本轮最新心率, 样本时间戳)
+        self.written = {}       # 玩家 -> (已写入的心率, 写入时间)
+        self.retry_at = 0.0
+        # 累计指标 (不随 reset_stats 清零，供 /metrics)
+        self.rtt_seconds = Histogram(RCON_BUCKETS)
+        self.sample_to_score_seconds = Histogram(E2E_BUCKETS)
+        self.errors_total = self.suppressed_total = self.connects_total = self.deferred_total = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.sent = self.suppressed = self.errors = self.deferred = 0
+        self.rtt_total_ms = self.rtt_max_ms = 0.0
+        self.latencies = [] # 样本产生 -> 写入计分板 (ms)，仅当数据源带 ts 时统计
+
+    def stage(self, player, hr, ts=None):
+        with self.lock:
+            if player in self.pending: # 同一轮内被新值覆盖
+                self.suppressed += 1
+                self.suppressed_total += 1
+            self.pending[player] = (hr, ts)
+
+    def _connect(self):
+        if self.mcr is not None: return True
+        if time.monotonic() < self.retry_at: return False
+        try:
+            mcr = MCRcon(self.host, self.password, port=self.port)
+            mcr.connect()
+            self.mcr = mcr
+            self.connects_total += 1
+            self.written.clear() # 服务器可能重启过，全部重新写一遍
+            print("🔗 RCON 已连接")
+            return True
+        except Exception as e:
+            print(f"RCON 连接失败: {e}，{RCON_RETRY_DELAY} 秒后重试")
+            self.retry_at = time.monotonic() + RCON_RETRY_DELAY
+            return False
+
+    def _disconnect(self):
+        try:
+            if self.mcr: self.mcr.disconnect()
+        except Exception:
+            pass
+        self.mcr = None
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        now = time.monotonic()
+        budget_end = now + RCON_WRITE_BUDGET if RCON_WRITE_BUDGET else None
+        for i, (player, (hr, ts)) in enumerate(batch.items()):
+            last = self.written.get(player)
+            if last and last[0] == hr and now - last[1] < RCON_RESEND_INTERVAL:
+                self.suppressed += 1
+                self.suppressed_total += 1
+                continue
+            if budget_end and time.monotonic() >= budget_end: # 本轮时间用完
+                self.deferred += len(batch) - i
+                self.deferred_total += len(batch) - i
+                self._requeue(batch, player)
+                return
+            if not self._connect():
+                self._requeue(batch, player)
+                return
+            t0 = time.perf_counter()
+            try:
+                self.mcr.command(f'scoreboard players set {player} heart_rate {hr}')
+            except Exception as e:
+                print(f"RCON 错误 ({player}): {e}")
+                self.errors += 1
+                self.errors_total += 1
+                self._disconnect()
+                self._requeue(batch, player)
+                return
+            rtt = time.perf_counter() - t0
+            self.rtt_seconds.observe(rtt)
+            self.rtt_total_ms += rtt * 1000
+            self.rtt_max_ms = max(self.rtt_max_ms, rtt * 1000)
+            self.sent += 1
+            self.written[player] = (hr, now)
+            if ts:
+                age = time.time() - ts
+                self.sample_to_score_seconds.observe(age)
+                self.latencies.append(age * 1000)
             # print(f"同步 -> {player}: {hr}") # 调试时可取消注释
-    except Exception as e:
-        print(f"RCON 错误 ({player}): {e}")
+
+    def forget(self, players):
+        """ 玩家被移出列表：丢弃还没写入的值 """
+        with self.lock:
+            for player in players:
+                self.pending.pop(player, None)
+                self.written.pop(player, None)
+
+    def _requeue(self, batch, from_player):
+        """ 把本轮未发送的值放回去，排在下一轮最前面 (期间到达的新值覆盖旧值) """
+        players = list(batch)
+        with self.lock:
+            leftover = {player: batch[player] for player in players[players.index(from_player):]}
+            leftover.update(self.pending)
+            self.pending = leftover
+
+    def stats_line(self):
+        avg = self.rtt_total_ms / self.sent if self.sent else 0.0
+        line = f"RCON: 发送 {self.sent} / 抑制 {self.suppressed} / 顺延 {self.deferred} / 错误 {self.errors}, 往返平均 {avg:.1f} ms, 最慢 {self.rtt_max_ms:.1f} ms"
+        if self.latencies:
+            lat = sorted(self.latencies)
+            line += f", 样本->计分板 p50 {lat[len(lat) // 2]:.0f} ms / p99 {lat[min(len(lat) - 1, len(lat) * 99 // 100)]:.0f} ms"
+        return line
+
+rcon_writer = RconWriter(RCON_HOST, RCON_PASS, RCON_PORT)
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def read_sample(data):
+    """ 从数据源的 JSON 对象取出 (心率, 样本时间戳)，格式不对返回 None。
+    心率会拼进 RCON 命令、时间戳参与延迟计算，外部输入 (公共 MQTT broker 上谁都能发) 必须是数字 """
+    if not isinstance(data, dict): return None
+    hr, ts = data.get('hr'), data.get('ts')
+    if not _number(hr) or hr < 0 or (ts is not None and not _number(ts)): return None
+    return round(hr), ts
+
+def update_score(player, hr, ts=None):
+    """ 登记玩家心率，由本轮结束时的 rcon_writer.flush() 统一写入；ts 为样本产生时间 (用于延迟统计) """
+    if not hr: return
+    rcon_writer.stage(player, hr, ts)
 
 # --- 模块1: HTTP 轮询 (用于你的 IPv6) ---
-def http_poller_loop():
-    print("🌐 HTTP 轮询线程已启动...")
+class HttpSource:
+    """ 单个 HTTP 数据源：独立的 keep-alive 会话，以及本源的耗时统计。
+    poll() 只发请求，record() 记统计；多进程模式下前者在工作进程执行，后者在主进程 """
+    def __init__(self, player, url):
+        self.player = player
+        self.url = url
+        self.session = None # 第一次请求时创建 (主进程里的统计副本不需要)
+        self.future = None  # 正在进行的请求；未完成时跳过本轮
+        # 累计指标 (不随 reset_stats 清零，供 /metrics)
+        self.poll_seconds = Histogram(POLL_BUCKETS)
+        self.failures = {}        # 失败原因 -> 次数
+        self.missed_total = 0
+        self.not_modified_total = 0  # 304：自上次以来没有新样本，不重复处理
+        self.etag = None
+        self.last_ok = None       # 最近一次成功的时刻 (monotonic)
+        self.last_ts = None       # 最近一个样本的产生时间 (数据源的 ts)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ok = self.fail = self.missed = 0
+        self.total_ms = self.max_ms = 0.0
+
+    def _session(self):
+        if self.session is None:
+            self.session = requests.Session()
+            self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return self.session
+
+    def close(self):
+        if self.session: self.session.close()
+
+    def fetch(self):
+        """ 发请求并记统计：返回 (心率, 样本时间戳) 或 None """
+        return self.record(*self.poll())
+
+    def poll(self):
+        """ 在线程池中执行：返回 (结果, (心率, 样本时间戳) 或 None, 耗时)，结果为 ok / not_modified / 失败原因 """
+        t0 = time.perf_counter()
+        try:
+            # 连接/读取超时都不超过截止时间，卡住的源不会一直占着线程
+            # 带上次的 ETag 做条件请求，没有新样本时 hr.py 只回 304，不传也不解析正文
+            resp = self._session().get(self.url, timeout=POLL_DEADLINE, headers={'If-None-Match': self.etag} if self.etag else None)
+            if resp.status_code == 304: return 'not_modified', None, time.perf_counter() - t0
+            if resp.status_code != 200: return 'status', None, time.perf_counter() - t0
+            sample = read_sample(resp.json())
+            if sample is None: return 'bad_json', None, time.perf_counter() - t0 # hr / ts 不是数字
+            self.etag = resp.headers.get('ETag')
+            return 'ok', sample, time.perf_counter() - t0
+        # 网络波动很正常，不刷屏报错，只按原因计数 (见 /metrics)
+        except requests.Timeout: reason = 'timeout'
+        except requests.ConnectionError: reason = 'connection'
+        except ValueError: reason = 'bad_json'
+        except Exception: reason = 'error'
+        return reason, None, time.perf_counter() - t0
+
+    def record(self, outcome, result, elapsed):
+        self.poll_seconds.observe(elapsed)
+        self.total_ms += elapsed * 1000
+        self.max_ms = max(self.max_ms, elapsed * 1000)
+        if outcome in ('ok', 'not_modified'):
+            self.ok += 1
+            self.last_ok = time.monotonic()
+            if outcome == 'not_modified': self.not_modified_total += 1
+        else:
+            self.fail += 1
+            self.failures[outcome] = self.failures.get(outcome, 0) + 1
+        if result and result[1]: self.last_ts = result[1]
+        return result
+
+    def stats_line(self):
+        done = self.ok + self.fail
+        avg = self.total_ms / done if done else 0.0
+        return f"{self.player}: 成功 {self.ok} / 失败 {self.fail} / 错过 {self.missed}, 平均 {avg:.0f} ms, 最慢 {self.max_ms:.0f} ms"
+
+def _reuse_sources(sources, urls):
+    """ 地址没变的源原样保留 (连接、ETag、统计都不丢)，其余新建；被移除的源关闭连接 """
+    kept = {p: sources[p] if p in sources and sources[p].url == url else HttpSource(p, url) for p, url in urls.items()}
+    for player, src in sources.items():
+        if kept.get(player) is not src: src.close()
+    return kept
+
+class ThreadPoller:
+    """ 在本进程的线程池里轮询：每个源最多一个在途请求，谁先回来先收谁 """
+    def __init__(self, threads=POLL_THREADS):
+        self.threads = threads
+        self.pool = None
+        self.size = 0
+        self.sources = {} # 玩家 -> HttpSource
+
+    def set_sources(self, urls):
+        self.sources = _reuse_sources(self.sources, urls)
+        size = self.threads or len(urls)
+        if size > self.size: # 线程池不能扩容：换一个更大的，旧池里在途的请求照常完成
+            if self.pool: self.pool.shutdown(wait=False)
+            self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=size, thread_name_prefix='poll')
+            self.size = size
+
+    def poll_round(self, deadline):
+        """ 返回 ([(源, 结果, 数据, 耗时)], [上一轮请求还没回来、本轮错过的源]) """
+        sources, done, missed = list(self.sources.values()), [], []
+        for src in sources:
+            if src.future is None: src.future = self.pool.submit(src.poll)
+            else: missed.append(src)
+        owners = {src.future: src for src in sources}
+        try:
+            for fut in concurrent.futures.as_completed(owners, timeout=max(0.0, deadline - time.monotonic())):
+                src = owners[fut]
+                src.future = None
+                done.append((src, *fut.result()))
+        except concurrent.futures.TimeoutError:
+            pass # 未按时返回的源留到下一轮，本轮算它错过
+        return done, missed
+
+    def close(self):
+        if self.pool: self.pool.shutdown(wait=False)
+
+def poll_worker(conn, threads):
+    """ 工作进程：按主进程分来的玩家轮询，每轮把结果一次性发回 (不碰 RCON) """
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C 由主进程处理，主进程退出后管道关闭，这里随之退出
+    poller = ThreadPoller(threads)
+    while True:
+        try: msg = conn.recv()
+        except (EOFError, OSError): return
+        if msg[0] == 'sources':
+            poller.set_sources(msg[1])
+        elif msg[0] == 'poll':
+            _, round_id, timeout = msg
+            done, missed = poller.poll_round(time.monotonic() + timeout)
+            conn.send((round_id, [(src.player, outcome, result, elapsed) for src, outcome, result, elapsed in done], [src.player for src in missed]))
+
+WORKER_CONTEXT = multiprocessing.get_context('spawn') # 全新解释器，不继承主进程的线程和锁：运行中随时重新拉起都安全
+WORKER_RUN_NAME = '__hr_poll_worker__' # 工作进程按文件路径重新执行本脚本 (文件名带连字符，作为模块也不一定导入得到)
+
+class ProcessPoller:
+    """ 把数据源按玩家 ID 的哈希固定分到 N 个工作进程 (重新加载时玩家不会换进程，连接得以保留)。
+    主进程只保存统计副本、收结果、写 RCON """
+    WORKER_GRACE = 0.2 # 工作进程在截止时间后最多再等它这么久
+
+    def __init__(self, workers, threads=POLL_THREADS):
+        self.threads = threads
+        self.workers = [None] * workers # (进程, 管道)
+        self.shards = [{} for _ in range(workers)]
+        self.sources = {}
+        self.round = 0
+        for i in range(workers): self._spawn(i)
+
+    def _spawn(self, i):
+        conn, child = WORKER_CONTEXT.Pipe()
+        proc = WORKER_CONTEXT.Process(target=runpy.run_path, args=(os.path.abspath(__file__),), name=f'hr-poll-{i}', daemon=True,
+                                      kwargs={'init_globals': {'WORKER_ARGS': (child, self.threads)}, 'run_name': WORKER_RUN_NAME})
+        proc.start()
+        child.close()
+        self.workers[i] = (proc, conn)
+        if self.shards[i]: conn.send(('sources', self.shards[i]))
+
+    def set_sources(self, urls):
+        self.sources = _reuse_sources(self.sources, urls)
+        shards = [{} for _ in self.workers]
+        for player, url in urls.items(): shards[zlib.crc32(player.encode()) % len(shards)][player] = url
+        for i, shard in enumerate(shards):
+            if shard != self.shards[i]: self.workers[i][1].send(('sources', shard))
+        self.shards = shards
+
+    def poll_round(self, deadline):
+        self.round += 1
+        timeout = max(0.0, deadline - time.monotonic())
+        for i, (proc, conn) in enumerate(self.workers):
+            try: conn.send(('poll', self.round, timeout))
+            except OSError: # 工作进程意外退出：重新拉起，下一轮恢复
+                print(f"⚠️ 轮询进程 {proc.name} 已退出，重新启动")
+                self._spawn(i)
+        waiting, done, missed = {conn: i for i, (_, conn) in enumerate(self.workers)}, [], []
+        while waiting:
+            ready = multiprocessing.connection.wait(list(waiting), timeout=max(0.0, deadline + self.WORKER_GRACE - time.monotonic()))
+            if not ready: break
+            for conn in ready:
+                try: round_id, results, late = conn.recv()
+                except (EOFError, OSError):
+                    del waiting[conn]
+                    continue
+                # 上一轮超时没等到的回复：数据照收，但还要继续等这个进程本轮的回复
+                if round_id == self.round: del waiting[conn]
+                done += [(self.sources[p], *rest) for p, *rest in results if p in self.sources]
+                missed += [self.sources[p] for p in late if p in self.sources]
+        return done, missed
+
+    def close(self):
+        for proc, conn in self.workers:
+            conn.close()
+            proc.join(timeout=1)
+
+def make_poller(workers=None, threads=None):
+    workers = POLL_WORKERS if workers is None else workers
+    threads = POLL_THREADS if threads is None else threads
+    return ProcessPoller(workers, threads) if workers > 0 else ThreadPoller(threads)
+
+http_sources = []  # 当前的 HTTP 数据源 (供 /metrics 读取)
+poller_stats = {'ticks': 0, 'overruns': 0, 'last_tick': 0.0, # 轮询循环本身的心跳，循环卡住时 last_tick 不再前进
+                'collect_seconds': Histogram(TICK_BUCKETS), 'write_seconds': Histogram(TICK_BUCKETS)} # 每轮收集数据源 / 写入计分板的耗时
+
+def set_http_sources(poller):
+    poller.set_sources({player: cfg['source'] for player, cfg in PLAYERS_CONFIG.items() if cfg['type'] == 'http'})
+    http_sources[:] = poller.sources.values()
+
+def http_poller_loop(poller=None):
+    poller = poller or make_poller()
+    set_http_sources(poller)
+    mode = f"{len(poller.workers)} 个工作进程" if isinstance(poller, ProcessPoller) else "线程池"
+    if http_sources: print(f"🌐 HTTP 轮询已启动 ({len(http_sources)} 个数据源并发，{mode})...")
+    else: print("ℹ️ 当前配置无 HTTP 玩家，仅处理 MQTT / 推送数据")
+
+    next_tick = time.monotonic()
+    next_stats = next_tick + STATS_INTERVAL
+    next_reload = next_tick + RELOAD_CHECK_INTERVAL
     while True:
-        for player, config in PLAYERS_CONFIG.items():
-            if config['type'] == 'http':
-                try:
-                    # 设置超时，防止卡顿
-                    resp = requests.get(config['source'], timeout=2)
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        hr = data.get('hr')
-                        if hr and hr > 0:
-                            update_score(player, hr)
-                except Exception as e:
-                    # 网络波动很正常，不刷屏报错
-                    pass 
-        time.sleep(1) # 每秒轮询一次
+        t_collect = time.monotonic()
+        done, missed = poller.poll_round(next_tick + POLL_DEADLINE)
+        for src in missed: # 上一轮的请求还没回来
+            src.missed += 1
+            src.missed_total += 1
+        for src, outcome, result, elapsed in done:
+            result = src.record(outcome, result, elapsed)
+            if result: update_score(src.player, *result)
+
+        # 本轮收集到的 HTTP / MQTT 数据一次性写入计分板 (MQTT 每个玩家只解析最新一条)
+        t_write = time.monotonic()
+        mqtt_inbox.drain()
+        rcon_writer.flush()
+
+        now = time.monotonic()
+        poller_stats['collect_seconds'].observe(t_write - t_collect)
+        poller_stats['write_seconds'].observe(now - t_write)
+        poller_stats['ticks'] += 1
+        poller_stats['last_tick'] = time.time()
+        if STATS_INTERVAL and now >= next_stats:
+            print(f"⏱️ 最近 {STATS_INTERVAL} 秒轮询统计:")
+            for src in http_sources:
+                print(f"   {src.stats_line()}")
+                src.reset_stats()
+            print(f"   {rcon_writer.stats_line()}")
+            rcon_writer.reset_stats()
+            next_stats = now + STATS_INTERVAL
+        if now >= next_reload: # 玩家列表在主线程里切换，与 RCON 写入天然串行
+            next_reload = now + RELOAD_CHECK_INTERVAL
+            config = player_registry.check()
+            if config is not None: apply_players(config, poller)
+
+        # 固定节拍：以计划时间为基准，避免一轮轮累积漂移；落后太多则重新对齐
+        next_tick += POLL_INTERVAL
+        if next_tick < now:
+            next_tick = now
+            poller_stats['overruns'] += 1
+        # 等下一轮期间，有推送到达就立即写入计分板 (RCON 仍只在主线程)，推送的延迟与轮询间隔无关
+        # 到点就开始下一轮：推送持续不断时 wait(0) 总是 True，不检查时间会一直卡在这里
+        while True:
+            remaining = next_tick - time.monotonic()
+            if remaining <= 0 or not flush_wakeup.wait(remaining): break
+            flush_wakeup.clear()
+            time.sleep(PUSH_FLUSH_DELAY)
+            rcon_writer.flush()
 
 # --- 模块2: MQTT 监听 (用于网页版玩家) ---
+mqtt_stats = {'messages': {}, 'last': {}, 'errors': 0, 'unrouted': 0} # 玩家 -> 消息数 / 最近一条的时间；无法解析 / 无人认领的消息数
+topic_index = {}  # topic -> (玩家, ...)，start_mqtt / 重新加载玩家列表时整体替换
+mqtt_client = None
+mqtt_subscriptions = [] # 当前订阅 [(topic, qos)]，断线重连后按它重新订阅
+
+def build_topic_index(players_config):
+    """ 启动时建一次 topic -> 玩家 的索引，收到消息只做一次字典查找，不再遍历全部玩家 """
+    index = {}
+    for player, cfg in players_config.items():
+        if cfg['type'] == 'mqtt': index.setdefault(cfg['topic'], []).append(player)
+    return {topic: tuple(players) for topic, players in index.items()}
+
+def wildcard_subscription(topics):
+    """ 所有 topic 的公共层级前缀 + '#'；只有一个 topic 时直接订阅它，没有公共前缀时返回 None (逐个订阅) """
+    if len(topics) == 1: return topics[0]
+    common = []
+    for levels in zip(*(t.split('/') for t in topics)):
+        if len(set(levels)) != 1 or levels[0] in ('', '+', '#'): break
+        common.append(levels[0])
+    return '/'.join(common) + '/#' if common else None
+
+class MqttInbox:
+    """ MQTT 线程里只按玩家保存最新一条原始消息 (不解析)，每轮由主循环 drain() 取走：
+    同一玩家一轮内的突发消息只解析最后一条，只有它会进计分板 """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = {}       # 玩家 -> 原始 payload
+        self.coalesced = 0     # 被同轮新消息覆盖、没有解析的条数
+        self.parsed = 0
+
+    def put(self, players, payload):
+        now = time.time()
+        with self.lock:
+            for player in players:
+                if player in self.latest: self.coalesced += 1
+                self.latest[player] = payload
+                mqtt_stats['messages'][player] = mqtt_stats['messages'].get(player, 0) + 1
+                mqtt_stats['last'][player] = now
+
+    def drain(self):
+        with self.lock:
+            if not self.latest: return
+            batch, self.latest = self.latest, {}
+        for player, payload in batch.items():
+            self.parsed += 1
+            try: sample = read_sample(json.loads(payload))
+            except ValueError: sample = None # 不是 JSON
+            if sample is None: mqtt_stats['errors'] += 1
+            else: update_score(player, *sample)
+
+mqtt_inbox = MqttInbox()
+
 def on_mqtt_message(client, userdata, msg):
-    try:
-        payload = json.loads(msg.payload.decode())
-        hr = payload.get('hr')
-        topic = msg.topic
-        
-        # 查找是谁的 Topic
-        for player, config in PLAYERS_CONFIG.items():
-            if config['type'] == 'mqtt' and config.get('topic') == topic:
-                update_score(player, hr)
-    except:
-        pass
+    players = topic_index.get(msg.topic)
+    if players is None: # 通配订阅下别人的 topic，直接丢弃
+        mqtt_stats['unrouted'] += 1
+        return
+    mqtt_inbox.put(players, msg.payload)
+
+def _mqtt_client():
+    # paho-mqtt 2.x 需要显式指定回调版本，1.x 没有这个参数
+    if hasattr(mqtt, 'CallbackAPIVersion'): return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    return mqtt.Client()
+
+def _subscriptions(index):
+    subscription = MQTT_SUBSCRIPTION or wildcard_subscription(list(index))
+    return [(subscription, 0)] if subscription else [(t, 0) for t in index]
+
+def _on_mqtt_connect(client, *args):
+    """ 断线重连后也会重新订阅；重新加载后可能一个 MQTT 玩家都没有，空列表 paho 会报错 """
+    if mqtt_subscriptions: client.subscribe(mqtt_subscriptions)
 
 def start_mqtt():
+    global topic_index, mqtt_client, mqtt_subscriptions
     # 扫描配置里有没有人用 MQTT
-    topics = [cfg['topic'] for cfg in PLAYERS_CONFIG.values() if cfg['type'] == 'mqtt']
-    if not topics:
+    topic_index = build_topic_index(PLAYERS_CONFIG)
+    if not topic_index:
         print("ℹ️ 当前配置无 MQTT 玩家，跳过 MQTT 连接")
-        return
+        return None
 
-    client = mqtt.Client()
+    mqtt_subscriptions = _subscriptions(topic_index)
+    client = _mqtt_client()
     client.on_message = on_mqtt_message
+    client.on_connect = _on_mqtt_connect
     try:
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        for t in topics:
-            client.subscribe(t)
-            print(f"📡 已订阅 MQTT 频道: {t}")
         client.loop_start() # 在后台线程运行
+        print(f"📡 已订阅 MQTT ({MQTT_BROKER}): {', '.join(t for t, _ in mqtt_subscriptions)} -> {len(topic_index)} 个玩家 topic")
     except Exception as e:
         print(f"MQTT 连接失败: {e}")
+    mqtt_client = client
+    return client
+
+def refresh_mqtt(index, subscriptions):
+    """ 玩家列表变化后：换上新的 topic 索引，订阅有变时先订新的再退旧的，连接不断开。
+    index / subscriptions 由调用方在切换 PLAYERS_CONFIG 之前算好 """
+    global topic_index, mqtt_subscriptions
+    if mqtt_client is None:
+        if index: start_mqtt()
+        return
+    topic_index = index # 整体替换，MQTT 线程不会看到改了一半的索引
+    if subscriptions == mqtt_subscriptions: return
+    stale = [t for t, _ in mqtt_subscriptions if (t, 0) not in subscriptions]
+    if subscriptions: mqtt_client.subscribe(subscriptions)
+    if stale: mqtt_client.unsubscribe(stale)
+    mqtt_subscriptions = subscriptions
+
+# --- 模块3: 推送接入 (玩家端主动上报，网关不用轮询) ---
+push_stats = {'requests': {}, 'samples': {}, 'last': {}, 'rejected': 0} # 玩家 -> 请求数 / 样本数 / 最近一次时间；认证失败数
+push_lock = threading.Lock()
+flush_wakeup = threading.Event() # 有推送到达时唤醒主循环
+ingest_server = None
+
+class IngestHandler(BaseHTTPRequestHandler):
+    """ POST /ingest/<玩家ID>，请求体 {"samples": [{"hr": 80, "ts": 1700000000.0}, ...]}。
+    一批里只有最新的样本会写入计分板；HTTP/1.1 长连接，每个连接一个线程 """
+    protocol_version = 'HTTP/1.1'
+    timeout = 120    # 空闲连接最多占用线程这么久
+    tokens = {}      # 玩家 -> 令牌
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        player = urllib.parse.unquote(path[len('/ingest/'):]) if path.startswith('/ingest/') else None
+        # 先认证、再检查长度，最后才读请求体：未认证或长度不对的请求一个字节也不读，直接断开
+        token = self.tokens.get(player)
+        if token is None or not hmac.compare_digest(self.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            with push_lock: push_stats['rejected'] += 1
+            self.close_connection = True # 请求体没有读取，连接不能再用
+            return self._reply(401)
+        try: length = int(self.headers.get('Content-Length') or 0)
+        except ValueError: length = -1
+        if length < 0 or length > INGEST_MAX_BODY:
+            self.close_connection = True
+            return self._reply(400 if length < 0 else 413)
+        body = self.rfile.read(length)
+        try:
+            data = json.loads(body)
+            samples = data['samples'] if 'samples' in data else [data]
+            if not isinstance(samples, list): raise ValueError
+        except (ValueError, TypeError, KeyError):
+            return self._reply(400)
+        valid = [sample for sample in map(read_sample, samples) if sample and sample[0]] # 格式不对的样本直接丢弃
+        latest = max(valid, key=lambda sample: sample[1] or 0, default=None)
+        with push_lock:
+            push_stats['requests'][player] = push_stats['requests'].get(player, 0) + 1
+            push_stats['samples'][player] = push_stats['samples'].get(player, 0) + len(samples)
+            push_stats['last'][player] = time.time()
+        if latest:
+            update_score(player, *latest)
+            flush_wakeup.set()
+        self._reply(204)
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        if self.close_connection: self.send_header('Connection', 'close')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+def push_tokens(players_config):
+    missing = [p for p, cfg in players_config.items() if cfg['type'] == 'push' and not cfg.get('token')]
+    if missing: print(f"⚠️ 这些推送玩家没有配置 token，已忽略: {', '.join(missing)}")
+    return {p: cfg['token'] for p, cfg in players_config.items() if cfg['type'] == 'push' and cfg.get('token')}
+
+def start_ingest_server(port=INGEST_PORT):
+    global ingest_server
+    IngestHandler.tokens = push_tokens(PLAYERS_CONFIG)
+    if not IngestHandler.tokens: return None
+    ingest_server = _start_http_server(port, IngestHandler, "推送接入")
+    if ingest_server: print(f"📥 推送接入: http://本机:{ingest_server.server_address[1]}/ingest/<玩家ID> ({len(IngestHandler.tokens)} 个玩家)")
+    return ingest_server
+
+def _start_http_server(port, handler, label):
+    if not port: return None
+    try:
+        server = ThreadingHTTPServer(('', port), handler)
+    except OSError as e:
+        print(f"{label}端口 {port} 启动失败: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- 模块4: Prometheus 指标 ---
+# _prom_value / _prom_labels / PromText 与 hr.py 中的一字不差 (两个脚本都要能单独拷走运行)，改时两边一起改
+def _prom_value(value):
+    if value == math.inf: return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _prom_labels(labels):
+    if not labels: return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+class PromText:
+    """拼接 Prometheus 文本格式 (0.0.4)"""
+    def __init__(self):
+        self.lines = []
+
+    def add(self, name, kind, help, samples):
+        """samples: [(标签 dict, 值)]"""
+        self.lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        self.lines += [f"{name}{_prom_labels(labels)} {_prom_value(value)}" for labels, value in samples]
+
+    def histogram(self, name, help, items):
+        """items: [(标签 dict, Histogram)]"""
+        self.lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        for labels, hist in items:
+            cumulative = 0
+            for bound, count in zip(hist.bounds + (math.inf,), list(hist.counts)):
+                cumulative += count
+                self.lines.append(f"{name}_bucket{_prom_labels({**labels, 'le': _prom_value(float(bound))})} {cumulative}")
+            self.lines.append(f"{name}_sum{_prom_labels(labels)} {_prom_value(hist.sum)}")
+            self.lines.append(f"{name}_count{_prom_labels(labels)} {cumulative}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+def render_metrics():
+    prom, now, mono = PromText(), time.time(), time.monotonic()
+    sources = list(http_sources)
+    p = lambda src: {"player": src.player}
+    prom.add("hrsync_poll_ticks_total", "counter", "HTTP poll rounds completed.", [({}, poller_stats['ticks'])])
+    prom.add("hrsync_poll_overruns_total", "counter", "Rounds that fell behind the poll schedule.", [({}, poller_stats['overruns'])])
+    prom.add("hrsync_last_tick_timestamp_seconds", "gauge", "Unix time of the last completed poll round.", [({}, poller_stats['last_tick'])])
+    prom.histogram("hrsync_tick_phase_duration_seconds", "Time spent per round collecting sources and writing the scoreboard.",
+                   [({"phase": "collect"}, poller_stats['collect_seconds']), ({"phase": "write"}, poller_stats['write_seconds'])])
+    kinds = [cfg['type'] for cfg in PLAYERS_CONFIG.values()]
+    prom.add("hrsync_players", "gauge", "Configured players by source type.", [({"type": t}, kinds.count(t)) for t in ('http', 'mqtt', 'push')])
+    prom.add("hrsync_registry_reloads_total", "counter", "Player list reloads applied.", [({}, player_registry.reloads)])
+    prom.add("hrsync_registry_errors_total", "counter", "Player list reloads rejected as invalid.", [({}, player_registry.errors)])
+    prom.add("hrsync_polls_total", "counter", "HTTP polls by player and result.",
+             [({**p(src), "result": "ok"}, src.poll_seconds.count - sum(src.failures.values())) for src in sources] +
+             [({**p(src), "result": reason}, n) for src in sources for reason, n in list(src.failures.items())])
+    prom.add("hrsync_poll_not_modified_total", "counter", "Polls answered with 304 (no new sample).", [(p(src), src.not_modified_total) for src in sources])
+    prom.add("hrsync_poll_missed_total", "counter", "Rounds skipped because the previous poll was still running.", [(p(src), src.missed_total) for src in sources])
+    prom.add("hrsync_last_success_age_seconds", "gauge", "Seconds since the last successful poll.", [(p(src), mono - src.last_ok) for src in sources if src.last_ok])
+    prom.add("hrsync_sample_age_seconds", "gauge", "Seconds since the newest heart rate sample was taken.",
+             [(p(src), now - src.last_ts) for src in sources if src.last_ts] +
+             [({"player": pl}, now - t) for pl, t in list(mqtt_stats['last'].items()) + list(push_stats['last'].items())])
+    prom.histogram("hrsync_poll_duration_seconds", "HTTP poll duration.", [(p(src), src.poll_seconds) for src in sources])
+    prom.add("hrsync_mqtt_messages_total", "counter", "MQTT heart rate messages by player.", [({"player": pl}, n) for pl, n in list(mqtt_stats['messages'].items())])
+    prom.add("hrsync_mqtt_errors_total", "counter", "MQTT messages that could not be parsed.", [({}, mqtt_stats['errors'])])
+    prom.add("hrsync_mqtt_unrouted_total", "counter", "MQTT messages on topics no player is configured for.", [({}, mqtt_stats['unrouted'])])
+    prom.add("hrsync_mqtt_coalesced_total", "counter", "MQTT messages superseded within a round and never parsed.", [({}, mqtt_inbox.coalesced)])
+    prom.add("hrsync_push_requests_total", "counter", "Accepted ingest requests by player.", [({"player": pl}, n) for pl, n in list(push_stats['requests'].items())])
+    prom.add("hrsync_push_samples_total", "counter", "Samples received through ingest by player.", [({"player": pl}, n) for pl, n in list(push_stats['samples'].items())])
+    prom.add("hrsync_push_rejected_total", "counter", "Ingest requests rejected for a bad player or token.", [({}, push_stats['rejected'])])
+    w = rcon_writer
+    prom.add("hrsync_rcon_connected", "gauge", "1 if the RCON session is open.", [({}, int(w.mcr is not None))])
+    prom.add("hrsync_rcon_connects_total", "counter", "RCON (re)connections.", [({}, w.connects_total)])
+    prom.add("hrsync_rcon_commands_total", "counter", "Scoreboard commands sent.", [({}, w.rtt_seconds.count)])
+    prom.add("hrsync_rcon_suppressed_total", "counter", "Updates skipped as duplicates or superseded.", [({}, w.suppressed_total)])
+    prom.add("hrsync_rcon_errors_total", "counter", "RCON command failures.", [({}, w.errors_total)])
+    prom.add("hrsync_rcon_deferred_total", "counter", "Updates pushed to the next round because the write budget ran out.", [({}, w.deferred_total)])
+    prom.histogram("hrsync_rcon_command_duration_seconds", "RCON command round trip.", [({}, w.rtt_seconds)])
+    prom.histogram("hrsync_sample_to_scoreboard_seconds", "Age of a sample when it reached the scoreboard.", [({}, w.sample_to_score_seconds)])
+    return prom.text()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # 抓取很频繁，不刷屏
+
+def start_metrics_server(port=METRICS_PORT):
+    server = _start_http_server(port, MetricsHandler, "指标")
+    if server: print(f"📈 Prometheus 指标: http://127.0.0.1:{server.server_address[1]}/metrics")
+    return server
+
+# --- 模块5: 玩家列表文件 (运行中修改自动生效) ---
+SOURCE_KEYS = {'http': 'source', 'mqtt': 'topic', 'push': 'token'} # 各类型必填的键
+
+def validate_players(data):
+    """ 整个文件要么全部有效、要么不用：返回 {玩家: 配置}，有问题时抛 ValueError """
+    if not isinstance(data, dict): raise ValueError("顶层应为 {玩家ID: 配置} 对象")
+    for player, cfg in data.items():
+        if not player or player.split() != [player]: raise ValueError(f"玩家 ID 不能为空或含空白: {player!r}") # 会拼进 RCON 指令
+        if not isinstance(cfg, dict) or cfg.get('type') not in SOURCE_KEYS: raise ValueError(f"{player}: type 应为 http / mqtt / push")
+        key = SOURCE_KEYS[cfg['type']]
+        if not cfg.get(key) or not isinstance(cfg[key], str): raise ValueError(f"{player}: {key} 应为非空字符串")
+    return data
+
+class PlayerRegistry:
+    """ 主循环每隔 RELOAD_CHECK_INTERVAL 秒 stat 一次文件，修改时间或大小变了就重新读取；
+    内容有误 (包括编辑器写到一半) 时继续用当前列表，等下一次修改 """
+    def __init__(self, path):
+        self.path = path
+        self.stamp = None
+        self.reloads = self.errors = 0
+
+    def check(self):
+        """ 文件有变化且内容有效时返回新的玩家配置，否则返回 None """
+        if not self.path: return None
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None # 文件被删除：保留当前列表
+        if stamp == self.stamp: return None
+        self.stamp = stamp
+        if stamp is None: return None
+        try:
+            with open(self.path, encoding='utf-8') as f: return validate_players(json.load(f))
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            print(f"⚠️ 玩家列表 {self.path} 无效，继续使用当前列表: {e}")
+            return None
+
+player_registry = PlayerRegistry(PLAYERS_FILE)
+
+def apply_players(config, poller):
+    """ 在主线程切换到新的玩家列表：没变的数据源原样保留，MQTT / 推送接入同步更新 """
+    global PLAYERS_CONFIG
+    # 会出错的部分 (topic 索引、订阅列表) 先算完，出错时还没有切换，继续用当前列表
+    try:
+        index = build_topic_index(config)
+        subscriptions = _subscriptions(index) if index else []
+    except (KeyError, TypeError, AttributeError) as e:
+        player_registry.errors += 1
+        print(f"⚠️ 玩家列表无法应用，继续使用当前列表: {e!r}")
+        return
+    old, PLAYERS_CONFIG = PLAYERS_CONFIG, config
+    added = [p for p in config if p not in old]
+    removed = [p for p in old if p not in config]
+    changed = [p for p in config if p in old and old[p] != config[p]]
+    set_http_sources(poller)
+    refresh_mqtt(index, subscriptions)
+    IngestHandler.tokens = push_tokens(config)
+    if IngestHandler.tokens and ingest_server is None: start_ingest_server()
+    rcon_writer.forget(removed)
+    player_registry.reloads += 1
+    print(f"🔄 玩家列表已更新: 新增 {len(added)} / 移除 {len(removed)} / 修改 {len(changed)}，共 {len(config)} 个玩家")
 
 # --- 主程序 ---
 if __name__ == "__main__":
     print("🚀 服务器心率同步网关已启动")
-    
-    # 1. 启动 MQTT (后台)
+    config = player_registry.check()
+    if config is not None:
+        PLAYERS_CONFIG = config
+        print(f"📋 从 {PLAYERS_FILE} 读取 {len(config)} 个玩家 (修改后自动重新加载)")
+
+    # 1. 启动 MQTT、推送接入和指标服务 (后台)
     start_mqtt()
+    start_ingest_server()
+    start_metrics_server()
     
-    # 2. 启动 HTTP 轮询 (主线程阻断运行)
+    # 2. 启动 HTTP 轮询 + RCON 写入 (主线程阻断运行)
     try:
         http_poller_loop()
     except KeyboardInterrupt:
-        print("停止运行")
\ No newline at end of file
+        print("停止运行")
+elif __name__ == WORKER_RUN_NAME: # ProcessPoller 的工作进程
+    poll_worker(*WORKER_ARGS)
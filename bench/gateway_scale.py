@@ -0,0 +1,151 @@
+"""网关规模测试：玩家数从 10 逐步加到 1000，测每一轮的耗时。
+
+一个网关实例从头跑到尾，玩家数通过改写玩家列表文件增加 (即热加载)，本地 HTTP 心率源替身
+运行在单独的进程里。每一档输出：
+  - 收集：从一轮开始到所有数据源返回 (上限为 POLL_DEADLINE)
+  - 写入：MQTT 合并解析 + RCON 写入计分板 (每轮最多 RCON_WRITE_BUDGET 秒，写不完的顺延到下一轮)
+  - 样本->计分板：心率源给出样本到写入计分板的时间
+  - 错过：上一轮的请求还没回来而跳过的次数；落后：整轮超过 POLL_INTERVAL 的次数
+  - 新连接：这一档新建的 TCP 连接数，应当等于新增的玩家数 (已有的源在重新加载时保持连接)
+  - CPU：网关 (含工作进程) / 心率源替身各占几个核，仅 Linux；替身和网关在同一台机器上抢 CPU，
+    核数少时收集耗时主要受 CPU 限制，多进程只有在核数够时才有收益
+
+用法:
+    python bench/gateway_scale.py --players 10 50 100 250 500 1000 --workers 0 4 --seconds 8
+"""
+import _thread
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import HRSourceStub, RconStub, load_gateway
+from web_load import cpu_seconds, percentile
+
+def serve_sources(conn, delay):
+    """子进程：HTTP 心率源替身，收到任意消息就回 (请求数, 连接数, CPU 秒数)"""
+    stub = HRSourceStub(delay)
+    conn.send(stub.port)
+    while True:
+        try: conn.recv()
+        except EOFError: return
+        conn.send((stub.requests, stub.connections, cpu_seconds(os.getpid())))
+
+class RecordingHistogram:
+    """替换网关里的直方图，同时保留每一个原始值"""
+    def __init__(self, hist):
+        self.hist, self.values = hist, []
+    def observe(self, value):
+        self.hist.observe(value)
+        self.values.append(value)
+
+def write_players(path, port, count):
+    players = {f"p{i}": {"type": "http", "source": f"http://127.0.0.1:{port}/p{i}"} for i in range(count)}
+    with open(path + ".tmp", "w", encoding="utf-8") as f: json.dump(players, f)
+    os.replace(path + ".tmp", path)
+
+def ms(values, p):
+    return round(percentile(values, p) * 1000, 1) if values else None
+
+def gateway_cpu(poller):
+    pids = [os.getpid()] + [proc.pid for proc, _ in getattr(poller, "workers", [])]
+    values = [cpu_seconds(pid) for pid in pids]
+    return None if None in values else sum(values)
+
+def cpu_share(t0, t1, seconds):
+    return round((t1 - t0) / seconds, 2) if t0 is not None and t1 is not None else None
+
+def run_mode(args, workers, port, stub_conn):
+    gw = load_gateway()
+    gw.STATS_INTERVAL = 0
+    gw.RELOAD_CHECK_INTERVAL = 0.2
+    gw.PLAYERS_CONFIG = {}
+    path = os.path.join(tempfile.mkdtemp(prefix="hr_scale_"), "players.json")
+    gw.player_registry = gw.PlayerRegistry(path)
+    poller = gw.make_poller(workers, args.threads)
+    rcon = RconStub()
+    gw.rcon_writer = gw.RconWriter("127.0.0.1", "bench", rcon.port)
+    collect = gw.poller_stats['collect_seconds'] = RecordingHistogram(gw.poller_stats['collect_seconds'])
+    write = gw.poller_stats['write_seconds'] = RecordingHistogram(gw.poller_stats['write_seconds'])
+    rows = []
+
+    def controller():
+        try:
+            for count in args.players:
+                stub_conn.send(None)
+                _, conns0, _ = stub_conn.recv()
+                write_players(path, port, count)
+                deadline = time.monotonic() + 10
+                while len(gw.http_sources) != count and time.monotonic() < deadline: time.sleep(0.05)
+                time.sleep(args.warmup) # 新源建连的那一轮不算
+                i0, overruns0 = len(collect.values), gw.poller_stats['overruns']
+                lat0, deferred0 = len(gw.rcon_writer.latencies), gw.rcon_writer.deferred_total
+                missed0 = sum(src.missed_total for src in gw.http_sources)
+                stub_conn.send(None)
+                stub_cpu0, gw_cpu0 = stub_conn.recv()[2], gateway_cpu(poller)
+                time.sleep(args.seconds)
+                c, w = collect.values[i0:], write.values[i0:len(collect.values)]
+                totals = [a + b for a, b in zip(c, w)]
+                stub_conn.send(None)
+                _, conns1, stub_cpu1 = stub_conn.recv()
+                rows.append({
+                    "players": count, "ticks": len(c),
+                    "collect_p50_ms": ms(c, 50), "collect_p99_ms": ms(c, 99),
+                    "write_p50_ms": ms(w, 50), "write_p99_ms": ms(w, 99),
+                    "tick_p50_ms": ms(totals, 50), "tick_p99_ms": ms(totals, 99),
+                    "sample_to_score_p50_ms": ms([v / 1000 for v in gw.rcon_writer.latencies[lat0:]], 50),
+                    "sample_to_score_p99_ms": ms([v / 1000 for v in gw.rcon_writer.latencies[lat0:]], 99),
+                    "deferred": gw.rcon_writer.deferred_total - deferred0,
+                    "missed": sum(src.missed_total for src in gw.http_sources) - missed0,
+                    "overruns": gw.poller_stats['overruns'] - overruns0,
+                    "new_connections": conns1 - conns0,
+                    "gateway_cpu": cpu_share(gw_cpu0, gateway_cpu(poller), args.seconds),
+                    "stub_cpu": cpu_share(stub_cpu0, stub_cpu1, args.seconds),
+                })
+        finally:
+            _thread.interrupt_main()
+
+    threading.Thread(target=controller, daemon=True).start()
+    try: gw.http_poller_loop(poller)
+    except KeyboardInterrupt: pass
+    if isinstance(poller, gw.ProcessPoller): poller.close()
+    rcon.close()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 50, 100, 250, 500, 1000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4], help="POLL_WORKERS，可给多个依次对比 (0 = 线程池)")
+    parser.add_argument("--threads", type=int, default=0, help="POLL_THREADS")
+    parser.add_argument("--delay", type=float, default=0.0, help="替身每个请求的处理时间 (秒)")
+    parser.add_argument("--seconds", type=float, default=8, help="每一档统计多少秒")
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    stub_conn, child = multiprocessing.Pipe()
+    stub = multiprocessing.Process(target=serve_sources, args=(child, args.delay), daemon=True)
+    stub.start()
+    port = stub_conn.recv()
+
+    results = {}
+    for workers in args.workers:
+        mode = f"{workers} 个工作进程" if workers else "线程池"
+        print(f"\n== {mode} (CPU 核数 {os.cpu_count()}) ==")
+        print(f"{'玩家':>6} {'轮数':>4} {'收集 p50/p99 ms':>18} {'写入 p50/p99 ms':>18} {'整轮 p50/p99 ms':>18} {'样本->计分板 p50/p99':>20} {'顺延':>6} {'错过':>6} {'落后':>4} {'新连接':>6} {'CPU 网关/替身':>14}")
+        rows = run_mode(args, workers, port, stub_conn)
+        for r in rows:
+            print(f"{r['players']:>6} {r['ticks']:>4} {r['collect_p50_ms']:>9}/{r['collect_p99_ms']:<8} {r['write_p50_ms']:>9}/{r['write_p99_ms']:<8} "
+                  f"{r['tick_p50_ms']:>9}/{r['tick_p99_ms']:<8} {r['sample_to_score_p50_ms']:>11}/{r['sample_to_score_p99_ms']:<8} {r['deferred']:>6} {r['missed']:>6} {r['overruns']:>4} {r['new_connections']:>6} {r['gateway_cpu']!s:>8}/{r['stub_cpu']!s:<6}")
+        results[str(workers)] = rows
+    stub.terminate()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump({"cpu_count": os.cpu_count(), "workers": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
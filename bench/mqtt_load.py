@@ -0,0 +1,143 @@
+"""MQTT 接入压测：本地 broker 替身 + 网关的 MQTT 路径 (索引路由、通配订阅、每轮合并解析)。
+
+三部分：
+  1. 进程内：直接调用 on_mqtt_message，对比旧的"解析 JSON + 遍历全部玩家"写法
+  2. 突发吞吐：经过本地 broker 尽快发送，测网关每秒能接收多少条
+  3. 稳态：每个玩家按 --rate 持续发送，网关主循环照常运行，统计合并比例、RCON 指令数和样本->计分板延迟
+
+用法:
+    python bench/mqtt_load.py --players 250 --rate 5 --seconds 10
+"""
+import _thread
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import MqttBrokerStub, RconStub, load_gateway, mqtt_packet, mqtt_publish
+from web_load import percentile
+
+TOPIC_PREFIX = "hr_bench"
+
+class FakeMessage:
+    __slots__ = ("topic", "payload")
+    def __init__(self, topic, payload):
+        self.topic, self.payload = topic, payload
+
+def legacy_on_message(gw, msg):
+    """改动前的写法：每条消息先解析 JSON，再遍历全部玩家找 topic 的主人"""
+    try:
+        payload = json.loads(msg.payload.decode())
+        for player, config in gw.PLAYERS_CONFIG.items():
+            if config['type'] == 'mqtt' and config.get('topic') == msg.topic:
+                gw.update_score(player, payload.get('hr'), payload.get('ts'))
+    except Exception:
+        pass
+
+def payload(i):
+    return json.dumps({"hr": 60 + i % 80, "ts": time.time()}).encode()
+
+def bench_inprocess(gw, players, per_player):
+    messages = [FakeMessage(f"{TOPIC_PREFIX}/p{i}", payload(i)) for i in range(players)] * per_player
+    results = {}
+    for name, handler in (("legacy", lambda m: legacy_on_message(gw, m)), ("indexed", lambda m: gw.on_mqtt_message(None, None, m))):
+        t0 = time.perf_counter()
+        for msg in messages: handler(msg)
+        gw.mqtt_inbox.drain()
+        elapsed = time.perf_counter() - t0
+        gw.rcon_writer.pending.clear()
+        results[name] = round(len(messages) / elapsed)
+    return results
+
+def publisher(port, players, rate, seconds, stop, noise):
+    """每个玩家每秒 rate 条；noise 个不属于任何玩家的 topic 作为干扰"""
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(mqtt_packet(0x10, b"\x00\x04MQTT\x04\x02\x00\x3c\x00\x03pub"))
+    sock.recv(4)
+    interval, n = 1.0 / rate, 0
+    next_t = time.monotonic()
+    while not stop.is_set():
+        batch = b"".join(mqtt_publish(f"{TOPIC_PREFIX}/p{i}", payload(n + i)) for i in range(players))
+        batch += b"".join(mqtt_publish(f"{TOPIC_PREFIX}/other{i}", b"{}") for i in range(noise))
+        sock.sendall(batch)
+        n += 1
+        next_t += interval
+        time.sleep(max(0.0, next_t - time.monotonic()))
+    sock.close()
+
+def received(gw):
+    return sum(gw.mqtt_stats['messages'].values())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=250)
+    parser.add_argument("--rate", type=float, default=5, help="每个玩家每秒消息数 (稳态部分)")
+    parser.add_argument("--burst", type=int, default=40, help="突发部分每个玩家发送的条数")
+    parser.add_argument("--noise", type=int, default=20, help="同前缀下不属于任何玩家的 topic 数")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    broker, rcon = MqttBrokerStub(), RconStub()
+    gw = load_gateway()
+    gw.PLAYERS_CONFIG = {f"p{i}": {"type": "mqtt", "topic": f"{TOPIC_PREFIX}/p{i}"} for i in range(args.players)}
+    gw.MQTT_BROKER, gw.MQTT_PORT = "127.0.0.1", broker.port
+    gw.STATS_INTERVAL = 0
+    gw.rcon_writer = gw.RconWriter("127.0.0.1", "bench", rcon.port)
+    client = gw.start_mqtt()
+
+    # 1. 进程内对比
+    inproc = bench_inprocess(gw, args.players, 20)
+    print(f"进程内: 旧写法 {inproc['legacy']:,} 条/秒, 索引 + 合并 {inproc['indexed']:,} 条/秒")
+    gw.mqtt_stats['messages'].clear()
+
+    deadline = time.monotonic() + 5
+    while not broker.subscribers and time.monotonic() < deadline: time.sleep(0.05)
+
+    # 2. 突发吞吐：一次性发出 players * burst 条，等网关全部收到
+    total = args.players * args.burst
+    packets = b"".join(mqtt_publish(f"{TOPIC_PREFIX}/p{i}", payload(i)) for _ in range(args.burst) for i in range(args.players))
+    sock = socket.create_connection(("127.0.0.1", broker.port))
+    sock.sendall(mqtt_packet(0x10, b"\x00\x04MQTT\x04\x02\x00\x3c\x00\x05burst"))
+    sock.recv(4)
+    t0 = time.perf_counter()
+    sock.sendall(packets)
+    deadline = time.monotonic() + 30
+    while received(gw) < total and time.monotonic() < deadline: time.sleep(0.001)
+    elapsed = time.perf_counter() - t0
+    sock.close()
+    burst_rate = round(received(gw) / elapsed)
+    print(f"突发: {received(gw):,}/{total:,} 条, {elapsed:.2f} 秒, {burst_rate:,} 条/秒 (broker -> 网关)")
+    t0 = time.perf_counter()
+    gw.mqtt_inbox.drain()
+    print(f"      合并后只解析 {len(gw.rcon_writer.pending)} 条, 耗时 {(time.perf_counter() - t0) * 1000:.1f} ms")
+    gw.rcon_writer.pending.clear()
+
+    # 3. 稳态：网关主循环 (主线程) + 持续发送
+    gw.mqtt_stats['messages'].clear()
+    coalesced0, parsed0 = gw.mqtt_inbox.coalesced, gw.mqtt_inbox.parsed
+    stop = threading.Event()
+    pub = threading.Thread(target=publisher, args=(broker.port, args.players, args.rate, args.seconds, stop, args.noise), daemon=True)
+    pub.start()
+    threading.Timer(args.seconds, _thread.interrupt_main).start()
+    try: gw.http_poller_loop()
+    except KeyboardInterrupt: pass
+    stop.set()
+    pub.join(timeout=2)
+    client.loop_stop()
+
+    lat = sorted(gw.rcon_writer.latencies)
+    got = received(gw)
+    print(f"稳态: {args.players} 个玩家 x {args.rate:g} 条/秒, {args.seconds:g} 秒")
+    print(f"      收到 {got:,} 条 ({got / args.seconds:,.0f} 条/秒), 无主 topic 丢弃 {gw.mqtt_stats['unrouted']:,} 条")
+    print(f"      解析 {gw.mqtt_inbox.parsed - parsed0:,} 条, 合并掉 {gw.mqtt_inbox.coalesced - coalesced0:,} 条, RCON 指令 {len(rcon.commands):,} 条")
+    if lat: print(f"      样本->计分板 p50 {lat[len(lat) // 2]:.0f} ms / p99 {percentile(lat, 99):.0f} ms")
+    broker.close()
+    rcon.close()
+
+if __name__ == "__main__":
+    main()
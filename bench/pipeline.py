@@ -0,0 +1,108 @@
+"""整条链路的延迟测试 (不需要蓝牙)：模拟心率带 -> hr.py -> SSE 观看端 / Minecraft 网关 -> RCON。
+
+启动一个无界面 hr.py 连接模拟设备，挂上若干 SSE 观看端，同时在本进程内运行网关
+(HTTP 轮询本机 hr.py，写入本地 RCON 替身)，最后输出每个环节的 p50 / p99 延迟。
+
+用法:
+    python bench/pipeline.py --rate 4 --jitter 0.05 --drop 0.02 --seconds 20
+    python bench/pipeline.py --replay sessions/hr_xxx.bin --speed 5
+"""
+import _thread
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import ROOT, RconStub, load_gateway
+from web_load import free_port, percentile
+
+def summarize(values):
+    if not values: return None
+    values = sorted(values)
+    return {"count": len(values), "p50_ms": round(values[len(values) // 2], 3), "p99_ms": round(percentile(values, 99), 3), "max_ms": round(values[-1], 3)}
+
+async def viewers(port, count, latencies, stop):
+    async def one():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /api/hr/stream HTTP/1.1\r\nHost: bench\r\n\r\n")
+        await reader.readuntil(b"\r\n\r\n")
+        first = True
+        while not stop.is_set():
+            chunk = await reader.readuntil(b"\n\n")
+            if not chunk.startswith(b"id:"): continue
+            payload = json.loads(chunk.split(b"data: ", 1)[1])
+            if payload.get("hr") and not first: latencies.append((time.time() - payload["ts"]) * 1000)
+            first = False
+        writer.close()
+    tasks = [asyncio.create_task(one()) for _ in range(count)]
+    while not stop.is_set(): await asyncio.sleep(0.1)
+    for task in tasks: task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=4, help="模拟通知频率 (次/秒)")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--drop", type=float, default=0.0)
+    parser.add_argument("--disconnect", type=float, default=0.0, help="平均断线间隔 (秒)，0 = 不断线")
+    parser.add_argument("--replay", help="回放会话文件而不是随机生成")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速")
+    parser.add_argument("--viewers", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.replay:
+        device = "sim:replay?" + urllib.parse.urlencode({"file": os.path.abspath(args.replay), "speed": args.speed, "loop": 1})
+    else:
+        device = "sim:1?" + urllib.parse.urlencode({"rate": args.rate, "jitter": args.jitter, "drop": args.drop, "disconnect": args.disconnect})
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "hr.py"), "--headless", "--no-record", "--port", str(port), "--device", device],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rcon = RconStub()
+    try:
+        time.sleep(1.0) # 等待服务端启动、模拟设备连接
+
+        sse_latencies, stop = [], threading.Event()
+        viewer_thread = threading.Thread(target=lambda: asyncio.run(viewers(port, args.viewers, sse_latencies, stop)), daemon=True)
+        viewer_thread.start()
+
+        # 网关在主线程运行 (mcrcon 依赖 SIGALRM)，到时间后用 KeyboardInterrupt 打断
+        gw = load_gateway()
+        gw.PLAYERS_CONFIG = {"bench_player": {"type": "http", "source": f"http://127.0.0.1:{port}/api/hr"}}
+        gw.STATS_INTERVAL = 0
+        gw.rcon_writer = gw.RconWriter("127.0.0.1", "bench", rcon.port)
+        threading.Timer(args.seconds, _thread.interrupt_main).start()
+        try: gw.http_poller_loop()
+        except KeyboardInterrupt: pass
+        stop.set()
+        viewer_thread.join(timeout=2)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/latency") as resp: hops = json.load(resp)
+    finally:
+        server.terminate()
+        server.wait()
+        rcon.close()
+
+    hops["sse_client"] = summarize(sse_latencies)
+    hops["scoreboard"] = summarize(gw.rcon_writer.latencies)
+    result = {"device": device, "viewers": args.viewers, "seconds": args.seconds, "rcon_commands": len(rcon.commands), "hops": hops}
+
+    names = {"parse": "BLE 回调处理", "sse": "接收 -> SSE 写出", "hud": "接收 -> HUD 重绘", "sse_client": "样本 -> 观看端收到", "scoreboard": "样本 -> 计分板"}
+    for hop, stats in hops.items():
+        label = names.get(hop, hop)
+        if stats: print(f"{label:<16} n={stats['count']:<6} p50 {stats['p50_ms']:8.2f} ms   p99 {stats['p99_ms']:8.2f} ms")
+        else: print(f"{label:<16} (无数据)")
+    print(f"RCON 指令数: {len(rcon.commands)}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
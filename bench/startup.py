@@ -0,0 +1,61 @@
+"""冷启动耗时测量：反复启动 hr.py (或打包好的 exe) 并与预算比较，超出预算时退出码为 1。
+
+用法:
+    python bench/startup.py                         # 脚本版，无界面模式 (BLE + Web)
+    python bench/startup.py --mode gui              # 脚本版，GUI 模式 (需要显示器)
+    python bench/startup.py --exe dist/HeartRateMonitor_v4.1.exe --mode gui
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 预算 (秒，取中位数比较)。exe 含 PyInstaller 单文件解压，明显更慢
+BUDGETS = {
+    ("script", "headless"): 0.6,
+    ("script", "gui"): 2.0,
+    ("exe", "headless"): 3.0,
+    ("exe", "gui"): 5.0,
+}
+
+def measure(cmd, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace")
+        times.append(time.perf_counter() - t0)
+        if proc.returncode != 0:
+            print(proc.stdout)
+            raise SystemExit(f"启动失败 (退出码 {proc.returncode}): {' '.join(cmd)}")
+    return times, proc.stdout.strip()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["headless", "gui"], default="headless")
+    parser.add_argument("--exe", help="测量 PyInstaller 打包后的程序，而不是 python hr.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, help="覆盖默认预算 (秒)")
+    args = parser.parse_args()
+
+    kind = "exe" if args.exe else "script"
+    cmd = [args.exe] if args.exe else [sys.executable, os.path.join(ROOT, "hr.py")]
+    cmd += ["--startup-check", "--no-record"]
+    if args.mode == "headless": cmd += ["--headless", "--port", "0"]
+
+    times, last_output = measure(cmd, args.runs)
+    budget = args.budget or BUDGETS[(kind, args.mode)]
+    median = statistics.median(times)
+    print(f"{kind}/{args.mode}: 中位数 {median * 1000:.0f} ms, 最快 {min(times) * 1000:.0f} ms, 最慢 {max(times) * 1000:.0f} ms (预算 {budget * 1000:.0f} ms, {args.runs} 次)")
+    report = [line for line in last_output.splitlines() if "启动耗时" in line]
+    if report: print(f"  进程内统计: {report[-1].strip()}")
+    if median > budget:
+        print("❌ 超出启动耗时预算")
+        sys.exit(1)
+    print("✅ 在预算内")
+
+if __name__ == "__main__":
+    main()
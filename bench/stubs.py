@@ -0,0 +1,191 @@
+"""压测用的本地替身：RCON 服务器、HTTP 心率源、MQTT broker。只用标准库，全部监听 127.0.0.1。"""
+import http.server
+import importlib.util
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_gateway():
+    """HR-Sync-2-mc.py 文件名带连字符，不能直接 import。
+    压测自己设置 PLAYERS_CONFIG，不读取真实的玩家列表文件"""
+    spec = importlib.util.spec_from_file_location("hr_sync_gateway", os.path.join(ROOT, "HR-Sync-2-mc.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.player_registry.path = None
+    return module
+
+class RconStub:
+    """实现 Minecraft RCON 协议的最小服务器：任何密码都能登录，记录收到的指令"""
+    def __init__(self, delay=0.0):
+        self.delay = delay # 模拟服务器处理每条指令的耗时 (秒)
+        self.commands = []
+        self.connections = 0
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try: conn, _ = self.sock.accept()
+            except OSError: return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        f = conn.makefile("rb")
+        with conn:
+            while True:
+                head = f.read(4)
+                if len(head) < 4: return
+                (length,) = struct.unpack("<i", head)
+                payload = f.read(length)
+                request_id, kind = struct.unpack("<ii", payload[:8])
+                if kind == 2:
+                    self.commands.append((time.time(), payload[8:-2].decode("utf-8")))
+                    if self.delay: time.sleep(self.delay)
+                out = struct.pack("<ii", request_id, 0) + b"\x00\x00"
+                conn.sendall(struct.pack("<i", len(out)) + out)
+
+    def close(self):
+        self.sock.close()
+
+class HRSourceStub:
+    """模拟玩家电脑上的 /api/hr：每个路径 /p<N> 返回一个缓慢变化的心率，带 ts"""
+    def __init__(self, delay=0.0):
+        stub = self
+        self.delay = delay
+        self.requests = 0
+        self.connections = 0
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def setup(self):
+                stub.connections += 1
+                super().setup()
+            def do_GET(self):
+                stub.requests += 1
+                if stub.delay: time.sleep(stub.delay)
+                now = time.time()
+                body = json.dumps({"hr": 60 + int(now) % 60, "ts": now}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args): pass
+
+        class Server(http.server.ThreadingHTTPServer):
+            request_queue_size = 1024 # 几百个源同时建连，默认的 backlog (5) 会导致连接超时
+            daemon_threads = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, player):
+        return f"http://127.0.0.1:{self.port}/{player}"
+
+    def close(self):
+        self.server.shutdown()
+
+def topic_matches(pattern, topic):
+    """MQTT 订阅匹配：+ 匹配一层，# 匹配其后所有层 (含父层本身)"""
+    p, t = pattern.split("/"), topic.split("/")
+    for i, level in enumerate(p):
+        if level == "#": return True
+        if i >= len(t) or (level != "+" and level != t[i]): return False
+    return len(p) == len(t)
+
+def mqtt_packet(kind, body):
+    """固定头 + 变长的剩余长度"""
+    head, n = bytearray([kind]), len(body)
+    while True:
+        byte, n = n % 128, n // 128
+        head.append(byte | (0x80 if n else 0))
+        if not n: return bytes(head) + body
+
+def mqtt_publish(topic, payload):
+    topic = topic.encode()
+    return mqtt_packet(0x30, struct.pack(">H", len(topic)) + topic + payload)
+
+class MqttBrokerStub:
+    """MQTT 3.1.1 的最小 broker (只支持 QoS 0)：CONNECT / SUBSCRIBE / PUBLISH 转发 / PING。
+    用来代替公共 broker 测试网关的订阅、路由和吞吐"""
+    def __init__(self):
+        self.subscribers = [] # (连接, 发送锁, [订阅])
+        self.lock = threading.Lock()
+        self.published = 0
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try: conn, _ = self.sock.accept()
+            except OSError: return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _read_packet(f):
+        first = f.read(1)
+        if not first: return None, None
+        length, shift = 0, 0
+        while True:
+            byte = f.read(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80: break
+        return first[0], f.read(length)
+
+    def _serve(self, conn):
+        f = conn.makefile("rb")
+        entry = (conn, threading.Lock(), [])
+        def send(data):
+            with entry[1]: conn.sendall(data)
+        try:
+            while True:
+                kind, body = self._read_packet(f)
+                if kind is None: return
+                kind_type = kind >> 4
+                if kind_type == 1: send(b"\x20\x02\x00\x00") # CONNACK
+                elif kind_type == 8: # SUBSCRIBE
+                    packet_id, pos, granted = body[:2], 2, b""
+                    while pos < len(body):
+                        (n,) = struct.unpack_from(">H", body, pos)
+                        entry[2].append(body[pos + 2:pos + 2 + n].decode())
+                        pos += 2 + n + 1
+                        granted += b"\x00"
+                    with self.lock:
+                        if entry not in self.subscribers: self.subscribers.append(entry)
+                    send(mqtt_packet(0x90, packet_id + granted))
+                elif kind_type == 3: # PUBLISH (QoS 0)
+                    (n,) = struct.unpack_from(">H", body, 0)
+                    topic = body[2:2 + n].decode()
+                    self.published += 1
+                    packet = mqtt_packet(0x30, body)
+                    for sub_conn, sub_lock, patterns in list(self.subscribers):
+                        if any(topic_matches(p, topic) for p in patterns):
+                            with sub_lock: sub_conn.sendall(packet)
+                elif kind_type == 12: send(b"\xd0\x00") # PINGRESP
+                elif kind_type == 14: return # DISCONNECT
+        except (OSError, IndexError):
+            pass
+        finally:
+            with self.lock:
+                if entry in self.subscribers: self.subscribers.remove(entry)
+            conn.close()
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,211 @@
+"""基准测试套件：一次跑完热点路径，结果存成 JSON，改动前后各跑一次即可对比。
+
+  parse   BLE 通知解析 (parse_hr_measurement) 与完整回调 (DeviceSession._handle_hr_data) 的吞吐
+  serve   无界面 hr.py + 模拟设备 + 若干 SSE 观看端，/api/hr 的 req/s 与延迟分位数
+  sync    网关每一轮的耗时 (本地 HTTP 心率源替身 + RCON 替身)，以及 update_score 的开销
+  render  HUD update_hr_display 的耗时 (需要显示器，没有时跳过)
+
+全部只用本机回环，不需要网络和蓝牙。
+
+用法:
+    python bench/suite.py                                 # 全部，结果写入 bench/results/
+    python bench/suite.py --only parse sync --quick
+    python bench/suite.py --compare bench/results/a.json bench/results/b.json
+"""
+import _thread
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gateway_scale import RecordingHistogram
+from stubs import ROOT, HRSourceStub, RconStub, load_gateway
+from web_load import free_port, percentile
+import web_load
+
+sys.path.insert(0, ROOT)
+
+def timed_loop(fn, items, repeat):
+    """对 items 逐个调用 fn，重复 repeat 次取最快的一次，返回每次调用的纳秒数"""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for item in items: fn(item)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items) * 1e9
+
+def dist_ms(values):
+    if not values: return None
+    values = sorted(values)
+    return {"count": len(values), "p50_ms": round(values[len(values) // 2] * 1000, 3), "p99_ms": round(percentile(values, 99) * 1000, 3), "max_ms": round(values[-1] * 1000, 3)}
+
+def hr_payloads(n, rng):
+    """两种常见格式各一半：8 位心率；16 位心率 + 能量 + 两个 RR 间期"""
+    out = []
+    for i in range(n):
+        bpm = rng.randint(55, 180)
+        if i % 2: out.append(bytes([0x00, bpm]))
+        else: out.append(struct.pack("<BHHHH", 0x19, bpm, i % 1000, rng.randint(300, 1100), rng.randint(300, 1100)))
+    return out
+
+def bench_parse(args):
+    import hr
+    hr.RECORD_ENABLED = False
+    payloads = hr_payloads(args.parse_n, random.Random(0))
+    session = hr.DeviceSession(hr.hub, "sim:bench", "bench") # 不连接：直接调用回调，样本照常发布到总线 (只有 Hub 的主设备推送在订阅)
+    session.connected = True
+    parse_ns = timed_loop(hr.parse_hr_measurement, payloads, args.repeat)
+    handle_ns = timed_loop(lambda data: session._handle_hr_data(None, data), payloads, args.repeat)
+    return {
+        "payloads": len(payloads), "repeat": args.repeat,
+        "parse_ns": round(parse_ns), "parse_per_s": round(1e9 / parse_ns),
+        "handle_ns": round(handle_ns), "handle_per_s": round(1e9 / handle_ns),
+    }
+
+def bench_serve(args):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(ROOT, "hr.py"), "--headless", "--no-record", "--no-auto-connect", "--port", str(port), "--device", "sim:1?rate=4&jitter=0"]
+    server = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    load = argparse.Namespace(viewers=args.viewers, pollers=args.pollers, requests=args.requests, path="/api/hr", idle=1.0)
+    try:
+        result = asyncio.run(web_load.run(load, port, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+    return {"viewers": args.viewers, "pollers": args.pollers, **{k: round(v, 3) if isinstance(v, float) else v for k, v in result.items() if k != "viewers"}}
+
+def bench_sync(args):
+    gw = load_gateway()
+    sources, rcon = HRSourceStub(), RconStub()
+    try:
+        players = [f"p{i}" for i in range(args.players)]
+        gw.PLAYERS_CONFIG = {p: {"type": "http", "source": sources.url(p)} for p in players}
+        gw.STATS_INTERVAL = 0
+        gw.rcon_writer = gw.RconWriter("127.0.0.1", "bench", rcon.port)
+
+        # update_score 只是登记最新值；单独测它，轮询循环里的耗时主要是 HTTP 与 RCON
+        items = [(p, 60 + i % 100, time.time()) for i, p in enumerate(players * (args.parse_n // max(1, len(players))))]
+        stage_ns = timed_loop(lambda item: gw.update_score(*item), items, args.repeat)
+        gw.rcon_writer.pending.clear()
+        gw.rcon_writer.reset_stats()
+
+        collect = gw.poller_stats['collect_seconds'] = RecordingHistogram(gw.poller_stats['collect_seconds'])
+        write = gw.poller_stats['write_seconds'] = RecordingHistogram(gw.poller_stats['write_seconds'])
+        threading.Timer(args.seconds, _thread.interrupt_main).start()
+        try: gw.http_poller_loop(gw.make_poller(0))
+        except KeyboardInterrupt: pass
+        rounds = [a + b for a, b in zip(collect.values, write.values)]
+        return {
+            "players": args.players, "seconds": args.seconds,
+            "update_score_ns": round(stage_ns),
+            "round": dist_ms(rounds), "collect": dist_ms(collect.values), "write": dist_ms(write.values),
+            "sample_to_scoreboard": dist_ms([v / 1000 for v in gw.rcon_writer.latencies]),
+            "rcon_commands": len(rcon.commands), "overruns": gw.poller_stats['overruns'],
+        }
+    finally:
+        sources.close()
+        rcon.close()
+
+def bench_render(args):
+    if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        return {"skipped": "没有显示器 (DISPLAY 未设置)"}
+    try:
+        import customtkinter as ctk
+        import hr_gui
+        root = ctk.CTk()
+        root.withdraw()
+        widget = hr_gui.HRWidget(root)
+    except Exception as e: # 没装 customtkinter、无法连接显示器等
+        return {"skipped": f"{type(e).__name__}: {e}"}
+    widget.deiconify()
+    rng = random.Random(0)
+    # 真实数据大多是相邻样本心率不变或只差 1 bpm
+    values, bpm = [], 80
+    for _ in range(args.render_n):
+        bpm = max(50, min(190, bpm + rng.choice((-1, 0, 0, 1))))
+        values.append((bpm, rng.uniform(20, 80)))
+    calls, frames = [], []
+    for bpm, hrv in values:
+        t0 = time.perf_counter()
+        widget.update_hr_display(bpm, "", 48, hrv)
+        t1 = time.perf_counter()
+        root.update_idletasks() # 把重绘真正画出来
+        frames.append(time.perf_counter() - t0)
+        calls.append(t1 - t0)
+    result = {"updates": widget.updates, "redraws": widget.redraws, "configures": widget.configures,
+              "update_call": dist_ms(calls), "update_and_draw": dist_ms(frames)}
+    root.destroy()
+    return result
+
+BENCHES = {"parse": bench_parse, "serve": bench_serve, "sync": bench_sync, "render": bench_render}
+
+def git_commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+def flatten(data, prefix=""):
+    out = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict): out.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool): out[name] = value
+    return out
+
+def compare(path_a, path_b):
+    with open(path_a, encoding="utf-8") as f: a = json.load(f)
+    with open(path_b, encoding="utf-8") as f: b = json.load(f)
+    print(f"A: {a['meta'].get('commit')} {a['meta']['time']}   B: {b['meta'].get('commit')} {b['meta']['time']}")
+    fa, fb = flatten(a["results"]), flatten(b["results"])
+    width = max(map(len, fa.keys() | fb.keys()), default=10)
+    for name in sorted(fa.keys() & fb.keys()):
+        va, vb = fa[name], fb[name]
+        change = f"{(vb - va) / va * 100:+.1f}%" if va else ""
+        print(f"{name:<{width}} {va:>14,.3f} {vb:>14,.3f} {change:>9}")
+    only = sorted(fa.keys() ^ fb.keys())
+    if only: print(f"只在一边出现: {', '.join(only)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHES), help="只运行这些测试")
+    parser.add_argument("--quick", action="store_true", help="缩小规模，用于快速检查")
+    parser.add_argument("--out", help="结果文件 (默认 bench/results/<时间>-<提交>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("A", "B"), help="对比两次结果，不运行测试")
+    parser.add_argument("--repeat", type=int, default=5, help="微基准重复次数 (取最快)")
+    parser.add_argument("--parse-n", type=int, default=100000, help="parse / update_score 每次循环的调用数")
+    parser.add_argument("--viewers", type=int, default=200)
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=300, help="每个轮询连接的请求数")
+    parser.add_argument("--players", type=int, default=50, help="sync 的 HTTP 玩家数")
+    parser.add_argument("--seconds", type=float, default=15, help="sync 运行秒数")
+    parser.add_argument("--render-n", type=int, default=2000)
+    args = parser.parse_args()
+    if args.compare: return compare(*args.compare)
+    if args.quick:
+        args.repeat, args.parse_n, args.viewers, args.pollers, args.requests, args.seconds, args.render_n = 3, 20000, 50, 10, 100, 5, 300
+
+    meta = {"time": datetime.datetime.now().isoformat(timespec="seconds"), "commit": git_commit(), "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count(), "args": vars(args)}
+    results = {}
+    for name in args.only or BENCHES:
+        print(f"▶ {name} ...")
+        t0 = time.perf_counter()
+        results[name] = BENCHES[name](args)
+        print(f"  {json.dumps(results[name], ensure_ascii=False)} ({time.perf_counter() - t0:.1f} 秒)")
+
+    out = args.out or os.path.join(ROOT, "bench", "results", f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{meta['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f: json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {out}")
+
+if __name__ == "__main__":
+    main()
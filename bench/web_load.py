@@ -0,0 +1,133 @@
+"""Web 服务压力测试：启动一个无界面的 hr.py，挂上几百个 SSE 观看端，
+同时用 keep-alive 连接轮询 /api/hr，统计吞吐、延迟分位数和服务端 CPU 占用。
+
+用法:
+    python bench/web_load.py --viewers 500 --pollers 50 --requests 200
+CPU 统计读取 /proc，仅 Linux 可用；其他系统只输出延迟与吞吐。
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def cpu_seconds(pid):
+    """进程累计 CPU 时间 (用户 + 内核)，无法读取时返回 None"""
+    try:
+        with open(f"/proc/{pid}/stat") as f: fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+async def wait_ready(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, w = await asyncio.open_connection("127.0.0.1", port)
+            w.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise SystemExit("服务端未能启动")
+
+async def viewer(port, connected, events):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /api/hr/stream HTTP/1.1\r\nHost: bench\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    connected.append(1)
+    try:
+        while True:
+            chunk = await reader.readuntil(b"\n\n")
+            if chunk.startswith(b"id:"): events.append(time.perf_counter())
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+async def poller(port, count, latencies, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    request = f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+    for _ in range(count):
+        t0 = time.perf_counter()
+        writer.write(request)
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - t0)
+    writer.close()
+
+async def run(args, port, pid):
+    await wait_ready(port)
+    connected, events = [], []
+    viewers = [asyncio.create_task(viewer(port, connected, events)) for _ in range(args.viewers)]
+    while len(connected) < args.viewers: await asyncio.sleep(0.05)
+    print(f"{args.viewers} 个 SSE 观看端已连接")
+
+    cpu0, t0 = cpu_seconds(pid), time.perf_counter()
+    latencies = []
+    await asyncio.gather(*(poller(port, args.requests, latencies, args.path) for _ in range(args.pollers)))
+    elapsed = time.perf_counter() - t0
+    cpu1 = cpu_seconds(pid)
+
+    idle_cpu0 = cpu_seconds(pid)
+    await asyncio.sleep(args.idle)
+    idle_cpu1 = cpu_seconds(pid)
+
+    for task in viewers: task.cancel()
+    await asyncio.gather(*viewers, return_exceptions=True)
+
+    result = {
+        "viewers": args.viewers,
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "sse_events": len(events),
+    }
+    if cpu0 is not None:
+        result["cpu_busy"] = (cpu1 - cpu0) / elapsed
+        result["cpu_idle_with_viewers"] = (idle_cpu1 - idle_cpu0) / args.idle
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", type=int, default=300, help="同时挂着的 SSE 观看端数量")
+    parser.add_argument("--pollers", type=int, default=50, help="并发轮询连接数")
+    parser.add_argument("--requests", type=int, default=200, help="每个轮询连接发出的请求数")
+    parser.add_argument("--path", default="/api/hr")
+    parser.add_argument("--idle", type=float, default=3.0, help="压测结束后观察空闲 CPU 的秒数")
+    parser.add_argument("--device", action="append", default=[], help="传给 hr.py 的设备地址")
+    args = parser.parse_args()
+
+    port = free_port()
+    cmd = [sys.executable, os.path.join(ROOT, "hr.py"), "--headless", "--no-record", "--port", str(port)]
+    for d in args.device: cmd += ["--device", d]
+    server = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        result = asyncio.run(run(args, port, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"请求 {result['requests']} 次: {result['rps']:.0f} req/s, p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, 最慢 {result['max_ms']:.2f} ms")
+    if "cpu_busy" in result:
+        print(f"服务端 CPU: 压测期间 {result['cpu_busy'] * 100:.0f}% 单核, 仅挂 {args.viewers} 个观看端时 {result['cpu_idle_with_viewers'] * 100:.1f}%")
+    print(f"SSE 事件: {result['sse_events']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,1297 @@
-import customtkinter as ctk
 import asyncio
 import threading
 import struct
 import sys
+import os
+import json
+import math
+import time
+import mmap
+import bisect
+import itertools
+from array import array
+from collections import deque
 import socket
-import logging
-from flask import Flask, jsonify, render_template_string
-from bleak import BleakClient, BleakScanner
+import gzip
+import hashlib
+import argparse
+import random
+import urllib.parse
 
-# --- 1. 设置日志级别 ---
-log = logging.getLogger('werkzeug')
-log.setLevel(logging.ERROR)
+_T_START = time.perf_counter() # 启动耗时统计的起点
+
+# --- 1. 依赖按需加载 ---
+# customtkinter / bleak 都比较重：界面只在 GUI 模式导入 (hr_gui.py)，
+# bleak 只在第一次扫描或连接时导入；Web 服务只用标准库 asyncio。
 
 # --- 2. BLE 常量 ---
 HR_SERVICE_UUID = "0000180d-0000-1000-8000-00805f9b34fb"
 HR_CHAR_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
 
-# --- 3. 全局状态 ---
-hr_value = 0
-current_device_address = None
-ble_client = None
-is_scanning = False
-is_connected = False
+# --- 3. 连接参数 ---
+RECONNECT_DELAY = 1.0      # 秒，断线后第一次重连前的等待 (可按设备单独设置)，连续失败时指数增长
+RECONNECT_MAX_DELAY = 30.0 # 退避上限
+SCAN_TIMEOUT = 5.0
+SCAN_SETTLE = 1.0          # 发现第一个心率设备后再多扫这么久 (收集附近的其他设备) 就提前结束
+HR_NAME_HINTS = ("iqoo", "watch") # 广播里不带心率服务 UUID 的手表按名称识别
+DEVICE_CACHE = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "devices.json")
+DEVICE_CACHE_MAX = 10
+
+def device_key(address):
+    """设备 ID：去掉分隔符的大写地址，用于 URL 和会话文件名 (模拟设备忽略 ? 之后的参数)"""
+    return address.split("?", 1)[0].replace(":", "").replace("-", "").upper()
+
+def backoff_delay(base, failures):
+    """带抖动的指数退避：base * 2^failures (有上限)，实际取其一半到全部之间的随机值，多个设备不会同时重试"""
+    delay = min(RECONNECT_MAX_DELAY, base * 2 ** min(failures, 16))
+    return random.uniform(delay / 2, delay)
+
+# --- 3.0 已知设备缓存 (启动时直接连接上次的设备，不用先扫描) ---
+def load_known_devices():
+    """最近连接成功过的设备 [{"address", "name", "last_seen"}]，最近的在前"""
+    try:
+        with open(DEVICE_CACHE, encoding="utf-8") as f: devices = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [d for d in devices if isinstance(d, dict) and d.get("address")] if isinstance(devices, list) else []
+
+def remember_device(address, name):
+    if address.startswith("sim:"): return
+    devices = [d for d in load_known_devices() if device_key(d["address"]) != device_key(address)]
+    devices.insert(0, {"address": address, "name": name, "last_seen": round(time.time())})
+    tmp = DEVICE_CACHE + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(devices[:DEVICE_CACHE_MAX], f, ensure_ascii=False, indent=1)
+        os.replace(tmp, DEVICE_CACHE)
+    except OSError as e:
+        print(f"保存设备列表失败: {e}")
+
+# --- 3.1 心率测量解析 (0x2A37) ---
+def parse_hr_measurement(data):
+    """解析 Heart Rate Measurement 特征值，返回 (bpm, contact, energy_kj, rr_list)
+    contact: None 表示设备不支持接触检测; energy_kj: 无该字段时为 None;
+    rr_list: RR 间期原始值，单位 1/1024 秒"""
+    flags = data[0]
+    if flags & 0x01: bpm = struct.unpack_from('<H', data, 1)[0]; offset = 3
+    else: bpm = data[1]; offset = 2
+    contact = bool(flags & 0x02) if flags & 0x04 else None
+    energy = None
+    if flags & 0x08:
+        energy = struct.unpack_from('<H', data, offset)[0]; offset += 2
+    rr = ()
+    if flags & 0x10:
+        count = (len(data) - offset) // 2
+        rr = struct.unpack_from(f'<{count}H', data, offset)
+    return bpm, contact, energy, rr
+
+# --- 3.2 环形缓冲区 & 增量 HRV ---
+class RingBuffer:
+    """定长环形缓冲区，时间戳和数值各用一个 array('d') 存储，追加 O(1)"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0 # 下一个写入位置
+        self.size = 0
+
+    def append(self, t, value):
+        """写入一个样本；缓冲区已满时返回被挤出的旧值，否则返回 None"""
+        i = self.head
+        evicted = self.values[i] if self.size == self.capacity else None
+        self.ts[i] = t
+        self.values[i] = value
+        self.head = (i + 1) % self.capacity
+        if evicted is None: self.size += 1
+        return evicted
+
+    def last(self, n):
+        """按时间顺序返回最近 n 个 (时间戳, 数值)"""
+        n = min(n, self.size)
+        start = self.head - n
+        return [(self.ts[i % self.capacity], self.values[i % self.capacity]) for i in range(start, self.head)]
+
+RR_MIN, RR_MAX = 300, 2000 # ms，超出范围的 RR 视为伪迹，不参与 HRV
+
+class HRStats:
+    """心率样本与 RR 间期的历史，以及增量计算的滚动均值 / RMSSD / SDNN。
+    每个样本只做常数次加减，不重扫历史，可以直接在 BLE 回调里调用。"""
+    def __init__(self, history=3600, bpm_window=30, rr_window=120):
+        self.samples = RingBuffer(history)      # (时间戳, BPM)
+        self.rr = RingBuffer(history)           # (时间戳, RR ms)
+        self._bpm_win = RingBuffer(bpm_window)
+        self._bpm_sum = 0.0
+        self._rr_win = RingBuffer(rr_window)    # RR 原始值 (1/1024 s 整数，求和无舍入误差)
+        self._rr_sum = self._rr_sq = 0
+        self._diff_win = RingBuffer(rr_window - 1) # 相邻 RR 差的平方
+        self._diff_sq = 0
+        self._prev_rr = None
+        self.bpm = 0
+        self.contact = None
+        self.energy = None
+        self.last_rr = ()
+        self.ts = 0.0   # 最新样本的时间戳 (time.time)，随样本传到各个输出端
+        self.t_rx = 0.0 # 最新样本的接收时刻 (perf_counter)，用于统计进程内各环节延迟
+
+    def add(self, t, bpm, contact, energy, rr):
+        self.bpm, self.contact, self.last_rr, self.ts = bpm, contact, rr, t
+        if energy is not None: self.energy = energy
+        self.samples.append(t, bpm)
+        old = self._bpm_win.append(t, bpm)
+        self._bpm_sum += bpm - (old or 0)
+        for raw in rr:
+            ms = raw * 1000 / 1024
+            if not RR_MIN <= ms <= RR_MAX:
+                self._prev_rr = None
+                continue
+            self.rr.append(t, ms)
+            old = self._rr_win.append(t, raw)
+            if old is not None:
+                self._rr_sum -= int(old); self._rr_sq -= int(old) ** 2
+            self._rr_sum += raw; self._rr_sq += raw * raw
+            if self._prev_rr is not None:
+                d2 = (raw - self._prev_rr) ** 2
+                old = self._diff_win.append(t, d2)
+                self._diff_sq += d2 - int(old or 0)
+            self._prev_rr = raw
+
+    def break_rr(self):
+        """中间有被丢掉的 RR (整个通知被剔除)：下一个 RR 不和之前的算相邻差"""
+        self._prev_rr = None
+
+    def mark_gap(self):
+        """断线后调用：不把断线前后的 RR 当作相邻间期"""
+        self._prev_rr = None
+        self.bpm = 0
+        self.last_rr = ()
+
+    @property
+    def avg_bpm(self):
+        n = self._bpm_win.size
+        return self._bpm_sum / n if n else 0.0
+
+    @property
+    def rmssd(self):
+        n = self._diff_win.size
+        return math.sqrt(self._diff_sq / n) * 1000 / 1024 if n else None
+
+    @property
+    def sdnn(self):
+        n = self._rr_win.size
+        if n < 2: return None
+        var = (self._rr_sq - self._rr_sum * self._rr_sum / n) / (n - 1)
+        return math.sqrt(max(var, 0.0)) * 1000 / 1024
+
+    def snapshot(self):
+        rmssd, sdnn = self.rmssd, self.sdnn
+        return {
+            "hr": self.bpm,
+            "avg_hr": round(self.avg_bpm, 1),
+            "rr": [round(raw * 1000 / 1024) for raw in self.last_rr],
+            "rmssd": round(rmssd, 1) if rmssd is not None else None,
+            "sdnn": round(sdnn, 1) if sdnn is not None else None,
+            "energy": self.energy,
+            "contact": self.contact,
+            "ts": round(self.ts, 3),
+        }
+
+# --- 3.2.1 分析阶段：异常值剔除、平滑、心率区间、训练负荷 ---
+# 位于 BLE 回调与所有输出端 (HUD / Web / 网关 / 推送) 之间：每个样本增量计算一次，结果并入快照，
+# 输出端只读结果，不各自重算。ANALYSIS_STAGES 中可以追加自定义阶段 (实现 update / gap / snapshot)。
+PROFILE = {
+    "hr_rest": 60,            # 静息心率
+    "hr_max": 190,            # 最大心率 (不知道时可用 208 - 0.7 × 年龄)
+    "weight": 70, "age": 30, "sex": "male", # 卡路里估算 (Keytel 2005)
+    "zones": [100, 120, 140], # 各区间下界 (bpm)，默认与原 HUD 四色一致；设为 null 则按心率储备 50/60/70/80/90% 划分
+}
+ZONE_PALETTE = ("#95A5A6", "#3498DB", "#2ECC71", "#F1C40F", "#E67E22", "#E74C3C") # 从低到高，N 个区间取最后 N 个颜色
+HR_VALID_MIN, HR_VALID_MAX = 30, 230 # 超出范围的 BPM 直接丢弃
+OUTLIER_JUMP = 35    # 与最近几个有效值的中位数相差超过这么多 bpm 视为异常
+OUTLIER_CONFIRM = 3  # 连续这么多个"异常"值彼此接近时认为是真实变化 (如冲刺)，予以接受
+MEDIAN_WINDOW = 5
+EMA_ALPHA = 0.3
+ZONE_GAP = 5.0       # 秒，相邻样本间隔超过这么久 (丢包 / 断线) 不计入区间时间和训练负荷
+
+def zone_bounds(profile=None):
+    p = profile or PROFILE
+    if p.get("zones"): return tuple(sorted(p["zones"]))
+    rest, hr_max = p["hr_rest"], p["hr_max"]
+    return tuple(round(rest + f * (hr_max - rest)) for f in (0.5, 0.6, 0.7, 0.8, 0.9))
+
+def zone_color(bpm, profile=None):
+    bounds = zone_bounds(profile)
+    palette = ZONE_PALETTE[-(len(bounds) + 1):]
+    return palette[min(bisect.bisect_right(bounds, bpm), len(palette) - 1)]
+
+def load_rates(bpm, p):
+    """每分钟的 TRIMP (Banister) 与千卡 (Keytel 2005)"""
+    hrr = min(1.0, max(0.0, (bpm - p["hr_rest"]) / max(1, p["hr_max"] - p["hr_rest"])))
+    if p.get("sex") == "female":
+        return hrr * 0.86 * math.exp(1.67 * hrr), max(0.0, (-20.4022 + 0.4472 * bpm - 0.1263 * p["weight"] + 0.074 * p["age"]) / 4.184)
+    return hrr * 0.64 * math.exp(1.92 * hrr), max(0.0, (-55.0969 + 0.6309 * bpm + 0.1988 * p["weight"] + 0.2017 * p["age"]) / 4.184)
+
+class HRAnalytics:
+    """默认分析阶段。update 返回通过检查的 BPM，异常值返回 None (这个样本整个丢弃)，
+    其余结果 (平滑值、区间、区间时间、TRIMP、千卡) 由 snapshot 提供给所有输出端"""
+    def __init__(self, profile=None):
+        self.profile = dict(PROFILE, **(profile or {}))
+        self.bounds = zone_bounds(self.profile)
+        self.palette = ZONE_PALETTE[-(len(self.bounds) + 1):]
+        self.recent = deque(maxlen=MEDIAN_WINDOW)   # 最近的有效值
+        self.suspect = deque(maxlen=OUTLIER_CONFIRM) # 连续的疑似异常值
+        self.raw = self.bpm = 0
+        self.smooth = None # 中位数滤波后再做 EMA
+        self.zone = None
+        self.zone_seconds = [0.0] * (len(self.bounds) + 1)
+        self.trimp = self.kcal = 0.0
+        self.rejected = 0
+        self._last_t = None
+
+    def update(self, t, bpm):
+        self.raw = bpm
+        if not self._accept(bpm):
+            self.rejected += 1
+            return None
+        self.recent.append(bpm)
+        median = sorted(self.recent)[len(self.recent) // 2]
+        self.smooth = median if self.smooth is None else self.smooth + EMA_ALPHA * (median - self.smooth)
+        if self._last_t is not None and 0 < t - self._last_t <= ZONE_GAP:
+            dt = t - self._last_t # 上一个有效值持续到现在
+            self.zone_seconds[self.zone] += dt
+            trimp, kcal = load_rates(self.bpm, self.profile)
+            self.trimp += trimp * dt / 60
+            self.kcal += kcal * dt / 60
+        self._last_t = t
+        self.bpm = bpm
+        self.zone = min(bisect.bisect_right(self.bounds, bpm), len(self.zone_seconds) - 1)
+        return bpm
+
+    def _accept(self, bpm):
+        if not HR_VALID_MIN <= bpm <= HR_VALID_MAX: return False
+        if not self.recent or abs(bpm - sorted(self.recent)[len(self.recent) // 2]) <= OUTLIER_JUMP:
+            self.suspect.clear()
+            return True
+        self.suspect.append(bpm)
+        if len(self.suspect) == OUTLIER_CONFIRM and max(self.suspect) - min(self.suspect) <= OUTLIER_JUMP:
+            self.recent.clear() # 持续的跳变是真实变化：从新水平重新开始
+            self.suspect.clear()
+            return True
+        return False
+
+    def gap(self):
+        """断线或没有读数 (0 bpm)：不把前后的样本当作连续"""
+        self.recent.clear()
+        self.suspect.clear()
+        self.bpm = 0
+        self.smooth = self.zone = self._last_t = None
+
+    def snapshot(self):
+        return {
+            "hr_raw": self.raw,
+            "hr_smooth": round(self.smooth, 1) if self.smooth is not None else None,
+            "zone": self.zone,
+            "zone_color": self.palette[self.zone] if self.zone is not None else None,
+            "time_in_zone": [round(s) for s in self.zone_seconds],
+            "trimp": round(self.trimp, 1),
+            "kcal": round(self.kcal, 1),
+            "rejected": self.rejected,
+        }
+
+ANALYSIS_STAGES = [HRAnalytics] # 每个设备按顺序实例化；前一阶段返回的 BPM 交给下一阶段，返回 None 则丢弃该样本
+
+EMPTY_SNAPSHOT = {**HRStats().snapshot(), **HRAnalytics().snapshot()}
+
+# --- 3.3 会话记录 (二进制，只追加) ---
+# 文件格式：16 字节文件头 (魔数, 版本, 开始时间) + 若干定长记录 (时间戳 f64, BPM u16, RR u16)
+# RR 单位 1/1024 秒，0 表示该通知不含 RR；一次通知带多个 RR 时写多条记录
+RECORD_DIR = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "sessions")
+RECORD_ENABLED = True
+RECORD_FLUSH_INTERVAL = 2.0 # 秒，缓冲写入 + fsync 的间隔；崩溃最多丢这么久的数据
+RECORD_MAGIC = b"HRREC\0"
+RECORD_HEADER = struct.Struct('<6sHd')
+RECORD = struct.Struct('<dHH')
+HISTORY_MAX_POINTS = 300
+
+class _Recording:
+    """一个会话文件：自己的缓冲、锁、停止信号和写盘线程。写盘线程是唯一写文件的地方，
+    停止后由它做最后一次写入并关闭文件，所以不会有两个线程交替写、也不会写进已关闭的文件"""
+    def __init__(self, path, f):
+        self.path = path
+        self.file = f
+        self.lock = threading.Lock()
+        self.buffer = bytearray()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def _flush_loop(self):
+        while not self.stopped.wait(RECORD_FLUSH_INTERVAL):
+            try: self._flush()
+            except Exception as e: print(f"Record error: {e}")
+        try: self._flush()
+        except Exception as e: print(f"Record error: {e}")
+        finally: self.file.close()
+
+    def _flush(self):
+        with self.lock:
+            data, self.buffer = self.buffer, bytearray()
+        if data:
+            self.file.write(data); self.file.flush(); os.fsync(self.file.fileno())
+
+class SessionRecorder:
+    """每次 BLE 连接写一个会话文件。BLE 回调里只往内存缓冲追加字节，
+    由后台线程定期写盘并 fsync；读取端只认完整的记录，所以崩溃后文件依然可读。
+    stop() 只通知写盘线程收尾，不在事件循环上做磁盘 I/O；快速重连时新文件换新的缓冲和线程"""
+    def __init__(self, directory, device_id):
+        self.directory = directory
+        self.device_id = device_id
+        self.current = None # 正在写的 _Recording
+        self.closing = []   # 已停止、可能还在做最后写入的 _Recording
+
+    def start(self):
+        if not RECORD_ENABLED or self.current: return
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        while True: # 文件名精确到毫秒；快速重连撞名时顺延，绝不往旧文件中间追加文件头
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+            path = os.path.join(self.directory, f"hr_{stamp}_{self.device_id}.bin")
+            try: f = open(path, "xb"); break
+            except FileExistsError: now += 0.001
+        f.write(RECORD_HEADER.pack(RECORD_MAGIC, 1, now))
+        self.current = _Recording(path, f)
+
+    def add(self, t, bpm, rr):
+        rec = self.current
+        if not rec: return
+        with rec.lock:
+            if rr:
+                for raw in rr: rec.buffer += RECORD.pack(t, bpm, raw)
+            else:
+                rec.buffer += RECORD.pack(t, bpm, 0)
+
+    def stop(self):
+        rec, self.current = self.current, None
+        if not rec: return
+        rec.stopped.set()
+        self.closing = [r for r in self.closing if r.thread.is_alive()] + [rec]
+
+    def join(self, timeout=None):
+        """等已停止的文件写完 (退出前调用，不要在事件循环里调用)"""
+        for rec in self.closing: rec.thread.join(timeout)
+
+def _session_files(device_id=None):
+    try: names = sorted(os.listdir(RECORD_DIR))
+    except FileNotFoundError: return []
+    suffix = f"_{device_key(device_id)}.bin" if device_id else ".bin"
+    return [os.path.join(RECORD_DIR, n) for n in names if n.startswith("hr_") and n.endswith(suffix)]
+
+def iter_records(t_from, t_to, device_id=None):
+    """按时间顺序产出 [t_from, t_to) 内的 (时间戳, BPM, RR 原始值)。
+    通过 mmap + 二分查找定位区间，不把整个文件读进内存；device_id 为空时读取所有设备"""
+    for chunk in _record_chunks(t_from, t_to, device_id):
+        yield from RECORD.iter_unpack(chunk)
+
+def _record_chunks(t_from, t_to, device_id=None):
+    """每个会话文件命中区间的原始字节 (整数条记录)"""
+    for path in _session_files(device_id):
+        with open(path, "rb") as f:
+            count = (os.fstat(f.fileno()).st_size - RECORD_HEADER.size) // RECORD.size # 忽略写了一半的尾部
+            if count <= 0: continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if RECORD_HEADER.unpack_from(mm, 0)[0] != RECORD_MAGIC: continue
+                if _record_ts(mm, 0) >= t_to or _record_ts(mm, count - 1) < t_from: continue
+                lo = _lower_bound(mm, count, t_from)
+                hi = _lower_bound(mm, count, t_to)
+                # 只复制命中区间的字节
+                yield mm[RECORD_HEADER.size + lo * RECORD.size:RECORD_HEADER.size + hi * RECORD.size]
+
+def _record_ts(mm, i):
+    return RECORD.unpack_from(mm, RECORD_HEADER.size + i * RECORD.size)[0]
+
+def _lower_bound(mm, count, t):
+    """第一条时间戳 >= t 的记录下标"""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _record_ts(mm, mid) < t: lo = mid + 1
+        else: hi = mid
+    return lo
+
+def query_history(t_from, t_to, step=None, device_id=None):
+    """服务端降采样：每 step 秒一个点 (平均/最小/最大 BPM，平均 RR ms)。
+    没有读数 (0) 与超出 HR_VALID_MIN..HR_VALID_MAX 的记录不计入，免得把平均值和最小值拉低；CSV 导出仍是原始记录"""
+    span = max(t_to - t_from, 1e-3)
+    step = max(step or 0, span / HISTORY_MAX_POINTS) # 点数上限，防止请求过细的步长
+    buckets = {}
+    for t, bpm, rr in iter_records(t_from, t_to, device_id):
+        if not HR_VALID_MIN <= bpm <= HR_VALID_MAX: continue
+        b = buckets.get(int((t - t_from) // step))
+        if b is None:
+            b = buckets[int((t - t_from) // step)] = [0, 0, bpm, bpm, 0, 0]
+        b[0] += bpm; b[1] += 1
+        if bpm < b[2]: b[2] = bpm
+        if bpm > b[3]: b[3] = bpm
+        if rr: b[4] += rr; b[5] += 1
+    points = []
+    for k in sorted(buckets):
+        total, n, lo, hi, rr_sum, rr_n = buckets[k]
+        points.append({
+            "t": round(t_from + k * step, 3),
+            "hr": round(total / n, 1), "min": lo, "max": hi,
+            "rr": round(rr_sum / rr_n * 1000 / 1024) if rr_n else None,
+        })
+    return {"from": t_from, "to": t_to, "step": step, "points": points}
+
+def analyze_history(t_from, t_to, device_id=None, profile=None):
+    """整段记录重算区间时间 / TRIMP / 千卡 (会话回看用)。装了 NumPy 时整段向量化计算；
+    否则逐条走增量的 HRAnalytics。向量化版本的异常值判断用"前 N 个原始值的中位数"近似，
+    持续跳变时会比增量版本晚一两个样本接受新水平"""
+    p = dict(PROFILE, **(profile or {}))
+    bounds = zone_bounds(p)
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is None:
+        stage, last_t, accepted = HRAnalytics(p), None, []
+        for t, bpm, _ in iter_records(t_from, t_to, device_id):
+            if t == last_t: continue # 同一通知的多条 RR 记录
+            last_t, rejected = t, stage.rejected
+            if not bpm: # 没有读数，不算异常值
+                stage.gap()
+                continue
+            stage.update(t, bpm)
+            if stage.rejected == rejected: accepted.append(bpm)
+        total = len(accepted) + stage.rejected
+        zone_seconds, trimp, kcal = stage.zone_seconds, stage.trimp, stage.kcal
+    else:
+        data = np.frombuffer(b"".join(_record_chunks(t_from, t_to, device_id)), dtype=[("t", "<f8"), ("bpm", "<u2"), ("rr", "<u2")])
+        first = np.ones(len(data), bool)
+        first[1:] = data["t"][1:] != data["t"][:-1]
+        t, bpm = data["t"][first], data["bpm"][first].astype(float)
+        gaps = np.cumsum(bpm == 0) # 0 bpm 是没有读数：不算样本也不算异常值，前后不当作连续
+        total = len(bpm) - int(gaps[-1]) if len(bpm) else 0
+        ok = (bpm >= HR_VALID_MIN) & (bpm <= HR_VALID_MAX)
+        t, bpm, gaps = t[ok], bpm[ok], gaps[ok]
+        if len(bpm) > MEDIAN_WINDOW:
+            median = np.median(np.lib.stride_tricks.sliding_window_view(bpm, MEDIAN_WINDOW)[:-1], axis=1)
+            ok = np.ones(len(bpm), bool)
+            ok[MEDIAN_WINDOW:] = np.abs(bpm[MEDIAN_WINDOW:] - median) <= OUTLIER_JUMP
+            t, bpm, gaps = t[ok], bpm[ok], gaps[ok]
+        accepted = bpm
+        dt, prev = np.diff(t), bpm[:-1]
+        use = (dt > 0) & (dt <= ZONE_GAP) & (np.diff(gaps) == 0)
+        dt, prev = dt[use], prev[use]
+        zones = np.minimum(np.searchsorted(bounds, prev, side="right"), len(bounds))
+        zone_seconds = np.bincount(zones, weights=dt, minlength=len(bounds) + 1).tolist()
+        hrr = np.clip((prev - p["hr_rest"]) / max(1, p["hr_max"] - p["hr_rest"]), 0, 1)
+        if p.get("sex") == "female":
+            trimp_rate, kcal_rate = hrr * 0.86 * np.exp(1.67 * hrr), (-20.4022 + 0.4472 * prev - 0.1263 * p["weight"] + 0.074 * p["age"]) / 4.184
+        else:
+            trimp_rate, kcal_rate = hrr * 0.64 * np.exp(1.92 * hrr), (-55.0969 + 0.6309 * prev + 0.1988 * p["weight"] + 0.2017 * p["age"]) / 4.184
+        trimp, kcal = float(np.sum(trimp_rate * dt) / 60), float(np.sum(np.maximum(kcal_rate, 0) * dt) / 60)
+    n = len(accepted)
+    return {
+        "from": t_from, "to": t_to, "zones": list(bounds), "samples": total, "rejected": total - n,
+        "avg_hr": round(float(sum(accepted)) / n, 1) if n else None, "max_hr": int(max(accepted)) if n else None,
+        "time_in_zone": [round(s) for s in zone_seconds], "trimp": round(trimp, 1), "kcal": round(kcal, 1),
+        "vectorized": np is not None,
+    }
+
+# --- 3.4 样本总线 (BLE 回调 -> HUD / Web / 推送) ---
+# BLE 回调只把只读的 Sample 交给总线，总线逐个放进订阅者的有界队列 (满了丢最旧的)，从不等待消费者：
+# 界面卡住、网关连不上都拖不慢 BLE 回调。会话记录仍在回调里直接追加 (它要保存异常值在内的原始读数)
+BUS_QUEUE_SIZE = 64 # 订阅者默认的队列长度
+
+class Sample:
+    """一次发布 (只读)。kind 为 "hr" (新样本) 或 "status" (连接 / 扫描状态变化，device 为 None 时是 Hub 本身)；
+    data 是该设备的完整快照 (字段同 /api/hr)，发布后不再修改，可以直接交给任意线程"""
+    __slots__ = ("kind", "device", "seq", "ts", "t_rx", "bpm", "connected", "data")
+
+    def __init__(self, kind, device, seq, ts=0.0, t_rx=0.0, bpm=0, connected=False, data=None):
+        init = object.__setattr__
+        init(self, "kind", kind); init(self, "device", device); init(self, "seq", seq)
+        init(self, "ts", ts); init(self, "t_rx", t_rx); init(self, "bpm", bpm)
+        init(self, "connected", connected); init(self, "data", data)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Sample 是只读的")
+
+    def __repr__(self):
+        return f"Sample({self.kind}, {self.device}, seq={self.seq}, bpm={self.bpm}, connected={self.connected})"
+
+class Subscription:
+    """线程订阅者：get() 阻塞等待下一个样本 (超时或 close() 后返回 None)，drain() 取走全部。
+    dropped 为因队列满被丢掉的条数"""
+    def __init__(self, bus, name, maxsize, accept):
+        self.bus = bus
+        self.name = name
+        self.accept = accept # 在发布方线程调用的过滤函数，None = 全部接收
+        self.queue = deque(maxlen=maxsize)
+        self.dropped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def _put(self, sample):
+        with self.cond:
+            if len(self.queue) == self.queue.maxlen: self.dropped += 1
+            self.queue.append(sample)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        with self.cond:
+            self.cond.wait_for(lambda: self.queue or self.closed, timeout)
+            return self.queue.popleft() if self.queue else None
+
+    def drain(self):
+        with self.cond:
+            items = list(self.queue)
+            self.queue.clear()
+        return items
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class AsyncSubscription(Subscription):
+    """事件循环里的订阅者 (须在该循环中创建)：await wait() 后 drain()。
+    发布方在别的线程时通过 call_soon_threadsafe 唤醒"""
+    def __init__(self, bus, name, maxsize, accept):
+        super().__init__(bus, name, maxsize, accept)
+        self.loop = asyncio.get_running_loop()
+        self.thread = threading.get_ident()
+        self.event = asyncio.Event()
+
+    def _put(self, sample):
+        super()._put(sample)
+        if threading.get_ident() == self.thread: self.event.set()
+        else: self.loop.call_soon_threadsafe(self.event.set)
+
+    async def wait(self):
+        while not self.queue:
+            self.event.clear()
+            await self.event.wait()
+
+class SampleBus:
+    """进程内发布/订阅。publish 只遍历订阅者元组并入队，O(订阅者数)；订阅 / 退订时整体替换元组，发布不用加锁"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = ()
+        self.latest = {} # 设备 ID -> 最新的 Sample
+        self.counter = itertools.count(1) # next() 在 GIL 下是原子的，多个发布线程也不会重号
+
+    def subscribe(self, name, maxsize=BUS_QUEUE_SIZE, accept=None):
+        return self.attach(Subscription(self, name, maxsize, accept))
+
+    def subscribe_async(self, name, maxsize=BUS_QUEUE_SIZE, accept=None):
+        return self.attach(AsyncSubscription(self, name, maxsize, accept))
+
+    def attach(self, sink):
+        """任何带 accept 属性和 _put(sample) 方法的对象都可以订阅 (如 HRBroadcaster)"""
+        with self.lock: self.subscribers += (sink,)
+        return sink
+
+    def unsubscribe(self, sink):
+        with self.lock: self.subscribers = tuple(s for s in self.subscribers if s is not sink)
+
+    def publish(self, kind, device=None, **fields):
+        sample = Sample(kind, device, next(self.counter), **fields)
+        if device is not None: self.latest[device] = sample
+        for sink in self.subscribers:
+            if sink.accept is None or sink.accept(sample): sink._put(sample)
+        return sample
+
+bus = SampleBus()
+
+# --- 3.4.1 实时推送 (SSE) ---
+BOOT_ID = os.urandom(4).hex() # 进程启动标识：重启后序号从头开始，ETag 也随之不同
+
+def _in_loop(loop):
+    try: return asyncio.get_running_loop() is loop
+    except RuntimeError: return False
+
+class HRBroadcaster:
+    """把每一次 BLE 通知推送给所有观看端：观看端等待新序号，而不是每秒轮询。
+    作为总线订阅者只保留最新样本 (慢的观看端直接跳到最新)；所有等待者共用一个 Future，发布一次唤醒全部。
+    publish / wait 都在 Hub 事件循环中执行；别的线程发布到总线时 _put 转交给事件循环"""
+    def __init__(self, payload=EMPTY_SNAPSHOT, accept=None):
+        self.accept = accept
+        self.seq = 0
+        self.payload = payload
+        self.t_rx = 0.0 # 样本接收时刻 (perf_counter)，用于延迟统计
+        self._changed = None
+        self._message = None
+        self._body = None
+
+    def publish(self, payload, t_rx=0.0):
+        self.seq += 1
+        self.payload = payload
+        self.t_rx = t_rx
+        self._message = self._body = None
+        if self._changed is not None:
+            self._changed.set_result(None)
+            self._changed = None
+
+    def _put(self, sample):
+        t_rx = sample.t_rx if sample.connected else 0.0
+        loop = hub.loop
+        if loop is None or _in_loop(loop): self.publish(sample.data, t_rx) # Future 只能在自己的事件循环里完成
+        else: loop.call_soon_threadsafe(self.publish, sample.data, t_rx)
+
+    async def wait(self, last_seq, timeout):
+        """等待序号变化 (或超时)，返回 (seq, payload)"""
+        if self.seq == last_seq:
+            if self._changed is None: self._changed = asyncio.get_running_loop().create_future()
+            try: await asyncio.wait_for(asyncio.shield(self._changed), timeout)
+            except asyncio.TimeoutError: pass
+        return self.seq, self.payload
+
+    def body(self):
+        """当前样本的 JSON (带 seq)，每个序号只编码一次，/api/hr 与 SSE 共用"""
+        if self._body is None:
+            self._body = json.dumps({**self.payload, "seq": self.seq}).encode()
+        return self._body
+
+    def etag(self):
+        return f'"{BOOT_ID}-{self.seq}"'
+
+    def message(self):
+        """当前样本的 SSE 报文，所有观看端共用"""
+        if self._message is None:
+            self._message = b"id: %d\ndata: %s\n\n" % (self.seq, self.body())
+        return self._message
+
+# --- 3.5 多设备 BLE Hub (共用一个事件循环) ---
+class DeviceSession:
+    """一个心率设备：独立的连接任务、重连策略、读数与会话记录"""
+    def __init__(self, hub, address, name=None, retry_delay=RECONNECT_DELAY):
+        self.hub = hub
+        self.address = address
+        self.id = device_key(address)
+        self.name = name or address.split("?", 1)[0]
+        self.retry_delay = retry_delay
+        self.stats = HRStats()
+        self.stages = [stage() for stage in ANALYSIS_STAGES]
+        self.recorder = SessionRecorder(RECORD_DIR, self.id)
+        self.broadcaster = HRBroadcaster(accept=lambda sample: sample.device == self.id)
+        self.connected = False
+        self.reconnects = 0
+        self.failures = 0   # 连续失败次数，决定退避时长；收到第一个样本后清零
+        self.retry_at = 0.0 # 等待重连时为下次尝试的时间 (time.time)，否则为 0
+        self._t_connect = 0.0 # 本次连接开始的时刻，收到第一个样本时计入 time-to-first-BPM
+        self.notifications = 0 # 以下计数只供 /metrics 读取，热路径上只是整数加一
+        self.errors = 0
+        self.task = None
+
+    def info(self):
+        retry_in = round(max(0.0, self.retry_at - time.time()), 1) if self.retry_at else None
+        return {"id": self.id, "name": self.name, "connected": self.connected, "reconnects": self.reconnects, "retry_in": retry_in, **self.snapshot()}
+
+    def snapshot(self):
+        snapshot = self.stats.snapshot()
+        for stage in self.stages: snapshot.update(stage.snapshot())
+        return snapshot
+
+    def _handle_hr_data(self, sender, data):
+        t_rx = time.perf_counter()
+        self.notifications += 1
+        if self._t_connect: # 连上后的第一个样本：链路确实可用，退避清零
+            metrics.first_bpm_seconds.observe(t_rx - self._t_connect)
+            self._t_connect = 0.0
+            self.failures = 0
+        bpm, contact, energy, rr = parse_hr_measurement(data)
+        t = time.time()
+        self.recorder.add(t, bpm, rr) # 记录原始值，回看时可以换参数重新分析
+        if not bpm or contact is False: # 没有读数 (没戴好 / 没接触皮肤)：不是异常值，按断开处理并推送 0，输出端显示 "--"
+            self.stats.mark_gap()
+            for stage in self.stages: stage.gap()
+            self.stats.contact, self.stats.ts, self.stats.t_rx = contact, t, t_rx
+            self.hub._publish(self, "hr")
+            latency.record("parse", time.perf_counter() - t_rx)
+            return
+        for stage in self.stages:
+            bpm = stage.update(t, bpm)
+            if bpm is None: # 异常值：不进统计 (RR、滚动平均)，也不推送给任何输出端
+                if rr: self.stats.break_rr()
+                break
+        if bpm:
+            self.stats.add(t, bpm, contact, energy, rr)
+            self.stats.t_rx = t_rx
+            self.hub._publish(self, "hr")
+        latency.record("parse", time.perf_counter() - t_rx)
+
+    def _set_disconnected(self):
+        self.connected = False
+        self.stats.mark_gap()
+        for stage in self.stages: stage.gap()
+        self.recorder.stop()
+        self.hub._publish(self)
+
+    async def run(self):
+        t_lost = None # 掉线时刻 (perf_counter)，重新连上后记录断线时长
+        try:
+            while True:
+                disconnected = asyncio.Event()
+                try:
+                    print(f"Connecting to {self.address}...")
+                    t0 = time.perf_counter()
+                    async with make_client(self.address, lambda c: disconnected.set(), self.hub.seen.get(self.id)) as client:
+                        now = time.perf_counter()
+                        metrics.connect_seconds.observe(now - t0)
+                        if t_lost is not None: metrics.reconnect_seconds.observe(now - t_lost)
+                        t_lost = None
+                        self._t_connect = t0
+                        self.connected = True
+                        asyncio.get_running_loop().run_in_executor(None, remember_device, self.address, self.name)
+                        self.recorder.start()
+                        self.hub._publish(self)
+                        await client.start_notify(HR_CHAR_UUID, self._handle_hr_data)
+                        await disconnected.wait() # 断线回调触发，不再每秒轮询 is_connected
+                except asyncio.CancelledError: raise
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error ({self.name}): {e}")
+                if self.connected: t_lost = time.perf_counter()
+                delay = backoff_delay(self.retry_delay, self.failures)
+                self.failures += 1
+                self.retry_at = time.time() + delay
+                self._set_disconnected()
+                self.reconnects += 1
+                await asyncio.sleep(delay)
+                self.retry_at = 0.0
+        finally:
+            if self.connected: self._set_disconnected()
+
+class BLEHub:
+    """所有设备共用一个常驻事件循环 (后台线程)，可以同时连接多条心率带。
+    样本与状态变化都发布到 bus (见 3.4)，消费者订阅总线，不直接挂在 Hub 上"""
+    def __init__(self):
+        self.loop = None
+        self.devices = {} # 设备 ID -> DeviceSession，按连接顺序，第一个为主设备
+        self.scanning = False
+        self.seen = {} # 设备 ID -> 扫描到的 BLEDevice，连接时直接使用，省去 bleak 按地址再扫一次
+        self.broadcaster = bus.attach(HRBroadcaster(accept=self._is_primary)) # 主设备的推送 (兼容单设备的 /api/hr/stream)
+
+    def start(self):
+        if self.loop: return
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="ble-hub", daemon=True).start()
+
+    @property
+    def primary(self):
+        return next(iter(self.devices.values()), None)
+
+    def get(self, device_id):
+        return self.devices.get(device_key(device_id)) if device_id else self.primary
+
+    def connect(self, address, name=None, retry_delay=RECONNECT_DELAY):
+        """添加设备并开始连接 (线程安全)，已添加的设备直接返回"""
+        self.start()
+        session = DeviceSession(self, address, name, retry_delay)
+        if session.id in self.devices: return self.devices[session.id]
+        self.devices[session.id] = session
+        bus.attach(session.broadcaster)
+        self.loop.call_soon_threadsafe(lambda: setattr(session, "task", self.loop.create_task(session.run())))
+        return session
+
+    def disconnect(self, device_id):
+        session = self.devices.pop(device_id, None)
+        if session: bus.unsubscribe(session.broadcaster)
+        if session and session.task: self.loop.call_soon_threadsafe(session.task.cancel)
+
+    def scan(self, timeout=SCAN_TIMEOUT, on_found=None):
+        """在 Hub 的事件循环中扫描，返回 concurrent.futures.Future，结果为 [(名称, 地址)]。
+        每发现一个心率设备立即调用 on_found(名称, 地址) (BLE 线程)；找到第一个后再扫 SCAN_SETTLE 秒即结束"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._scan(timeout, on_found), self.loop)
+
+    async def _scan(self, timeout, on_found):
+        self.scanning = True
+        bus.publish("status")
+        found = {}
+        first = asyncio.Event()
+        t0 = time.perf_counter()
+
+        def detected(device, adv):
+            if device.address in found: return
+            name = adv.local_name or device.name or "Unknown"
+            # 标准心率带广播心率服务 UUID；部分手表不广播，按名称识别
+            if HR_SERVICE_UUID not in (u.lower() for u in adv.service_uuids or ()) and not any(h in name.lower() for h in HR_NAME_HINTS): return
+            found[device.address] = name
+            self.seen[device_key(device.address)] = device
+            first.set()
+            if on_found: on_found(name, device.address)
+
+        try:
+            from bleak import BleakScanner
+            async with BleakScanner(detection_callback=detected):
+                try:
+                    await asyncio.wait_for(first.wait(), timeout)
+                    await asyncio.sleep(min(SCAN_SETTLE, max(0.0, t0 + timeout - time.perf_counter())))
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e: print(f"Scan error: {e}")
+        finally:
+            metrics.scan_seconds.observe(time.perf_counter() - t0)
+            self.scanning = False
+            bus.publish("status")
+        return [(name, address) for address, name in found.items()]
+
+    def stop(self):
+        """断开所有设备，最多等待 timeout 秒"""
+        if not self.loop: return
+        async def _shutdown():
+            tasks = [s.task for s in self.devices.values() if s.task]
+            for task in tasks: task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        try: asyncio.run_coroutine_threadsafe(_shutdown(), self.loop).result(timeout=3)
+        except Exception: pass
+        for session in list(self.devices.values()): session.recorder.join(timeout=3) # 最后一段缓冲写完再退出
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _is_primary(self, sample):
+        primary = self.primary
+        return primary is not None and sample.device == primary.id
+
+    def _publish(self, session, kind="status"):
+        stats = session.stats
+        bus.publish(kind, session.id, ts=stats.ts, t_rx=stats.t_rx, bpm=stats.bpm, connected=session.connected, data=session.snapshot())
+
+hub = BLEHub()
+
+# --- 3.6 模拟设备 (无蓝牙环境下测试整条链路) ---
+# 地址以 "sim:" 开头时使用模拟心率带，参数写在 ? 之后，例如：
+#   sim:1?rate=4&jitter=0.05&drop=0.02&disconnect=120   每秒 4 次通知，抖动 50ms，丢包 2%，平均 120 秒断线一次
+#   sim:replay?file=sessions/hr_xxx.bin&speed=10&loop=1  以 10 倍速循环回放录制的会话
+def make_client(address, disconnected_callback, device=None):
+    """返回 BleakClient 或接口相同的模拟客户端；device 为扫描得到的 BLEDevice (有则不必再按地址查找)"""
+    if address.startswith("sim:"): return SimulatedClient(address, disconnected_callback)
+    from bleak import BleakClient
+    return BleakClient(device or address, disconnected_callback=disconnected_callback)
+
+class SimulatedClient:
+    """模拟心率带，实现 BleakClient 中用到的部分：async with / start_notify / stop_notify / is_connected"""
+    def __init__(self, address, disconnected_callback=None):
+        _, _, qs = address.partition("?")
+        opts = {k: v[-1] for k, v in urllib.parse.parse_qs(qs).items()}
+        self.rate = float(opts.get("rate", 1))           # 每秒通知次数
+        self.jitter = float(opts.get("jitter", 0.02))    # 通知间隔抖动 (秒，标准差)
+        self.drop = float(opts.get("drop", 0))           # 丢包概率
+        self.disconnect = float(opts.get("disconnect", 0)) # 平均断线间隔 (秒)，0 = 不断线
+        self.fail = float(opts.get("fail", 0))           # 连接失败概率 (测试重连退避)
+        self.base_bpm = float(opts.get("bpm", 75))
+        self.with_rr = opts.get("rr", "1") != "0"
+        self.replay = opts.get("file")
+        self.speed = float(opts.get("speed", 1))
+        self.loop = opts.get("loop", "0") != "0"
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self._task = None
+
+    async def __aenter__(self):
+        await asyncio.sleep(0.05) # 模拟连接耗时
+        if random.random() < self.fail: raise OSError("simulated connection failure")
+        self.is_connected = True
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop_notify(HR_CHAR_UUID)
+        self.is_connected = False
+
+    async def start_notify(self, char_uuid, callback):
+        feed = self._replay(callback) if self.replay else self._generate(callback)
+        self._task = asyncio.get_running_loop().create_task(self._run(feed))
+
+    async def stop_notify(self, char_uuid):
+        if self._task and self._task is not asyncio.current_task(): self._task.cancel()
+
+    async def _run(self, feed):
+        try: await feed
+        finally:
+            if self.is_connected:
+                self.is_connected = False
+                if self.disconnected_callback: self.disconnected_callback(self)
+
+    @staticmethod
+    def _packet(bpm, rr):
+        flags = 0x10 if rr else 0x00
+        if bpm > 255: flags |= 0x01
+        return struct.pack(f"<B{'H' if bpm > 255 else 'B'}{len(rr)}H", flags, bpm, *rr)
+
+    async def _generate(self, callback):
+        bpm = self.base_bpm
+        drop_at = time.monotonic() + random.expovariate(1 / self.disconnect) if self.disconnect else None
+        while True:
+            await asyncio.sleep(max(0.0, random.gauss(1 / self.rate, self.jitter)))
+            if drop_at and time.monotonic() >= drop_at: return # 模拟断线
+            bpm = min(200.0, max(40.0, bpm + random.gauss(0, 1.5) + (self.base_bpm - bpm) * 0.05))
+            if random.random() < self.drop: continue
+            rr = (round(60 / bpm * 1024 * random.gauss(1, 0.03)),) if self.with_rr else ()
+            callback(None, bytearray(self._packet(round(bpm), rr)))
+
+    async def _replay(self, callback):
+        """按原始节奏回放会话文件；同一时间戳的多条记录 (多个 RR) 合并为一次通知"""
+        while True:
+            with open(self.replay, "rb") as f: data = f.read()
+            records = list(RECORD.iter_unpack(data[RECORD_HEADER.size:len(data) - (len(data) - RECORD_HEADER.size) % RECORD.size]))
+            prev_t = None
+            i = 0
+            while i < len(records):
+                t, bpm, _ = records[i]
+                rr = []
+                while i < len(records) and records[i][0] == t:
+                    if records[i][2]: rr.append(records[i][2])
+                    i += 1
+                if prev_t is not None: await asyncio.sleep(max(0.0, (t - prev_t) / self.speed))
+                prev_t = t
+                callback(None, bytearray(self._packet(bpm, tuple(rr))))
+            if not self.loop: return
+
+# --- 3.7 延迟统计 ---
+class LatencyTracker:
+    """每个环节保留最近 N 个延迟样本 (环形缓冲区)，查询时才排序求分位数，记录只是 O(1) 写入"""
+    def __init__(self, size=2048):
+        self.size = size
+        self.hops = {}
+
+    def record(self, hop, seconds):
+        buf = self.hops.get(hop)
+        if buf is None: buf = self.hops[hop] = RingBuffer(self.size)
+        buf.append(0.0, seconds * 1000)
+
+    def summary(self):
+        result = {}
+        for hop, buf in list(self.hops.items()):
+            values = sorted(buf.values[:buf.size])
+            if not values: continue
+            result[hop] = {
+                "count": buf.size,
+                "p50_ms": round(values[len(values) // 2], 3),
+                "p99_ms": round(values[min(len(values) - 1, len(values) * 99 // 100)], 3),
+                "max_ms": round(values[-1], 3),
+            }
+        return result
+
+latency = LatencyTracker()
+
+# --- 3.8 运行指标 (Prometheus 文本格式，/metrics) ---
+# 热路径上只做整数加一或一次直方图 observe；计数器直接挂在各对象上 (DeviceSession.notifications 等)，
+# 只有被抓取时才汇总、格式化。
+CONNECT_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30)
+RECONNECT_BUCKETS = (1, 3, 5, 10, 30, 60, 120, 300, 600)
+SCAN_BUCKETS = (1, 2, 5, 10, 20)
+HTTP_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+# Histogram / _prom_value / _prom_labels / PromText 在 HR-Sync-2-mc.py 里各有一份、一字不差 (两个脚本都要能单独拷走运行)，
+# 改时两边一起改；tests/test_metrics.py 检查两份没有改岔
+class Histogram:
+    """固定桶直方图：observe 是一次二分查找 + 几次加法，导出时再累加成 Prometheus 的累计桶"""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1) # 最后一格是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """进程级指标：BLE 连接/扫描耗时、Web 请求数与耗时、SSE 在线数 (都只在 Hub 事件循环中更新)"""
+    def __init__(self):
+        self.connect_seconds = Histogram(CONNECT_BUCKETS)     # 单次连接握手耗时
+        self.reconnect_seconds = Histogram(RECONNECT_BUCKETS) # 掉线到重新连上的时长
+        self.scan_seconds = Histogram(SCAN_BUCKETS)
+        self.first_bpm_seconds = Histogram(CONNECT_BUCKETS)   # 开始连接到收到第一个样本
+        self.http_requests = {} # (路由, 状态码) -> 次数
+        self.http_seconds = {}  # 路由 -> Histogram
+        self.sse_clients = 0
+
+    def observe_request(self, route, status, seconds=None):
+        key = (route, status)
+        self.http_requests[key] = self.http_requests.get(key, 0) + 1
+        if seconds is None: return # SSE 长连接不计耗时
+        hist = self.http_seconds.get(route)
+        if hist is None: hist = self.http_seconds[route] = Histogram(HTTP_BUCKETS)
+        hist.observe(seconds)
+
+metrics = Metrics()
+
+def _prom_value(value):
+    if value == math.inf: return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _prom_labels(labels):
+    if not labels: return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+class PromText:
+    """拼接 Prometheus 文本格式 (0.0.4)"""
+    def __init__(self):
+        self.lines = []
+
+    def add(self, name, kind, help, samples):
+        """samples: [(标签 dict, 值)]"""
+        self.lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        self.lines += [f"{name}{_prom_labels(labels)} {_prom_value(value)}" for labels, value in samples]
+
+    def histogram(self, name, help, items):
+        """items: [(标签 dict, Histogram)]"""
+        self.lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        for labels, hist in items:
+            cumulative = 0
+            for bound, count in zip(hist.bounds + (math.inf,), list(hist.counts)):
+                cumulative += count
+                self.lines.append(f"{name}_bucket{_prom_labels({**labels, 'le': _prom_value(float(bound))})} {cumulative}")
+            self.lines.append(f"{name}_sum{_prom_labels(labels)} {_prom_value(hist.sum)}")
+            self.lines.append(f"{name}_count{_prom_labels(labels)} {cumulative}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+# --- 3.9 推送到网关 (网关不用再穿透 NAT 来轮询本机) ---
+# 网关 HR-Sync-2-mc.py 的 INGEST_PORT 提供 POST /ingest/<玩家>，用 Bearer 令牌认证。
+PUSH_MIN_INTERVAL = 0.25 # 秒，两次请求的最小间隔；心跳快时期间到达的样本合并成一批
+PUSH_TIMEOUT = 5.0
+PUSH_RETRY_DELAY = 3.0
+PUSH_MAX_PENDING = 600   # 网关不可达时最多积压的样本数 (丢弃最旧的)
+
+class PushClient:
+    """把一个设备的样本推送到网关：一条 HTTP/1.1 长连接，同一时间只有一个请求在途，
+    请求期间到达的样本攒成下一批一起发。在 Hub 事件循环中运行。"""
+    def __init__(self, url, token, device=None):
+        parts = urllib.parse.urlsplit(url)
+        self.url = url
+        self.ssl = parts.scheme == "https"
+        self.host, self.port = parts.hostname, parts.port or (443 if self.ssl else 80)
+        self.netloc = parts.netloc
+        self.path = parts.path or "/"
+        self.token = token
+        self.device = device # None = 主设备
+        self.pending = []
+        self.subscription = None
+        self.reader = self.writer = None
+        self.batches = self.samples = self.errors = 0
+        self.task = None
+
+    def start(self, hub):
+        hub.start()
+        hub.loop.call_soon_threadsafe(lambda: setattr(self, "task", hub.loop.create_task(self.run())))
+
+    def _accept(self, sample):
+        """总线过滤 (发布方线程)：只收目标设备的新样本"""
+        if sample.kind != "hr" or not sample.connected or not sample.bpm: return False
+        session = hub.get(self.device)
+        return session is not None and sample.device == session.id
+
+    def _take(self):
+        self.pending += [{"hr": sample.bpm, "ts": round(sample.ts, 3)} for sample in self.subscription.drain()]
+        del self.pending[:-PUSH_MAX_PENDING]
+
+    async def run(self):
+        self.subscription = bus.subscribe_async("push", PUSH_MAX_PENDING, self._accept)
+        print(f"📤 推送到网关: {self.url}")
+        failing = False
+        try:
+            while True:
+                if not self.pending: await self.subscription.wait()
+                self._take()
+                batch, self.pending = self.pending, []
+                t0 = time.monotonic()
+                try:
+                    await self._post(batch)
+                except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+                    self.errors += 1
+                    if not failing: print(f"推送失败: {e}，{PUSH_RETRY_DELAY:g} 秒后重试")
+                    failing = True
+                    self.pending[:0] = batch # 放回队首，下次连同新样本一起发
+                    del self.pending[:-PUSH_MAX_PENDING]
+                    await asyncio.sleep(PUSH_RETRY_DELAY)
+                    continue
+                if failing: print("📤 推送已恢复")
+                failing = False
+                self.batches += 1
+                self.samples += len(batch)
+                await asyncio.sleep(max(0.0, t0 + PUSH_MIN_INTERVAL - time.monotonic()))
+        finally:
+            self.subscription.close()
+            self._close()
+
+    async def _post(self, batch):
+        body = json.dumps({"samples": batch}).encode()
+        head = (f"POST {self.path} HTTP/1.1\r\nHost: {self.netloc}\r\nAuthorization: Bearer {self.token}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode("latin-1")
+        for attempt in (0, 1):
+            reused = self.writer is not None
+            try:
+                if not reused:
+                    self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.ssl or None), PUSH_TIMEOUT)
+                self.writer.write(head + body)
+                await self.writer.drain()
+                status, headers = await asyncio.wait_for(self._read_response(), PUSH_TIMEOUT)
+            except (OSError, EOFError, asyncio.TimeoutError):
+                self._close()
+                if reused and not attempt: continue # 空闲的长连接可能已被对端关闭，换新连接重试一次
+                raise
+            if headers.get("connection", "").lower() == "close": self._close()
+            if status >= 300: raise ValueError(f"网关返回 HTTP {status}")
+            return
+
+    async def _read_response(self):
+        lines = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length: await self.reader.readexactly(length)
+        return status, headers
+
+    def _close(self):
+        if self.writer: self.writer.close()
+        self.reader = self.writer = None
+
+pusher = None # 配置了 push 时的 PushClient
+
+def start_push(url, token, device=None):
+    global pusher
+    pusher = PushClient(url, token, device)
+    pusher.start(hub)
+    return pusher
+
+# --- 3.10 本地输出 (OBS 文本源 / 叠加层 / 本机工具) ---
+# 不用浏览器源每秒轮询 /api/hr：文本文件只在内容变化时原子替换 (OBS 文本源勾选"从文件读取")，
+# UDP / Unix 套接字每个样本发一个 JSON 数据报。每个输出一个线程订阅总线，interval 为两次写入的最小间隔 (秒)，
+# 间隔内到达的样本只保留最新的一个。
+OUTPUT_DISCONNECTED = "--" # 断开 (或连上后还没有样本) 时文本文件的内容
+
+class OutputSink:
+    """输出的公共部分：订阅 -> 限频 -> emit(sample)。emit 返回 False 表示内容没变、没有写"""
+    def __init__(self, name, interval=0.0, device=None):
+        self.name = name
+        self.interval = interval
+        self.device = device # None = 主设备
+        self.writes = self.errors = 0
+        self.subscription = None
+
+    def _accept(self, sample):
+        if sample.device is None: return False # 扫描状态
+        session = hub.get(self.device)
+        return session is not None and sample.device == session.id
+
+    def start(self):
+        self.subscription = bus.subscribe(self.name, 4, self._accept)
+        threading.Thread(target=self._run, name=f"output {self.name}", daemon=True).start()
+        return self
+
+    def _run(self):
+        next_at, failing = 0.0, False
+        while True:
+            sample = self.subscription.get()
+            if sample is None: return
+            delay = next_at - time.monotonic()
+            if delay > 0: time.sleep(delay)
+            sample = (self.subscription.drain() or [sample])[-1]
+            try:
+                if not self.emit(sample): continue
+            except (OSError, KeyError, IndexError, ValueError, TypeError) as e: # 写入失败或模板套不上当前数据：计数后继续
+                self.errors += 1
+                if not failing: print(f"输出 {self.name} 失败: {e}")
+                failing = True
+                continue
+            failing = False
+            self.writes += 1
+            next_at = time.monotonic() + self.interval
+            if sample.kind == "hr": latency.record("output", time.perf_counter() - sample.t_rx)
+
+    def close(self):
+        if self.subscription: self.subscription.close()
+
+class FileOutput(OutputSink):
+    """文本文件：format 为 str.format 模板 (字段同 /api/hr，如 "{hr}"、"{hr} bpm {zone_color}")，
+    或 "json" 写完整快照。先写临时文件再 os.replace，读取方不会读到写了一半的内容"""
+    def __init__(self, path, format="{hr}", interval=0.0, device=None):
+        super().__init__(f"file:{path}", interval, device)
+        self.path = path
+        self.format = format
+        self.last = None
+        try: self.render(Sample("status", "", 0, bpm=1, connected=True, data=EMPTY_SNAPSHOT)) # 模板写错在启动时就报出来
+        except (KeyError, IndexError) as e: raise ValueError(f"模板中没有这个字段: {e}") from None
+        except (ValueError, TypeError) as e: raise ValueError(f"模板无法渲染 (数据不足时 HRV 等字段为 null，不能用数值格式): {e}") from None
+
+    def render(self, sample):
+        if self.format == "json": return json.dumps({"connected": sample.connected, **sample.data}, ensure_ascii=False)
+        return self.format.format(**sample.data) if sample.connected and sample.bpm else OUTPUT_DISCONNECTED
+
+    def emit(self, sample):
+        text = self.render(sample)
+        if text == self.last: return False
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: f.write(text)
+        os.replace(tmp, self.path) # Windows 上读取方正好打开着文件时会失败，下一个样本再写
+        self.last = text
+        return True
+
+class DatagramOutput(OutputSink):
+    """每个样本一个 JSON 数据报 ({"device", "seq", "connected", **快照})。address 为 "主机:端口" (UDP) 或套接字路径 (Unix)；
+    没有程序在收时直接丢弃"""
+    def __init__(self, address, unix=False, interval=0.0, device=None):
+        super().__init__(f"{'unix' if unix else 'udp'}:{address}", interval, device)
+        if unix:
+            if not hasattr(socket, "AF_UNIX"): raise ValueError("此系统不支持 Unix 套接字，请改用 udp")
+            self.sock, self.target = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM), address
+        else:
+            host, _, port = address.rpartition(":")
+            if not port.isdigit(): raise ValueError(f"UDP 地址应为 主机:端口: {address}")
+            host = host.strip("[]") or "127.0.0.1"
+            family, _, _, _, self.target = socket.getaddrinfo(host, int(port), type=socket.SOCK_DGRAM)[0][:5]
+            self.sock = socket.socket(family, socket.SOCK_DGRAM)
+            if family == socket.AF_INET: self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1) # 允许发到广播地址
+        self.sock.setblocking(False)
+
+    def emit(self, sample):
+        payload = json.dumps({"device": sample.device, "seq": sample.seq, "connected": sample.connected, **sample.data}, separators=(",", ":"))
+        try: self.sock.sendto(payload.encode(), self.target)
+        except (ConnectionRefusedError, FileNotFoundError, BlockingIOError): return False # 没有接收方 / 接收方太慢
+        return True
+
+    def close(self):
+        super().close()
+        self.sock.close()
+
+outputs = [] # 已启动的本地输出
+
+def make_output(spec):
+    """{"type": "file", "path": "hr.txt", "format": "{hr}"} / {"type": "udp", "address": "127.0.0.1:9999"} / {"type": "unix", "path": "/tmp/hr.sock"}，
+    都可以加 "interval" (秒) 与 "device" """
+    kind, common = spec.get("type"), {"interval": float(spec.get("interval") or 0), "device": spec.get("device")}
+    if kind == "file": return FileOutput(spec["path"], spec.get("format") or "{hr}", **common)
+    if kind == "udp": return DatagramOutput(spec["address"], **common)
+    if kind == "unix": return DatagramOutput(spec["path"], unix=True, **common)
+    raise ValueError(f"未知的输出类型: {kind}")
+
+def start_outputs(specs):
+    hub.start()
+    for spec in specs:
+        try: sink = make_output(spec)
+        except (ValueError, KeyError, IndexError, TypeError, OSError) as e:
+            print(f"输出配置无效，已跳过 {spec}: {e}")
+            continue
+        outputs.append(sink.start())
+        print(f"📝 本地输出: {sink.name}" + (f" (最多每 {sink.interval:g} 秒一次)" if sink.interval else ""))
+    return outputs
 
 # --- 4. Web Server 配置 ---
-flask_app = Flask(__name__)
 WEB_PORT = 8088
+SSE_KEEPALIVE = 15 # 秒，无数据时发送注释行，防止代理断开空闲连接
+LONG_POLL_MAX = 30 # 秒，/api/hr?since=&wait= 单次最多挂起的时间
 
 # HTML 模板
 HTML_TEMPLATE = """
@@ -53,357 +1319,422 @@ HTML_TEMPLATE = """
     </div>
     <div class="footer">Real-time Heart Rate</div>
     <script>
-        function updateHeartRate() {
-            fetch('/api/hr').then(r => r.json()).then(data => {
-                const hrDisplay = document.getElementById('hr-display');
-                const heart = document.getElementById('heart');
-                if (data.hr > 0) {
-                    hrDisplay.innerText = data.hr;
-                    hrDisplay.style.color = "#2ECC71";
-                    heart.classList.remove('beat'); void heart.offsetWidth; heart.classList.add('beat');
-                } else {
-                    hrDisplay.innerText = "--"; hrDisplay.style.color = "grey";
-                }
-            }).catch(e => console.error(e));
+        function render(data) {
+            const hrDisplay = document.getElementById('hr-display');
+            const heart = document.getElementById('heart');
+            if (data.hr > 0) {
+                hrDisplay.innerText = data.hr;
+                hrDisplay.style.color = data.zone_color || "#2ECC71";
+                heart.classList.remove('beat'); void heart.offsetWidth; heart.classList.add('beat');
+            } else {
+                hrDisplay.innerText = "--"; hrDisplay.style.color = "grey";
+            }
+        }
+        function longPoll(seq) {
+            // 有新样本立即返回，没有则服务端最多挂起 25 秒
+            fetch('/api/hr?since=' + seq + '&wait=25').then(r => r.json())
+                .then(data => { render(data); longPoll(data.seq); })
+                .catch(e => { console.error(e); setTimeout(() => longPoll(-1), 1000); });
+        }
+        if (window.EventSource) {
+            // 服务端推送：每次蓝牙通知到达即刷新 (断线后浏览器会自动重连)
+            const es = new EventSource('/api/hr/stream');
+            es.onmessage = e => render(JSON.parse(e.data));
+        } else {
+            longPoll(-1); // 旧浏览器回退为长轮询
         }
-        setInterval(updateHeartRate, 1000);
     </script>
 </body>
 </html>
 """
 
-@flask_app.route('/')
-def index(): return render_template_string(HTML_TEMPLATE)
+# --- 4.1 异步 HTTP 服务 (与 BLE 共用 Hub 事件循环) ---
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+STREAMED = object() # 处理函数已自行写出响应 (SSE)，连接随后关闭
 
-@flask_app.route('/api/hr')
-def get_hr(): global hr_value; return jsonify({"hr": hr_value})
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "keep_alive", "writer")
 
-def run_flask():
-    print(f"Web Server 正在启动... 监听端口 {WEB_PORT}")
-    try:
-        flask_app.run(host='::', port=WEB_PORT, debug=False, use_reloader=False, threaded=True)
-    except Exception as e:
-        print(f"Web Server 启动失败 (IPv6): {e}")
-        try:
-            flask_app.run(host='0.0.0.0', port=WEB_PORT, debug=False, use_reloader=False, threaded=True)
-        except Exception as e2: print(f"Web Server 启动彻底失败: {e2}")
-
-
-# --- 5. [美化版] 桌面显示小组件 ---
-class HRWidget(ctk.CTkToplevel):
-    def __init__(self, master):
-        super().__init__(master)
-        self.withdraw()
-        self.overrideredirect(True) 
-        self.attributes('-topmost', True) 
-        # 设置透明背景色
-        self.wm_attributes("-transparentcolor", "#000001") 
-        self.config(bg="#000001") 
-
-        # 主容器
-        self.display_frame = ctk.CTkFrame(self, fg_color="#000001")
-        self.display_frame.pack(padx=0, pady=0)
-
-        # 布局容器：横向排列 [心形] [数字]
-        self.content_box = ctk.CTkFrame(self.display_frame, fg_color="#000001")
-        self.content_box.pack()
-
-        # 心形图标
-        self.label_heart = ctk.CTkLabel(
-            self.content_box, 
-            text="❤️", 
-            font=("Segoe UI Emoji", 32), 
-            text_color="#FF3B30", # 苹果红
-            bg_color="#000001"
-        )
-        self.label_heart.pack(side="left", padx=(0, 5), pady=0) 
-
-        # 数字容器 (包含数值和单位)
-        self.text_box = ctk.CTkFrame(self.content_box, fg_color="#000001")
-        self.text_box.pack(side="left")
-
-        # 心率数值
-        self.label_hr = ctk.CTkLabel(
-            self.text_box, 
-            text="---", 
-            font=("Impact", 48), # 使用 Impact 字体更有 HUD 的感觉，如果没有则回退
-            text_color="#2ECC71", 
-            bg_color="#000001"
-        )
-        self.label_hr.pack(side="left", anchor="s") # 底部对齐
-
-        # BPM 单位 (小一点)
-        self.label_unit = ctk.CTkLabel(
-            self.text_box,
-            text=" BPM",
-            font=("Arial", 14, "bold"),
-            text_color="#888888",
-            bg_color="#000001"
-        )
-        self.label_unit.pack(side="left", anchor="s", pady=(0, 8)) # 稍微抬高一点
-
-        # 绑定拖动事件
-        for widget in [self.display_frame, self.content_box, self.text_box, self.label_heart, self.label_hr, self.label_unit]:
-            widget.bind('<ButtonPress-1>', self._start_drag)
-            widget.bind('<B1-Motion>', self._do_drag)
-        
-        self.heart_size_toggle = False
-        self._animate_heart() 
-
-    def _start_drag(self, event):
-        self._offsetx = event.x
-        self._offsety = event.y
-
-    def _do_drag(self, event):
-        x = self.winfo_x() + event.x - self._offsetx
-        y = self.winfo_y() + event.y - self._offsety
-        self.geometry(f"+{x}+{y}")
-
-    def _animate_heart(self):
-        # 获取基准大小
-        try:
-            base_size = int(self.master.size_slider.get())
-        except:
-            base_size = 48
-
-        icon_size = int(base_size * 0.7)
-        
-        if self.heart_size_toggle:
-            self.label_heart.configure(font=("Segoe UI Emoji", icon_size + 4)) 
-        else:
-            self.label_heart.configure(font=("Segoe UI Emoji", icon_size)) 
-        
-        self.heart_size_toggle = not self.heart_size_toggle
-        self.after(500, self._animate_heart)
-
-    def get_color_by_zone(self, hr):
-        """根据心率区间返回颜色"""
-        if hr < 100: return "#2ECC71" # 绿色 (轻松)
-        if hr < 120: return "#F1C40F" # 黄色 (燃脂)
-        if hr < 140: return "#E67E22" # 橙色 (耐力)
-        return "#E74C3C"              # 红色 (极限)
-
-    def update_hr_display(self, hr_val, custom_color, size_val):
-        font_size = int(size_val)
-        
-        if hr_val > 0:
-            # 如果用户没填自定义颜色，则使用动态区间颜色
-            if not self.master.color_entry.get():
-                display_color = self.get_color_by_zone(hr_val)
-            else:
-                display_color = custom_color
-
-            self.label_hr.configure(
-                text=str(hr_val), 
-                text_color=display_color, 
-                font=("Impact", font_size)
-            )
-            self.label_heart.configure(text_color="#FF3B30") # 心形始终红色
-            self.label_unit.configure(text_color=display_color)
-        else:
-            self.label_hr.configure(text="---", text_color="grey")
-            self.label_heart.configure(text_color="grey")
-            self.label_unit.configure(text_color="grey")
-        
-        self.update_idletasks()
+    def __init__(self, head, writer):
+        lines = head.decode("latin-1").split("\r\n")
+        self.method, target, version = lines[0].split(" ", 2)
+        self.path, _, qs = target.partition("?")
+        self.query = {k: v[-1] for k, v in urllib.parse.parse_qs(qs).items()}
+        self.headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                self.headers[name.strip().lower()] = value.strip()
+        connection = self.headers.get("connection", "").lower()
+        self.keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        self.writer = writer
+
+    def arg(self, name, type=str, default=None):
+        try: return type(self.query[name]) if name in self.query else default
+        except ValueError: return default
+
+def json_response(obj, status=200):
+    return status, {"Content-Type": "application/json", "Cache-Control": "no-store"}, json.dumps(obj).encode()
+
+class StaticPage:
+    """预渲染、预压缩的页面：启动时编码一次，之后每个请求只是写出现成的字节"""
+    def __init__(self, html):
+        self.body = html.encode("utf-8")
+        self.gzip_body = gzip.compress(self.body, 9, mtime=0)
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()[:16]
 
+    def respond(self, req):
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if req.headers.get("if-none-match") == self.etag: return 304, headers, b""
+        headers["Content-Type"] = "text/html; charset=utf-8"
+        if "gzip" in req.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return 200, headers, self.gzip_body
+        return 200, headers, self.body
 
-# --- 6. 主控制面板应用程序 ---
-class HRControlApp(ctk.CTk):
+class WebServer:
+    """极简 HTTP/1.1 服务器：asyncio 协程处理连接，支持 keep-alive 与 SSE，没有每请求线程"""
     def __init__(self):
-        super().__init__()
-        self.title("心率助手 v4.1 (HUD版)")
-        self.geometry("380x680") 
-        self.resizable(False, False)
-        
-        self.current_hr_color = "#2ECC71"
-        self.device_list = {} 
-        self.ble_loop = None 
-        self.stop_event = None 
-        self.web_server_started = False
-        self.ipv6_address = self._get_global_ipv6()
-        
-        self.toggle_display_var = ctk.BooleanVar(value=True) 
-        self.hr_widget = HRWidget(self)
-        self._setup_ui()
-        self.after(500, self._check_status_update) 
-        self.protocol("WM_DELETE_WINDOW", self._on_closing)
-
-    def _get_global_ipv6(self):
-        try:
-            info = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET6)
-            candidates = []
-            for item in info:
-                ip = item[4][0]
-                if "%" in ip: ip = ip.split("%")[0]
-                if not ip.startswith("fe80") and not ip == "::1": candidates.append(ip)
-            for ip in candidates:
-                if ip.startswith("2"): return ip 
-            return candidates[0] if candidates else None
-        except: return None
-
-    def _get_local_ipv4(self):
+        self.routes = {}
+        self.prefix_routes = [] # (前缀, 处理函数)，用于 /api/devices/<ID> 这类路径
+        self.server = None
+        self.port = None
+
+    def route(self, path, prefix=False):
+        def decorator(handler):
+            if prefix: self.prefix_routes.append((path, handler))
+            else: self.routes[path] = handler
+            return handler
+        return decorator
+
+    def _find_handler(self, path):
+        """返回 (路由, 处理函数)；路由用作指标标签，未知路径统一记为 other"""
+        handler = self.routes.get(path)
+        if handler is not None: return path, handler
+        return next(((p, h) for p, h in self.prefix_routes if path.startswith(p)), ("other", None))
+
+    async def start(self, port):
+        if self.server: return
+        self.server = await asyncio.start_server(self._serve_client, sock=_listen_socket(port), limit=16384)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Web Server 已启动，监听端口 {self.port}")
+
+    async def _serve_client(self, reader, writer):
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM); s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]; s.close(); return ip
-        except: return "127.0.0.1"
-
-    def _setup_ui(self):
-        # 状态栏
-        status_frame = ctk.CTkFrame(self)
-        status_frame.pack(fill="x", padx=15, pady=(20, 10))
-        self.status_dot = ctk.CTkLabel(status_frame, text="●", font=("Arial", 20), text_color="red")
-        self.status_dot.pack(side="left", padx=(10, 5))
-        self.conn_label = ctk.CTkLabel(status_frame, text="未连接", font=("Segoe UI", 14), text_color="white")
-        self.conn_label.pack(side="left", fill="x", expand=True)
-        self.device_name_label = ctk.CTkLabel(status_frame, text="设备: 无", font=("Segoe UI", 12), text_color="gray")
-        self.device_name_label.pack(side="right", padx=(5, 10))
-        
-        # 连接控制
-        ctk.CTkLabel(self, text="设备连接", font=("Segoe UI", 16, "bold")).pack(pady=(10, 5))
-        self.scan_button = ctk.CTkButton(self, text="① 扫描设备", command=self._start_scan)
-        self.scan_button.pack(pady=5, padx=20, fill="x")
-        self.device_combo = ctk.CTkComboBox(self, values=["请先扫描"], state="disabled")
-        self.device_combo.pack(pady=5, padx=20, fill="x")
-        self.connect_button = ctk.CTkButton(self, text="② 连接选中设备", command=self._start_connect, state="disabled", fg_color="blue", hover_color="#4169e1")
-        self.connect_button.pack(pady=(5, 10), padx=20, fill="x")
-
-        # IPv6 Web
-        ctk.CTkFrame(self, height=2, fg_color="#444444").pack(fill="x", padx=20, pady=10)
-        ctk.CTkLabel(self, text=f"远程访问 (端口 {WEB_PORT})", font=("Segoe UI", 16, "bold")).pack(pady=(5, 5))
-        self.web_switch = ctk.CTkSwitch(self, text="开启 Web 服务", command=self._toggle_web_server)
-        self.web_switch.pack(pady=5)
-        self.url_entry = ctk.CTkEntry(self, placeholder_text="服务未开启")
-        self.url_entry.pack(pady=5, padx=20, fill="x")
-        self.url_entry.configure(state="readonly")
-        self.copy_btn = ctk.CTkButton(self, text="复制链接", command=self._copy_url, fg_color="gray", state="disabled")
-        self.copy_btn.pack(pady=5)
-        ctk.CTkLabel(self, text=f"提示: 确保防火墙放行端口 {WEB_PORT}", font=("Segoe UI", 11), text_color="gray").pack()
-
-        # 显示控制
-        ctk.CTkFrame(self, height=2, fg_color="#444444").pack(fill="x", padx=20, pady=10)
-        ctk.CTkLabel(self, text="HUD 显示控制", font=("Segoe UI", 16, "bold")).pack(pady=(5, 5))
-        self.toggle_switch = ctk.CTkSwitch(self, text="桌面悬浮窗", command=self._toggle_display, width=60, variable=self.toggle_display_var)
-        self.toggle_switch.pack(pady=5)
-        
-        ctk.CTkLabel(self, text="大小调整", font=("Segoe UI", 12)).pack(pady=2)
-        self.size_slider = ctk.CTkSlider(self, from_=30, to=120, number_of_steps=90, command=self._on_size_change)
-        self.size_slider.set(60)
-        self.size_slider.pack(pady=5, padx=20, fill="x")
-
-        ctk.CTkLabel(self, text="固定颜色 (留空则启用动态区间色)", font=("Segoe UI", 12)).pack(pady=5)
-        color_frame = ctk.CTkFrame(self, fg_color="transparent")
-        color_frame.pack(fill="x", padx=20)
-        self.color_entry = ctk.CTkEntry(color_frame, placeholder_text="例如: #00FF00")
-        self.color_entry.pack(side="left", fill="x", expand=True, padx=(0, 10))
-        ctk.CTkButton(color_frame, text="应用", command=self._apply_custom_color, width=60).pack(side="right")
-
-        ctk.CTkButton(self, text="退出软件", command=self._on_closing, fg_color="red", hover_color="#c0392b").pack(pady=(20, 10), padx=20, fill="x")
-
-    # 逻辑部分保持精简
-    def _toggle_web_server(self):
-        if self.web_switch.get() == 1:
-            self.ipv6_address = self._get_global_ipv6()
-            if not self.web_server_started:
-                flask_app.config['BIND_IP'] = self.ipv6_address if self.ipv6_address else "0.0.0.0"
-                threading.Thread(target=run_flask, daemon=True).start()
-                self.web_server_started = True
-            
-            if self.ipv6_address:
-                url = f"http://[{self.ipv6_address}]:{WEB_PORT}"
-                self.copy_btn.configure(state="normal", fg_color="green", text="复制 IPv6 链接")
-            else:
-                url = f"http://{self._get_local_ipv4()}:{WEB_PORT}"
-                self.copy_btn.configure(state="normal", fg_color="#AA5500", text="复制内网链接")
-            self.url_entry.configure(state="normal"); self.url_entry.delete(0, "end"); self.url_entry.insert(0, url); self.url_entry.configure(state="readonly")
-        else:
-            self.url_entry.configure(state="normal"); self.url_entry.delete(0, "end"); self.url_entry.insert(0, "服务已暂停"); self.url_entry.configure(state="readonly"); self.copy_btn.configure(state="disabled", fg_color="gray")
-
-    def _copy_url(self):
-        self.clipboard_clear(); self.clipboard_append(self.url_entry.get()); self.copy_btn.configure(text="已复制！"); self.after(2000, lambda: self.copy_btn.configure(text="复制链接"))
-
-    def _toggle_display(self):
-        if self.toggle_display_var.get(): self.hr_widget.deiconify()
-        else: self.hr_widget.withdraw()
-    def _on_size_change(self, value): self.hr_widget.update_hr_display(hr_value, self.current_hr_color, value)
-    def _apply_custom_color(self): self.current_hr_color = self.color_entry.get(); self.hr_widget.update_hr_display(hr_value, self.current_hr_color, self.size_slider.get())
-    
-    def _check_status_update(self):
-        if is_scanning: self.status_dot.configure(text_color="yellow"); self.conn_label.configure(text="正在扫描...")
-        elif is_connected: self.status_dot.configure(text_color="#00FF00"); self.conn_label.configure(text="已连接")
-        else: self.status_dot.configure(text_color="red"); self.conn_label.configure(text="未连接")
-        self.hr_widget.update_hr_display(hr_value, self.current_hr_color, self.size_slider.get())
-        self.after(200, self._check_status_update)
-
-    def _start_scan(self):
-        global is_scanning
-        if is_scanning: return
-        self.device_combo.set("扫描中..."); self.scan_button.configure(state="disabled", text="扫描中..."); is_scanning = True
-        threading.Thread(target=self._run_ble_loop_for_scan, daemon=True).start()
-
-    def _start_connect(self):
-        global current_device_address
-        selected_name = self.device_combo.get()
-        if selected_name not in self.device_list: return
-        current_device_address = self.device_list[selected_name]
-        self.connect_button.configure(state="disabled", text="连接中..."); self.scan_button.configure(state="disabled")
-        threading.Thread(target=self._run_ble_loop_for_connect, daemon=True).start()
-
-    def _run_ble_loop_for_scan(self):
-        loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop); loop.run_until_complete(self._scan_devices()); loop.close()
-
-    async def _scan_devices(self):
-        global is_scanning; self.device_list = {}
+            while True:
+                try: head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError): break
+                try: req = Request(head, writer)
+                except ValueError:
+                    writer.write(_response_head(400, {}, 0, False)); break
+                # 目前的接口都不需要请求体：带请求体的直接拒绝并断开，不读取 (否则一个大 Content-Length 就能占住连接)
+                length = req.headers.get("content-length", "0").strip()
+                if not length.isdigit():
+                    writer.write(_response_head(400, {}, 0, False)); break
+                if int(length) or "transfer-encoding" in req.headers:
+                    writer.write(_response_head(413, {}, 0, False)); break
+                t0 = time.perf_counter()
+                route, handler = self._find_handler(req.path)
+                if req.method not in ("GET", "HEAD"): result = json_response({"error": "method not allowed"}, 405)
+                elif handler is None: result = json_response({"error": "not found"}, 404)
+                else: result = await handler(req)
+                if result is STREAMED:
+                    metrics.observe_request(route, 200)
+                    break
+                status, headers, body = result
+                writer.write(_response_head(status, headers, len(body), req.keep_alive))
+                if req.method != "HEAD" and body: writer.write(body)
+                await writer.drain()
+                metrics.observe_request(route, status, time.perf_counter() - t0)
+                if not req.keep_alive: break
+        except ConnectionError:
+            pass
+        except Exception as e:
+            print(f"Web error: {e}")
+        finally:
+            writer.close()
+
+def _response_head(status, headers, length, keep_alive):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    lines.append(f"Content-Length: {length}")
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+def _listen_socket(port):
+    """优先 IPv6 双栈 (同时接受 IPv4)，失败时回退到纯 IPv4。
+    显式指定 IPPROTO_TCP：asyncio 只对 proto 为 TCP 的连接开 TCP_NODELAY，否则 keep-alive 上
+    响应头和正文两次写入会被 Nagle + 延迟确认卡住约 40 ms"""
+    try:
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM, socket.IPPROTO_TCP)
         try:
-            devices = await BleakScanner.discover(timeout=5.0)
-            for device in devices:
-                name = device.name or "Unknown"
-                if "iqoo" in name.lower() or "watch" in name.lower():
-                    self.device_list[f"{name} ({device.address})"] = device.address
-        except Exception as e: print(f"Scan error: {e}")
-        self.after(0, self._update_scan_results); is_scanning = False
-
-    def _update_scan_results(self):
-        names = list(self.device_list.keys())
-        self.device_combo.configure(values=names, state="normal")
-        if names: self.device_combo.set(names[0]); self.connect_button.configure(state="normal")
-        else: self.device_combo.set("未找到设备")
-        self.scan_button.configure(state="normal", text="① 扫描设备")
-
-    def _run_ble_loop_for_connect(self):
-        loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop); self.ble_loop = loop; self.stop_event = asyncio.Event()
-        try: loop.run_until_complete(self._connect_and_read_hr())
-        finally: loop.close(); self.ble_loop = None
-
-    async def _handle_hr_data(self, sender, data):
-        global hr_value
-        flags = data[0]
-        hr_value = struct.unpack('<H', data[1:3])[0] if flags & 0x1 else struct.unpack('<B', data[1:2])[0]
-
-    async def _connect_and_read_hr(self):
-        global ble_client, is_connected, hr_value
-        while not self.stop_event.is_set():
-            try:
-                print(f"Connecting to {current_device_address}...")
-                async with BleakClient(current_device_address) as client:
-                    ble_client = client; is_connected = True
-                    self.after(0, lambda: self.device_name_label.configure(text=f"设备: {self.device_combo.get()}"))
-                    self.after(0, lambda: self.connect_button.configure(text="已连接", state="disabled"))
-                    await client.start_notify(HR_CHAR_UUID, self._handle_hr_data)
-                    while not self.stop_event.is_set() and client.is_connected: await asyncio.sleep(1)
-                    await client.stop_notify(HR_CHAR_UUID)
-            except asyncio.CancelledError: break
-            except Exception as e:
-                print(f"Error: {e}"); is_connected = False; hr_value = 0
-                self.after(0, lambda: self.connect_button.configure(text="连接断开，3秒后重试..."))
-                if not self.stop_event.is_set(): await asyncio.sleep(3)
-        is_connected = False; hr_value = 0; ble_client = None
-        self.after(0, lambda: [self.connect_button.configure(state="normal", text="② 连接选中设备"), self.scan_button.configure(state="normal"), self.device_name_label.configure(text="设备: 无")])
-
-    def _on_closing(self):
-        if self.ble_loop and self.ble_loop.is_running() and self.stop_event: self.ble_loop.call_soon_threadsafe(self.stop_event.set)
-        self.after(100, lambda: [self.hr_widget.destroy(), self.destroy(), sys.exit()])
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            if os.name != "nt": sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("::", port))
+        except OSError:
+            sock.close(); raise
+    except OSError as e:
+        print(f"Web Server IPv6 绑定失败，改用 IPv4: {e}")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        if os.name != "nt": sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("0.0.0.0", port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+web = WebServer()
+index_page = StaticPage(HTML_TEMPLATE)
+
+@web.route('/')
+async def index(req): return index_page.respond(req)
+
+def _requested_session(req):
+    """?device=<ID> 指定设备，缺省为主设备；返回 (session, 错误响应)"""
+    device_id = req.arg('device')
+    session = hub.get(device_id)
+    if device_id and session is None: return None, json_response({"error": "unknown device"}, 404)
+    return session, None
+
+@web.route('/api/hr')
+async def get_hr(req):
+    """当前样本，带单调递增的 seq 与样本时间 ts。
+    If-None-Match 与当前 ETag 相同时返回 304；?since=<seq>&wait=<秒> 为长轮询：
+    seq 仍等于 since 时最多挂起 wait 秒，期间有新样本立即返回 (since 与当前不同则立即返回，例如服务重启后)"""
+    session, error = _requested_session(req)
+    if error: return error
+    broadcaster = session.broadcaster if req.arg('device') else hub.broadcaster
+    since, wait = req.arg('since', int), min(req.arg('wait', float, 0.0), LONG_POLL_MAX)
+    if since is not None and wait > 0: await broadcaster.wait(since, wait)
+    etag = broadcaster.etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if req.headers.get("if-none-match") == etag: return 304, headers, b""
+    headers["Content-Type"] = "application/json"
+    return 200, headers, broadcaster.body()
+
+@web.route('/api/devices')
+async def list_devices(req): return json_response([s.info() for s in list(hub.devices.values())])
+
+@web.route('/api/devices/', prefix=True)
+async def get_device(req):
+    device_id = urllib.parse.unquote(req.path[len('/api/devices/'):])
+    session = hub.get(device_id) if device_id else None
+    if session is None: return json_response({"error": "unknown device"}, 404)
+    return json_response(session.info())
+
+def _history_range(req):
+    t_to = req.arg('to', float, time.time())
+    t_from = req.arg('from', float, t_to - 3600)
+    return t_from, t_to
+
+def _history_device(req):
+    """?device= 指定设备，默认主设备 (与 /api/hr 一致)；多个人的记录混在一起没有意义"""
+    return req.arg('device') or (hub.primary.id if hub.primary else None)
+
+@web.route('/api/hr/history')
+async def get_history(req):
+    t_from, t_to = _history_range(req)
+    # 读文件 + 降采样放到线程池，不阻塞 BLE 回调
+    result = await asyncio.get_running_loop().run_in_executor(None, query_history, t_from, t_to, req.arg('step', float), _history_device(req))
+    return json_response(result)
+
+def _history_csv(t_from, t_to, device_id):
+    lines = ["timestamp,bpm,rr_ms\n"]
+    for t, bpm, rr in iter_records(t_from, t_to, device_id):
+        lines.append(f"{t:.3f},{bpm},{round(rr * 1000 / 1024) if rr else ''}\n")
+    return "".join(lines).encode()
+
+@web.route('/api/hr/history.csv')
+async def export_history_csv(req):
+    """导出原始记录，供离线分析 (与 /api/hr/history 读取同一批会话文件)"""
+    t_from, t_to = _history_range(req)
+    body = await asyncio.get_running_loop().run_in_executor(None, _history_csv, t_from, t_to, _history_device(req))
+    return 200, {"Content-Type": "text/csv", "Content-Disposition": 'attachment; filename="hr_history.csv"'}, body
+
+@web.route('/api/hr/analysis')
+async def get_analysis(req):
+    """一段时间内的区间时间 / TRIMP / 千卡 / 剔除的异常值 (按 PROFILE 重新计算)"""
+    t_from, t_to = _history_range(req)
+    result = await asyncio.get_running_loop().run_in_executor(None, analyze_history, t_from, t_to, _history_device(req))
+    return json_response(result)
+
+@web.route('/api/latency')
+async def get_latency(req):
+    """各环节延迟 (ms)：parse = BLE 回调内处理, sse = 接收到推送写出, hud = 接收到 HUD 重绘, output = 接收到本地输出写完"""
+    return json_response(latency.summary())
+
+def render_metrics():
+    out = PromText()
+    sessions = list(hub.devices.values())
+    now = time.time()
+    dev = lambda s: {"device": s.id}
+    out.add("hr_uptime_seconds", "gauge", "Seconds since the process started.", [({}, time.perf_counter() - _T_START)])
+    out.add("hr_device_connected", "gauge", "1 if the BLE device is connected.", [({"device": s.id, "name": s.name}, int(s.connected)) for s in sessions])
+    out.add("hr_notifications_total", "counter", "Heart rate notifications received (rate() = notifications per second).", [(dev(s), s.notifications) for s in sessions])
+    out.add("hr_last_sample_age_seconds", "gauge", "Seconds since the last heart rate sample.", [(dev(s), now - s.stats.ts) for s in sessions if s.stats.ts])
+    out.add("hr_heart_rate_bpm", "gauge", "Latest heart rate (0 while disconnected).", [(dev(s), s.stats.bpm) for s in sessions])
+    out.add("hr_rejected_samples_total", "counter", "Samples dropped by the analytics stage as out of range or outliers.", [(dev(s), s.stages[0].rejected) for s in sessions if s.stages and hasattr(s.stages[0], "rejected")])
+    out.add("hr_reconnects_total", "counter", "Connection losses or failed connection attempts.", [(dev(s), s.reconnects) for s in sessions])
+    out.add("hr_connect_errors_total", "counter", "Connection attempts that ended with an error.", [(dev(s), s.errors) for s in sessions])
+    out.histogram("hr_connect_duration_seconds", "Time to establish a BLE connection.", [({}, metrics.connect_seconds)])
+    out.histogram("hr_reconnect_duration_seconds", "Time from losing a device to being connected again.", [({}, metrics.reconnect_seconds)])
+    out.histogram("hr_scan_duration_seconds", "BLE scan duration.", [({}, metrics.scan_seconds)])
+    out.histogram("hr_time_to_first_bpm_seconds", "Time from starting a connection to its first heart rate sample.", [({}, metrics.first_bpm_seconds)])
+    out.add("hr_http_requests_total", "counter", "HTTP requests by route and status.", [({"route": r, "status": st}, n) for (r, st), n in list(metrics.http_requests.items())])
+    out.histogram("hr_http_request_duration_seconds", "HTTP request handling time (SSE excluded).", [({"route": r}, h) for r, h in list(metrics.http_seconds.items())])
+    out.add("hr_sse_clients", "gauge", "Open Server-Sent Events connections.", [({}, metrics.sse_clients)])
+    subscribers = bus.subscribers
+    out.add("hr_bus_subscribers", "gauge", "Sample bus subscribers (HUD, push, per-device streams).", [({}, len(subscribers))])
+    out.add("hr_bus_dropped_samples_total", "counter", "Samples dropped because a subscriber queue was full.", [({"subscriber": sub.name}, sub.dropped) for sub in subscribers if isinstance(sub, Subscription)])
+    if pusher:
+        out.add("hr_push_batches_total", "counter", "Batches delivered to the gateway.", [({}, pusher.batches)])
+        out.add("hr_push_samples_total", "counter", "Samples delivered to the gateway.", [({}, pusher.samples)])
+        out.add("hr_push_errors_total", "counter", "Failed push requests.", [({}, pusher.errors)])
+        queued = len(pusher.subscription.queue) if pusher.subscription else 0
+        out.add("hr_push_pending", "gauge", "Samples waiting to be pushed.", [({}, len(pusher.pending) + queued)])
+    if outputs:
+        out.add("hr_output_writes_total", "counter", "Local output writes (file replaced / datagram sent).", [({"output": o.name}, o.writes) for o in outputs])
+        out.add("hr_output_errors_total", "counter", "Local output write errors.", [({"output": o.name}, o.errors) for o in outputs])
+    hops = latency.summary()
+    out.add("hr_pipeline_latency_seconds", "gauge", "Recent in-process latency per hop (parse, sse, hud, output).",
+            [({"hop": hop, "quantile": q}, st[key] / 1000) for hop, st in hops.items() for q, key in (("0.5", "p50_ms"), ("0.99", "p99_ms"))])
+    return out.text()
+
+@web.route('/metrics')
+async def get_metrics(req):
+    """Prometheus 抓取入口"""
+    return 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8", "Cache-Control": "no-store"}, render_metrics().encode()
+
+@web.route('/api/hr/stream')
+async def stream_hr(req):
+    """Server-Sent Events：每个新样本推送一次，替代 1 秒轮询"""
+    session, error = _requested_session(req)
+    if error: return error
+    broadcaster = session.broadcaster if req.arg('device') else hub.broadcaster
+    writer = req.writer
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nX-Accel-Buffering: no\r\nConnection: close\r\n\r\n")
+    seq = -1 # 首次立即推送当前值
+    metrics.sse_clients += 1
+    try:
+        while True:
+            new_seq, _ = await broadcaster.wait(seq, SSE_KEEPALIVE)
+            if new_seq == seq:
+                writer.write(b": keepalive\n\n")
+                await writer.drain()
+                continue
+            first, seq, t_rx = seq < 0, new_seq, broadcaster.t_rx
+            writer.write(broadcaster.message())
+            await writer.drain() # 慢客户端只拖慢自己，恢复后直接跳到最新样本
+            if t_rx and not first: latency.record("sse", time.perf_counter() - t_rx) # 连接时补发的旧样本不计入
+    except ConnectionError:
+        pass
+    finally:
+        metrics.sse_clients -= 1
+    return STREAMED
+
+def start_web_server(port=None):
+    """在 Hub 事件循环上启动 Web 服务 (线程安全)，返回 concurrent.futures.Future"""
+    hub.start()
+    return asyncio.run_coroutine_threadsafe(web.start(WEB_PORT if port is None else port), hub.loop)
+
+
+# --- 5. 启动入口 ---
+DEFAULT_CONFIG = {"devices": [], "web": True, "port": WEB_PORT, "record": True, "push": None, "auto_connect": True, "profile": {}, "outputs": []}
+
+def load_config(path):
+    """JSON 配置，例如 {"devices": ["AA:BB:CC:DD:EE:FF", {"address": "...", "name": "队友A"}], "web": true, "port": 8088, "record": true,
+    "push": {"url": "http://网关:8090/ingest/玩家ID", "token": "...", "device": "可选，默认主设备"},
+    "profile": {"hr_rest": 55, "hr_max": 185, "zones": null},
+    "outputs": [{"type": "file", "path": "obs_hr.txt", "format": "{hr}", "interval": 1}, {"type": "udp", "address": "127.0.0.1:9999"}]}
+    (profile 的键见 PROFILE，outputs 见 make_output)"""
+    with open(path, encoding="utf-8") as f: cfg = json.load(f)
+    unknown = set(cfg) - set(DEFAULT_CONFIG)
+    if unknown: print(f"配置文件中有未知的键，已忽略: {', '.join(sorted(unknown))}")
+    return cfg
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="心率助手：BLE 心率 -> 桌面 HUD / Web")
+    parser.add_argument("--headless", action="store_true", help="无界面服务模式：只运行 BLE + Web，不加载 GUI 模块")
+    parser.add_argument("--config", help="JSON 配置文件 (命令行参数优先)")
+    parser.add_argument("--device", action="append", default=[], metavar="ADDRESS", help="启动后直接连接的设备地址，可重复；sim:... 为模拟设备")
+    parser.add_argument("--simulate", type=int, default=0, metavar="N", help="添加 N 个模拟心率带 (等同于 --device sim:1 ... sim:N)")
+    parser.add_argument("--port", type=int, help=f"Web 端口 (默认 {WEB_PORT})")
+    parser.add_argument("--no-web", action="store_true", help="无界面模式下不启动 Web 服务")
+    parser.add_argument("--no-record", action="store_true", help="不记录会话文件")
+    parser.add_argument("--no-auto-connect", action="store_true", help="未指定设备时不自动连接上次使用的设备")
+    parser.add_argument("--push", metavar="URL", help="把心率推送到网关，例如 http://网关:8090/ingest/玩家ID")
+    parser.add_argument("--push-token", help="推送令牌 (也可用环境变量 HR_PUSH_TOKEN，避免出现在进程列表里)")
+    parser.add_argument("--output-file", action="append", default=[], metavar="PATH", help="把心率写入文本文件 (内容变化时原子替换)，供 OBS 文本源读取，可重复")
+    parser.add_argument("--output-format", default="{hr}", help='--output-file 的内容模板 (默认 "{hr}")，"json" 为完整快照')
+    parser.add_argument("--output-udp", action="append", default=[], metavar="HOST:PORT", help="每个样本发一个 JSON UDP 数据报，可重复")
+    parser.add_argument("--output-unix", action="append", default=[], metavar="PATH", help="每个样本发一个 JSON 数据报到 Unix 套接字，可重复")
+    parser.add_argument("--output-interval", type=float, default=0.0, metavar="SEC", help="上面这些输出两次写入的最小间隔 (秒)")
+    parser.add_argument("--startup-check", action="store_true", help="启动完成后打印耗时并立即退出，用于检查启动耗时预算")
+    return parser.parse_args(argv)
+
+def build_config(args):
+    global WEB_PORT, RECORD_ENABLED
+    cfg = dict(DEFAULT_CONFIG)
+    if args.config: cfg.update(load_config(args.config))
+    devices = [d if isinstance(d, dict) else {"address": d} for d in cfg["devices"]]
+    devices += [{"address": d} for d in args.device]
+    devices += [{"address": f"sim:{i}?rate=1", "name": f"模拟设备 {i}"} for i in range(1, args.simulate + 1)]
+    if args.port is not None: cfg["port"] = args.port
+    if args.no_web: cfg["web"] = False
+    if args.no_record: cfg["record"] = False
+    if args.no_auto_connect: cfg["auto_connect"] = False
+    if not devices and cfg["auto_connect"] and not args.startup_check:
+        known = load_known_devices()
+        if known:
+            devices = [{"address": known[0]["address"], "name": known[0].get("name")}]
+            print(f"🔁 自动连接上次的设备: {known[0].get('name') or known[0]['address']}")
+    cfg["devices"] = devices
+    if args.push: cfg["push"] = {"url": args.push}
+    if cfg["push"]:
+        cfg["push"] = dict(cfg["push"])
+        cfg["push"]["token"] = args.push_token or cfg["push"].get("token") or os.environ.get("HR_PUSH_TOKEN", "")
+    cfg["outputs"] = list(cfg["outputs"] or [])
+    cfg["outputs"] += [{"type": "file", "path": p, "format": args.output_format, "interval": args.output_interval} for p in args.output_file]
+    cfg["outputs"] += [{"type": "udp", "address": a, "interval": args.output_interval} for a in args.output_udp]
+    cfg["outputs"] += [{"type": "unix", "path": p, "interval": args.output_interval} for p in args.output_unix]
+    WEB_PORT = cfg["port"]
+    RECORD_ENABLED = cfg["record"]
+    PROFILE.update(cfg["profile"] or {})
+    return cfg
+
+def report_startup(mode):
+    heavy = [m for m in ("customtkinter", "bleak", "numpy") if m in sys.modules]
+    print(f"⏱️ 启动耗时 {(time.perf_counter() - _T_START) * 1000:.0f} ms ({mode} 模式，已加载: {', '.join(heavy) or '无重型模块'})")
+
+def run_headless(cfg, startup_check=False):
+    hub.start()
+    for dev in cfg["devices"]: hub.connect(dev["address"], dev.get("name"))
+    if cfg["web"]:
+        try: start_web_server().result(timeout=10)
+        except Exception as e: print(f"Web Server 启动失败: {e}")
+    if cfg["push"]: start_push(**cfg["push"])
+    if cfg["outputs"]: start_outputs(cfg["outputs"])
+    report_startup("headless")
+    if startup_check: return
+    if not cfg["devices"]: print("⚠️ 未指定设备：使用 --device 或配置文件中的 devices 指定心率设备地址")
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt:
+        print("停止运行")
+        hub.stop()
+
+def main(argv=None):
+    args = parse_args(argv)
+    cfg = build_config(args)
+    if args.headless:
+        run_headless(cfg, args.startup_check)
+        return
+    # hr_gui 通过 "import hr" 访问核心状态；以脚本运行时本模块名为 __main__，先登记别名避免加载第二份
+    sys.modules.setdefault("hr", sys.modules[__name__])
+    import hr_gui
+    for dev in cfg["devices"]: hub.connect(dev["address"], dev.get("name"))
+    if cfg["push"]: start_push(**cfg["push"])
+    if cfg["outputs"]: start_outputs(cfg["outputs"])
+    hr_gui.run(startup_check=args.startup_check)
 
 if __name__ == "__main__":
-    ctk.set_appearance_mode("Dark"); ctk.set_default_color_theme("blue")
-    gui_app = HRControlApp(); gui_app.mainloop()
\ No newline at end of file
+    main()
@@ -0,0 +1,387 @@
+"""心率助手的桌面界面 (HUD 悬浮窗 + 控制面板)。
+由 hr.py 在 GUI 模式下按需导入，无界面模式不会加载 customtkinter。"""
+import customtkinter as ctk
+import tkinter
+import os
+import sys
+import time
+import socket
+import threading
+from collections import deque
+import hr
+
+# --- 1. [美化版] 桌面显示小组件 ---
+HUD_STATS = os.environ.get("HR_HUD_STATS") == "1" # 定期打印 HUD 重绘次数与耗时，用于确认开销
+HUD_STATS_INTERVAL = 10000 # ms
+SCAN_POLL_INTERVAL = 50 # ms，扫描期间在界面线程里取新发现设备的间隔
+
+class HRWidget(ctk.CTkToplevel):
+    def __init__(self, master):
+        super().__init__(master)
+        self.withdraw()
+        self.overrideredirect(True) 
+        self.attributes('-topmost', True) 
+        # 设置透明背景色 (仅 Windows 支持；其他系统上 HUD 保留深色背景)
+        try: self.wm_attributes("-transparentcolor", "#000001")
+        except tkinter.TclError: pass
+        self.config(bg="#000001") 
+
+        # 主容器
+        self.display_frame = ctk.CTkFrame(self, fg_color="#000001")
+        self.display_frame.pack(padx=0, pady=0)
+
+        # 布局容器：横向排列 [心形] [数字]
+        self.content_box = ctk.CTkFrame(self.display_frame, fg_color="#000001")
+        self.content_box.pack()
+
+        # 心形图标
+        self.label_heart = ctk.CTkLabel(
+            self.content_box, 
+            text="❤️", 
+            font=("Segoe UI Emoji", 32), 
+            text_color="#FF3B30", # 苹果红
+            bg_color="#000001"
+        )
+        self.label_heart.pack(side="left", padx=(0, 5), pady=0) 
+
+        # 数字容器 (包含数值和单位)
+        self.text_box = ctk.CTkFrame(self.content_box, fg_color="#000001")
+        self.text_box.pack(side="left")
+
+        # 心率数值
+        self.label_hr = ctk.CTkLabel(
+            self.text_box, 
+            text="---", 
+            font=("Impact", 48), # 使用 Impact 字体更有 HUD 的感觉，如果没有则回退
+            text_color="#2ECC71", 
+            bg_color="#000001"
+        )
+        self.label_hr.pack(side="left", anchor="s") # 底部对齐
+
+        # BPM 单位 (小一点)
+        self.label_unit = ctk.CTkLabel(
+            self.text_box,
+            text=" BPM",
+            font=("Arial", 14, "bold"),
+            text_color="#888888",
+            bg_color="#000001"
+        )
+        self.label_unit.pack(side="left", anchor="s", pady=(0, 8)) # 稍微抬高一点
+
+        # HRV (RMSSD)，设备不发送 RR 间期时为空
+        self.label_hrv = ctk.CTkLabel(
+            self.display_frame,
+            text="",
+            font=("Arial", 12),
+            text_color="#888888",
+            bg_color="#000001"
+        )
+        self.label_hrv.pack(anchor="e")
+
+        # 绑定拖动事件
+        for widget in [self.display_frame, self.content_box, self.text_box, self.label_heart, self.label_hr, self.label_unit, self.label_hrv]:
+            widget.bind('<ButtonPress-1>', self._start_drag)
+            widget.bind('<B1-Motion>', self._do_drag)
+        
+        self._fonts = {}     # (字体, 字号, 粗细) -> CTkFont，避免每次重建字体
+        self._rendered = {}  # 控件 -> 上次 configure 的属性
+        self.icon_size = 32
+        self.heart_size_toggle = False
+        self._anim_job = None
+        self.updates = self.redraws = self.configures = 0
+        self.redraw_time = 0.0
+        if HUD_STATS: self.after(HUD_STATS_INTERVAL, self._report_stats)
+
+    def _start_drag(self, event):
+        self._offsetx = event.x
+        self._offsety = event.y
+
+    def _do_drag(self, event):
+        x = self.winfo_x() + event.x - self._offsetx
+        y = self.winfo_y() + event.y - self._offsety
+        self.geometry(f"+{x}+{y}")
+
+    def _font(self, family, size, weight="normal"):
+        key = (family, size, weight)
+        font = self._fonts.get(key)
+        if font is None: font = self._fonts[key] = ctk.CTkFont(family=family, size=size, weight=weight)
+        return font
+
+    def _set(self, widget, **kwargs):
+        """只把真正变化的属性交给 configure"""
+        last = self._rendered.setdefault(widget, {})
+        changed = {k: v for k, v in kwargs.items() if last.get(k) != v}
+        if changed:
+            widget.configure(**changed)
+            last.update(changed)
+            self.configures += 1
+
+    def _animate_heart(self):
+        # 只在有心率时跳动；字体对象按字号缓存，不会每次重建
+        size = self.icon_size + 4 if self.heart_size_toggle else self.icon_size
+        self._set(self.label_heart, font=self._font("Segoe UI Emoji", size))
+        self.heart_size_toggle = not self.heart_size_toggle
+        self._anim_job = self.after(500, self._animate_heart)
+
+    def _report_stats(self):
+        avg = self.redraw_time / self.updates * 1000 if self.updates else 0.0
+        print(f"HUD: {HUD_STATS_INTERVAL // 1000} 秒内通知 {self.updates} 次, 实际重绘 {self.redraws} 次, configure {self.configures} 次, 平均 {avg:.3f} ms")
+        self.updates = self.redraws = self.configures = 0
+        self.redraw_time = 0.0
+        self.after(HUD_STATS_INTERVAL, self._report_stats)
+
+    def get_color_by_zone(self, bpm):
+        """根据心率区间返回颜色 (区间与 Web 页面共用 hr.PROFILE)"""
+        return hr.zone_color(bpm)
+
+    def update_hr_display(self, hr_val, custom_color, size_val, hrv=None):
+        t0 = time.perf_counter()
+        configures = self.configures
+        font_size = int(size_val)
+        self.icon_size = int(font_size * 0.7)
+        hr_font = self._font("Impact", font_size)
+
+        if hr_val > 0:
+            # 如果用户没有应用自定义颜色，则使用动态区间颜色
+            display_color = custom_color or self.get_color_by_zone(hr_val)
+            self._set(self.label_hr, text=str(hr_val), text_color=display_color, font=hr_font)
+            self._set(self.label_heart, text_color="#FF3B30") # 心形始终红色
+            self._set(self.label_unit, text_color=display_color)
+            self._set(self.label_hrv, text=f"HRV {hrv:.0f} ms" if hrv is not None else "")
+        else:
+            self._set(self.label_hr, text="---", text_color="grey", font=hr_font)
+            self._set(self.label_heart, text_color="grey", font=self._font("Segoe UI Emoji", self.icon_size))
+            self._set(self.label_unit, text_color="grey")
+            self._set(self.label_hrv, text="")
+
+        if hr_val > 0 and self._anim_job is None:
+            self._animate_heart()
+        elif hr_val <= 0 and self._anim_job is not None:
+            self.after_cancel(self._anim_job)
+            self._anim_job = None
+
+        self.updates += 1
+        if self.configures != configures: self.redraws += 1
+        self.redraw_time += time.perf_counter() - t0
+
+
+# --- 2. 主控制面板应用程序 ---
+class HRControlApp(ctk.CTk):
+    def __init__(self):
+        super().__init__()
+        self.title("心率助手 v4.1 (HUD版)")
+        self.geometry("380x680") 
+        self.resizable(False, False)
+        
+        self.current_hr_color = "" # 空 = 动态区间色
+        self.device_list = {} 
+        self.web_server_started = False
+        self.ipv6_address = self._get_global_ipv6()
+        
+        self.toggle_display_var = ctk.BooleanVar(value=True) 
+        self.hr_widget = HRWidget(self)
+        self._setup_ui()
+        self._show_known_devices()
+        self._refresh_pending = False
+        self._last_status = None
+        self._last_t_rx = 0.0
+        # BLE 线程只往队列里放样本；由这个线程去唤醒 Tk (跨线程调用 Tk 会一直等到主循环处理)
+        self.samples = hr.bus.subscribe("hud", maxsize=8)
+        threading.Thread(target=self._pump, daemon=True).start()
+        hr.hub.start()
+        self.after(0, self._refresh)
+        self.protocol("WM_DELETE_WINDOW", self._on_closing)
+
+    def _get_global_ipv6(self):
+        try:
+            info = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET6)
+            candidates = []
+            for item in info:
+                ip = item[4][0]
+                if "%" in ip: ip = ip.split("%")[0]
+                if not ip.startswith("fe80") and not ip == "::1": candidates.append(ip)
+            for ip in candidates:
+                if ip.startswith("2"): return ip 
+            return candidates[0] if candidates else None
+        except: return None
+
+    def _get_local_ipv4(self):
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM); s.connect(("8.8.8.8", 80))
+            ip = s.getsockname()[0]; s.close(); return ip
+        except: return "127.0.0.1"
+
+    def _setup_ui(self):
+        # 状态栏
+        status_frame = ctk.CTkFrame(self)
+        status_frame.pack(fill="x", padx=15, pady=(20, 10))
+        self.status_dot = ctk.CTkLabel(status_frame, text="●", font=("Arial", 20), text_color="red")
+        self.status_dot.pack(side="left", padx=(10, 5))
+        self.conn_label = ctk.CTkLabel(status_frame, text="未连接", font=("Segoe UI", 14), text_color="white")
+        self.conn_label.pack(side="left", fill="x", expand=True)
+        self.device_name_label = ctk.CTkLabel(status_frame, text="设备: 无", font=("Segoe UI", 12), text_color="gray")
+        self.device_name_label.pack(side="right", padx=(5, 10))
+        
+        # 连接控制
+        ctk.CTkLabel(self, text="设备连接", font=("Segoe UI", 16, "bold")).pack(pady=(10, 5))
+        self.scan_button = ctk.CTkButton(self, text="① 扫描设备", command=self._start_scan)
+        self.scan_button.pack(pady=5, padx=20, fill="x")
+        self.device_combo = ctk.CTkComboBox(self, values=["请先扫描"], state="disabled")
+        self.device_combo.pack(pady=5, padx=20, fill="x")
+        self.connect_button = ctk.CTkButton(self, text="② 连接选中设备", command=self._start_connect, state="disabled", fg_color="blue", hover_color="#4169e1")
+        self.connect_button.pack(pady=(5, 10), padx=20, fill="x")
+
+        # IPv6 Web
+        ctk.CTkFrame(self, height=2, fg_color="#444444").pack(fill="x", padx=20, pady=10)
+        ctk.CTkLabel(self, text=f"远程访问 (端口 {hr.WEB_PORT})", font=("Segoe UI", 16, "bold")).pack(pady=(5, 5))
+        self.web_switch = ctk.CTkSwitch(self, text="开启 Web 服务", command=self._toggle_web_server)
+        self.web_switch.pack(pady=5)
+        self.url_entry = ctk.CTkEntry(self, placeholder_text="服务未开启")
+        self.url_entry.pack(pady=5, padx=20, fill="x")
+        self.url_entry.configure(state="readonly")
+        self.copy_btn = ctk.CTkButton(self, text="复制链接", command=self._copy_url, fg_color="gray", state="disabled")
+        self.copy_btn.pack(pady=5)
+        ctk.CTkLabel(self, text=f"提示: 确保防火墙放行端口 {hr.WEB_PORT}", font=("Segoe UI", 11), text_color="gray").pack()
+
+        # 显示控制
+        ctk.CTkFrame(self, height=2, fg_color="#444444").pack(fill="x", padx=20, pady=10)
+        ctk.CTkLabel(self, text="HUD 显示控制", font=("Segoe UI", 16, "bold")).pack(pady=(5, 5))
+        self.toggle_switch = ctk.CTkSwitch(self, text="桌面悬浮窗", command=self._toggle_display, width=60, variable=self.toggle_display_var)
+        self.toggle_switch.pack(pady=5)
+        
+        ctk.CTkLabel(self, text="大小调整", font=("Segoe UI", 12)).pack(pady=2)
+        self.size_slider = ctk.CTkSlider(self, from_=30, to=120, number_of_steps=90, command=self._on_size_change)
+        self.size_slider.set(60)
+        self.size_slider.pack(pady=5, padx=20, fill="x")
+
+        ctk.CTkLabel(self, text="固定颜色 (留空则启用动态区间色)", font=("Segoe UI", 12)).pack(pady=5)
+        color_frame = ctk.CTkFrame(self, fg_color="transparent")
+        color_frame.pack(fill="x", padx=20)
+        self.color_entry = ctk.CTkEntry(color_frame, placeholder_text="例如: #00FF00")
+        self.color_entry.pack(side="left", fill="x", expand=True, padx=(0, 10))
+        ctk.CTkButton(color_frame, text="应用", command=self._apply_custom_color, width=60).pack(side="right")
+
+        ctk.CTkButton(self, text="退出软件", command=self._on_closing, fg_color="red", hover_color="#c0392b").pack(pady=(20, 10), padx=20, fill="x")
+
+    # 逻辑部分保持精简
+    def _toggle_web_server(self):
+        if self.web_switch.get() == 1:
+            self.ipv6_address = self._get_global_ipv6()
+            if not self.web_server_started:
+                hr.start_web_server()
+                self.web_server_started = True
+            
+            if self.ipv6_address:
+                url = f"http://[{self.ipv6_address}]:{hr.WEB_PORT}"
+                self.copy_btn.configure(state="normal", fg_color="green", text="复制 IPv6 链接")
+            else:
+                url = f"http://{self._get_local_ipv4()}:{hr.WEB_PORT}"
+                self.copy_btn.configure(state="normal", fg_color="#AA5500", text="复制内网链接")
+            self.url_entry.configure(state="normal"); self.url_entry.delete(0, "end"); self.url_entry.insert(0, url); self.url_entry.configure(state="readonly")
+        else:
+            self.url_entry.configure(state="normal"); self.url_entry.delete(0, "end"); self.url_entry.insert(0, "服务已暂停"); self.url_entry.configure(state="readonly"); self.copy_btn.configure(state="disabled", fg_color="gray")
+
+    def _copy_url(self):
+        self.clipboard_clear(); self.clipboard_append(self.url_entry.get()); self.copy_btn.configure(text="已复制！"); self.after(2000, lambda: self.copy_btn.configure(text="复制链接"))
+
+    def _toggle_display(self):
+        if self.toggle_display_var.get(): self.hr_widget.deiconify()
+        else: self.hr_widget.withdraw()
+    def _on_size_change(self, value): self._update_hud(value)
+    def _apply_custom_color(self): self.current_hr_color = self.color_entry.get(); self._update_hud(self.size_slider.get())
+
+    def _update_hud(self, size_val):
+        """HUD 显示主设备 (第一个连接的设备)"""
+        session = hr.hub.primary
+        sample = hr.bus.latest.get(session.id) if session else None
+        if sample: self.hr_widget.update_hr_display(sample.bpm, self.current_hr_color, size_val, sample.data["rmssd"])
+        else: self.hr_widget.update_hr_display(0, self.current_hr_color, size_val)
+
+    def _pump(self):
+        """等总线上的样本，积压的一并丢掉 (重绘时读最新值)"""
+        while self.samples.get() is not None:
+            self.samples.drain()
+            self.notify_update()
+
+    def notify_update(self):
+        """心率或连接状态变化时调用 (可在其他线程中调用)，多次通知合并为一次重绘"""
+        if self._refresh_pending: return
+        self._refresh_pending = True
+        self.after(0, self._refresh)
+
+    def _refresh(self):
+        self._refresh_pending = False
+        sessions = list(hr.hub.devices.values())
+        connected = sum(1 for sn in sessions if sn.connected)
+        retries = max((sn.failures for sn in sessions), default=0)
+        status = ("scanning" if hr.hub.scanning else "connected" if connected else "idle", connected, len(sessions), retries)
+        if status != self._last_status:
+            self._last_status = status
+            if hr.hub.scanning: self.status_dot.configure(text_color="yellow"); self.conn_label.configure(text="正在扫描...")
+            elif connected: self.status_dot.configure(text_color="#00FF00"); self.conn_label.configure(text="已连接" if len(sessions) == 1 else f"已连接 {connected}/{len(sessions)}")
+            elif sessions: self.status_dot.configure(text_color="red"); self.conn_label.configure(text=f"连接断开，正在重连 (第 {retries} 次)..." if retries > 1 else "连接断开，正在重连...")
+            else: self.status_dot.configure(text_color="red"); self.conn_label.configure(text="未连接")
+            names = [sn.name for sn in sessions]
+            self.device_name_label.configure(text=f"设备: {names[0]}" + (f" 等 {len(names)} 个" if len(names) > 1 else "") if names else "设备: 无")
+        self._update_hud(self.size_slider.get())
+        primary = hr.hub.primary
+        sample = hr.bus.latest.get(primary.id) if primary else None
+        if sample and sample.connected and sample.t_rx != self._last_t_rx:
+            self._last_t_rx = sample.t_rx
+            hr.latency.record("hud", time.perf_counter() - self._last_t_rx)
+
+    def _show_known_devices(self):
+        """启动时列出以前连接过的设备，不扫描也能直接点“连接”"""
+        for dev in hr.load_known_devices(): self._add_device(dev.get("name") or "Unknown", dev["address"], "已保存")
+        if self.device_list: self.device_combo.set(next(iter(self.device_list)))
+
+    def _add_device(self, name, address, note=""):
+        label = f"{name} ({address})" + (f" · {note}" if note else "")
+        if any(addr == address for _, addr in self.device_list.values()): return
+        self.device_list[label] = (name, address)
+        self.device_combo.configure(values=list(self.device_list), state="normal")
+        self.connect_button.configure(state="normal")
+
+    def _start_scan(self):
+        if hr.hub.scanning: return
+        self.device_list = {}
+        self.device_combo.configure(values=[]); self.device_combo.set("扫描中..."); self.scan_button.configure(state="disabled", text="扫描中...")
+        # 每发现一个设备就显示出来，找到后扫描会提前结束。BLE 线程只往队列里放，由界面线程来取，不跨线程调用 Tk
+        found = deque()
+        self._poll_scan(found, hr.hub.scan(on_found=lambda name, address: found.append((name, address))))
+
+    def _poll_scan(self, found, future):
+        while found: self._on_device_found(*found.popleft())
+        if future.done(): self._update_scan_results(future.result())
+        else: self.after(SCAN_POLL_INTERVAL, self._poll_scan, found, future)
+
+    def _on_device_found(self, name, address):
+        first = not self.device_list
+        self._add_device(name, address)
+        if first: self.device_combo.set(next(iter(self.device_list)))
+
+    def _start_connect(self):
+        """连接选中设备；可以多次选择不同设备，同时连接多条心率带"""
+        selected_name = self.device_combo.get()
+        if selected_name not in self.device_list: return
+        name, address = self.device_list[selected_name]
+        hr.hub.connect(address, name)
+        self.notify_update()
+
+    def _update_scan_results(self, found):
+        for name, address in found: self._add_device(name, address)
+        if not self.device_list: self.device_combo.set("未找到设备")
+        self.scan_button.configure(state="normal", text="① 扫描设备")
+
+    def _on_closing(self):
+        self.samples.close()
+        hr.hub.stop()
+        self.after(100, lambda: [self.hr_widget.destroy(), self.destroy(), sys.exit()])
+
+def run(startup_check=False):
+    ctk.set_appearance_mode("Dark"); ctk.set_default_color_theme("blue")
+    gui_app = HRControlApp()
+    if startup_check:
+        # 第一次空闲时界面已完成绘制：打印耗时后退出
+        gui_app.after_idle(lambda: [hr.report_startup("GUI"), gui_app._on_closing()])
+    gui_app.mainloop()
@@ -0,0 +1,15 @@
+"""测试共用的网关模块：HR-Sync-2-mc.py 文件名带连字符，不能直接 import。只加载一次，不读取真实的玩家列表文件"""
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_gateway():
+    spec = importlib.util.spec_from_file_location("hr_sync_gateway", os.path.join(ROOT, "HR-Sync-2-mc.py"))
+    module = sys.modules[spec.name] = importlib.util.module_from_spec(spec) # inspect 等按模块名找回源码
+    spec.loader.exec_module(module)
+    module.player_registry.path = None
+    return module
+
+gw = load_gateway()
@@ -0,0 +1,125 @@
+"""分析阶段 (异常值剔除、没有读数) 以及它与 DeviceSession / 样本总线的衔接。
+
+    python -m pytest tests
+"""
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hr
+
+def notification(bpm, *rr, contact=None):
+    flags = 0x10 if rr else 0x00
+    if contact is not None: flags |= 0x04 | (0x02 if contact else 0)
+    return struct.pack(f"<BB{len(rr)}H", flags, bpm, *rr)
+
+class HRAnalyticsTest(unittest.TestCase):
+    def setUp(self):
+        self.stage = hr.HRAnalytics()
+        self.t = 0.0
+
+    def update(self, *values):
+        results = []
+        for bpm in values:
+            self.t += 1.0
+            results.append(self.stage.update(self.t, bpm))
+        return results
+
+    def test_out_of_range_rejected(self):
+        self.assertEqual(self.update(hr.HR_VALID_MIN - 1, hr.HR_VALID_MAX + 1, 80), [None, None, 80])
+        self.assertEqual(self.stage.rejected, 2)
+
+    def test_single_spike_rejected(self):
+        self.assertEqual(self.update(80, 82, 81, 81 + hr.OUTLIER_JUMP + 20, 83), [80, 82, 81, None, 83])
+        self.assertEqual(self.stage.rejected, 1)
+        self.assertEqual(self.stage.bpm, 83)
+
+    def test_sustained_jump_confirmed(self):
+        self.update(80, 81, 80)
+        jump = [150 + i for i in range(hr.OUTLIER_CONFIRM)]
+        results = self.update(*jump)
+        self.assertEqual(results[:-1], [None] * (hr.OUTLIER_CONFIRM - 1))
+        self.assertEqual(results[-1], jump[-1])
+        self.assertEqual(self.update(151), [151]) # 之后以新水平为准
+
+    def test_scattered_suspects_not_confirmed(self):
+        self.update(80, 81, 80)
+        # 连续的疑似值彼此相差超过 OUTLIER_JUMP：是噪声不是真实变化
+        scattered = [150 if i % 2 else 150 + hr.OUTLIER_JUMP + 10 for i in range(hr.OUTLIER_CONFIRM)]
+        self.assertEqual(self.update(*scattered), [None] * hr.OUTLIER_CONFIRM)
+
+    def test_gap_resets_baseline(self):
+        self.update(80, 81, 80)
+        self.stage.gap()
+        self.assertEqual(self.update(160), [160])
+
+class SessionSampleTest(unittest.TestCase):
+    """被剔除的样本不进统计、不发布；没有读数 (0 bpm / 未接触) 发布 0，不算异常值"""
+    def setUp(self):
+        self.session = hr.DeviceSession(hr.hub, f"sim:test-{self.id()}", "test") # 不调用 recorder.start()，不写文件
+        self.session.connected = True
+        self.sub = hr.bus.subscribe("test", accept=lambda sample: sample.device == self.session.id)
+
+    def tearDown(self):
+        self.sub.close()
+
+    def feed(self, *notifications):
+        for data in notifications: self.session._handle_hr_data(None, data)
+        return [sample.bpm for sample in self.sub.drain()]
+
+    def test_outlier_not_published(self):
+        self.assertEqual(self.feed(*(notification(bpm, 800) for bpm in (80, 82, 200, 81))), [80, 82, 81])
+        self.assertEqual(self.session.stats._rr_win.size, 3)
+        self.assertEqual(self.session.stats.samples.size, 3)
+
+    def test_rejected_rr_breaks_adjacency(self):
+        # 800 -> 810 是相邻差；被剔除的通知里的 RR 丢掉后，1000 不能和 810 相减
+        self.feed(notification(80, 800), notification(80, 810), notification(200, 300), notification(81, 1000))
+        self.assertAlmostEqual(self.session.stats.rmssd, 10 * 1000 / 1024)
+
+    def test_zero_bpm_published_as_no_reading(self):
+        published = self.feed(notification(80), notification(81), *[notification(0)] * 5)
+        self.assertEqual(published, [80, 81, 0, 0, 0, 0, 0])
+        self.assertEqual(self.session.stages[0].rejected, 0)
+        self.assertEqual(self.session.snapshot()["hr"], 0)
+        self.assertIsNone(self.session.snapshot()["zone"])
+        # 重新戴好后从新读数开始，不和之前的比较
+        self.assertEqual(self.feed(notification(140)), [140])
+
+    def test_no_contact_published_as_no_reading(self):
+        self.assertEqual(self.feed(notification(80, contact=True), notification(80, contact=False)), [80, 0])
+        self.assertEqual(self.session.stages[0].rejected, 0)
+        self.assertIs(self.session.snapshot()["contact"], False)
+
+class AnalyzeHistoryTest(unittest.TestCase):
+    """回看分析里 0 bpm 也不算异常值 (向量化与逐条两种实现)"""
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.old_dir, hr.RECORD_DIR = hr.RECORD_DIR, self.dir.name
+        self.addCleanup(setattr, hr, "RECORD_DIR", self.old_dir)
+        recorder = hr.SessionRecorder(self.dir.name, "TEST")
+        recorder.start()
+        for i, bpm in enumerate([80, 81, 0, 0, 0, 82, 250, 81]): recorder.add(1000.0 + i, bpm, ())
+        recorder.stop()
+        recorder.join()
+
+    def test_zero_not_counted(self):
+        result = hr.analyze_history(0, 2000, "TEST")
+        self.assertEqual((result["samples"], result["rejected"]), (5, 1))
+
+    def test_zero_not_counted_without_numpy(self):
+        numpy = sys.modules.get("numpy")
+        sys.modules["numpy"] = None # import numpy 抛 ImportError
+        try: result = hr.analyze_history(0, 2000, "TEST")
+        finally:
+            if numpy is None: del sys.modules["numpy"]
+            else: sys.modules["numpy"] = numpy
+        self.assertFalse(result["vectorized"])
+        self.assertEqual((result["samples"], result["rejected"]), (5, 1))
+
+if __name__ == "__main__":
+    unittest.main()
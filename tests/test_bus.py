@@ -0,0 +1,70 @@
+"""样本总线：发布从不等待订阅者 (队列满了丢最旧的并计数)、过滤在发布方执行、close() 唤醒阻塞的 get()。
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hr
+
+class SampleBusTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = hr.SampleBus()
+
+    def test_full_queue_drops_oldest(self):
+        sub = self.bus.subscribe("test", maxsize=3)
+        for bpm in range(60, 66): self.bus.publish("hr", "dev", bpm=bpm)
+        self.assertEqual([s.bpm for s in sub.drain()], [63, 64, 65])
+        self.assertEqual(sub.dropped, 3)
+        self.assertEqual(sub.drain(), [])
+
+    def test_seq_increasing_and_latest_per_device(self):
+        a = self.bus.publish("hr", "a", bpm=70)
+        b = self.bus.publish("hr", "b", bpm=80)
+        self.bus.publish("status") # Hub 本身的状态不计入 latest
+        self.assertLess(a.seq, b.seq)
+        self.assertEqual(self.bus.latest, {"a": a, "b": b})
+
+    def test_accept_filters_on_publisher(self):
+        sub = self.bus.subscribe("test", accept=lambda s: s.device == "a")
+        self.bus.publish("hr", "a", bpm=70)
+        self.bus.publish("hr", "b", bpm=80)
+        self.assertEqual([(s.device, s.bpm) for s in sub.drain()], [("a", 70)])
+        self.assertEqual(sub.dropped, 0)
+
+    def test_close_wakes_get_and_unsubscribes(self):
+        sub = self.bus.subscribe("test")
+        result = []
+        thread = threading.Thread(target=lambda: result.append(sub.get(timeout=5)))
+        thread.start()
+        sub.close()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(result, [None])
+        self.assertEqual(self.bus.subscribers, ())
+
+    def test_get_returns_queued_sample(self):
+        sub = self.bus.subscribe("test")
+        sample = self.bus.publish("hr", "dev", bpm=70)
+        self.assertIs(sub.get(timeout=1), sample)
+        self.assertIsNone(sub.get(timeout=0.01))
+
+    def test_async_subscription_woken_from_other_thread(self):
+        async def run():
+            sub = self.bus.subscribe_async("test")
+            threading.Thread(target=self.bus.publish, args=("hr", "dev"), kwargs={"bpm": 70}).start()
+            await asyncio.wait_for(sub.wait(), 2)
+            return [s.bpm for s in sub.drain()]
+        self.assertEqual(asyncio.run(run()), [70])
+
+    def test_sample_is_read_only(self):
+        sample = self.bus.publish("hr", "dev", bpm=70)
+        with self.assertRaises(AttributeError): sample.bpm = 80
+        with self.assertRaises(AttributeError): sample.extra = 1
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""网关的样本校验：HTTP 源 / MQTT / 推送进来的 {"hr", "ts"} 进入计分板之前的检查。
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gateway import gw
+
+class ReadSampleTest(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(gw.read_sample({"hr": 80, "ts": 1700000000.5}), (80, 1700000000.5))
+        self.assertEqual(gw.read_sample({"hr": 80}), (80, None))
+        self.assertEqual(gw.read_sample({"hr": 0, "ts": 1}), (0, 1)) # 未佩戴，由 update_score 忽略
+
+    def test_float_hr_rounded_for_scoreboard(self):
+        self.assertEqual(gw.read_sample({"hr": 80.6}), (81, None))
+
+    def test_rejects_non_numbers(self):
+        for data in ({"hr": "80"}, {"hr": 80, "ts": "x"}, {"hr": True}, {"hr": None}, {"ts": 1},
+                     {"hr": -5}, {"hr": [80]}, [80], "80", None):
+            with self.subTest(data=data): self.assertIsNone(gw.read_sample(data))
+
+    def test_rejects_nan_and_infinity(self):
+        # json.loads 接受 NaN / Infinity
+        for payload in ('{"hr": NaN}', '{"hr": Infinity}', '{"hr": 80, "ts": NaN}'):
+            with self.subTest(payload=payload): self.assertIsNone(gw.read_sample(json.loads(payload)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""hr.py 中纯逻辑部分的单元测试：通知解析、环形缓冲区、增量 HRV。
+
+    python -m pytest tests
+"""
+import math
+import os
+import statistics
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hr
+
+def to_ms(raw):
+    return raw * 1000 / 1024
+
+class ParseHRMeasurementTest(unittest.TestCase):
+    def test_uint8_bpm_without_optional_fields(self):
+        self.assertEqual(hr.parse_hr_measurement(bytes([0x00, 72])), (72, None, None, ()))
+
+    def test_uint16_bpm(self):
+        self.assertEqual(hr.parse_hr_measurement(struct.pack("<BH", 0x01, 300)), (300, None, None, ()))
+
+    def test_contact_bits(self):
+        # bit 2 = 支持接触检测，bit 1 = 检测到接触；不支持时 bit 1 没有意义
+        self.assertIs(hr.parse_hr_measurement(bytes([0x06, 70]))[1], True)
+        self.assertIs(hr.parse_hr_measurement(bytes([0x04, 70]))[1], False)
+        self.assertIsNone(hr.parse_hr_measurement(bytes([0x02, 70]))[1])
+
+    def test_energy_and_rr(self):
+        data = struct.pack("<BBHHH", 0x18, 65, 1234, 900, 1010)
+        self.assertEqual(hr.parse_hr_measurement(data), (65, None, 1234, (900, 1010)))
+
+    def test_all_flags(self):
+        data = struct.pack("<BHHHHH", 0x1F, 180, 7, 500, 510, 520)
+        self.assertEqual(hr.parse_hr_measurement(data), (180, True, 7, (500, 510, 520)))
+
+    def test_rr_flag_without_values(self):
+        self.assertEqual(hr.parse_hr_measurement(bytes([0x10, 60])), (60, None, None, ()))
+
+class RingBufferTest(unittest.TestCase):
+    def test_append_returns_evicted_value_when_full(self):
+        buf = hr.RingBuffer(3)
+        self.assertEqual([buf.append(i, i * 10) for i in range(3)], [None, None, None])
+        self.assertEqual(buf.append(3, 30), 0)
+        self.assertEqual(buf.append(4, 40), 10)
+        self.assertEqual(buf.size, 3)
+
+    def test_last_is_in_time_order_across_wrap(self):
+        buf = hr.RingBuffer(4)
+        for i in range(7): buf.append(i, i)
+        self.assertEqual(buf.last(3), [(4, 4), (5, 5), (6, 6)])
+        self.assertEqual(buf.last(10), [(3, 3), (4, 4), (5, 5), (6, 6)])
+
+class HRStatsTest(unittest.TestCase):
+    """增量结果与直接按窗口重算的结果比较"""
+    def feed(self, stats, notifications):
+        for i, (bpm, rr) in enumerate(notifications): stats.add(float(i), bpm, None, None, rr)
+
+    def reference(self, rr_values, window):
+        """有效 RR 取最后 window 个算 SDNN；相邻差只取两侧都有效的，取最后 window - 1 个算 RMSSD"""
+        valid, diffs, prev = [], [], None
+        for raw in rr_values:
+            if not hr.RR_MIN <= to_ms(raw) <= hr.RR_MAX:
+                prev = None
+                continue
+            if prev is not None: diffs.append((raw - prev) ** 2)
+            valid.append(raw)
+            prev = raw
+        valid, diffs = valid[-window:], diffs[-(window - 1):]
+        sdnn = to_ms(statistics.stdev(valid)) if len(valid) >= 2 else None
+        rmssd = to_ms(math.sqrt(sum(diffs) / len(diffs))) if diffs else None
+        return sdnn, rmssd
+
+    def test_hrv_matches_brute_force_after_eviction(self):
+        window = 8
+        rr = [800 + (i * 37) % 150 for i in range(40)]
+        rr[13] = 100  # 伪迹：不参与计算，并打断相邻关系
+        rr[27] = 4000
+        stats = hr.HRStats(bpm_window=5, rr_window=window)
+        self.feed(stats, [(70, (raw,)) for raw in rr])
+        sdnn, rmssd = self.reference(rr, window)
+        self.assertAlmostEqual(stats.sdnn, sdnn, places=6)
+        self.assertAlmostEqual(stats.rmssd, rmssd, places=6)
+
+    def test_multiple_rr_per_notification(self):
+        stats = hr.HRStats(rr_window=6)
+        notifications = [(70, (800, 820)), (71, ()), (72, (790, 830, 805)), (73, (815,))]
+        self.feed(stats, notifications)
+        sdnn, rmssd = self.reference([raw for _, rr in notifications for raw in rr], 6)
+        self.assertAlmostEqual(stats.sdnn, sdnn, places=6)
+        self.assertAlmostEqual(stats.rmssd, rmssd, places=6)
+
+    def test_rolling_average_window(self):
+        stats = hr.HRStats(bpm_window=3)
+        self.feed(stats, [(bpm, ()) for bpm in (60, 70, 80, 90, 100)])
+        self.assertAlmostEqual(stats.avg_bpm, 90.0)
+
+    def test_gap_breaks_rr_adjacency(self):
+        stats = hr.HRStats()
+        self.feed(stats, [(70, (800,)), (70, (900,))])
+        stats.mark_gap()
+        stats.add(2.0, 70, None, None, (1000,))
+        self.assertAlmostEqual(stats.rmssd, to_ms(100))
+
+    def test_not_enough_data(self):
+        stats = hr.HRStats()
+        self.assertIsNone(stats.sdnn)
+        self.assertIsNone(stats.rmssd)
+        self.assertEqual(stats.avg_bpm, 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
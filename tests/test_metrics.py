@@ -0,0 +1,42 @@
+"""/metrics 的 Prometheus 文本格式：hr.py 与网关各有一份相同的辅助代码，这里检查两份没有改岔。
+
+    python -m pytest tests
+"""
+import inspect
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hr
+from gateway import gw
+
+class PromTextTest(unittest.TestCase):
+    def test_helpers_identical_in_both_scripts(self):
+        for name in ("Histogram", "_prom_value", "_prom_labels", "PromText"):
+            with self.subTest(name=name): self.assertEqual(inspect.getsource(getattr(hr, name)), inspect.getsource(getattr(gw, name)))
+
+    def test_text_format(self):
+        hist = hr.Histogram((0.1, 1))
+        for value in (0.05, 0.5, 5): hist.observe(value)
+        prom = hr.PromText()
+        prom.add("x_total", "counter", "Things.", [({"player": 'a"b\\c'}, 3), ({}, 0.5)])
+        prom.histogram("x_seconds", "Durations.", [({"phase": "write"}, hist)])
+        self.assertEqual(prom.text().splitlines(), [
+            "# HELP x_total Things.", "# TYPE x_total counter",
+            'x_total{player="a\\"b\\\\c"} 3', "x_total 0.5",
+            "# HELP x_seconds Durations.", "# TYPE x_seconds histogram",
+            'x_seconds_bucket{phase="write",le="0.1"} 1', 'x_seconds_bucket{phase="write",le="1.0"} 2',
+            'x_seconds_bucket{phase="write",le="+Inf"} 3',
+            'x_seconds_sum{phase="write"} 5.55', 'x_seconds_count{phase="write"} 3',
+        ])
+
+    def test_gateway_metrics_render(self):
+        text = gw.render_metrics()
+        self.assertIn("# TYPE hrsync_poll_ticks_total counter\n", text)
+        self.assertIn('hrsync_tick_phase_duration_seconds_bucket{phase="collect",le="+Inf"}', text)
+        self.assertTrue(text.endswith("\n"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""网关的 MQTT 接入：通配订阅的选择，收件箱只解析每个玩家最新的一条、坏数据计数不抛出。
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gateway import gw
+
+class MqttInboxTest(unittest.TestCase):
+    def setUp(self):
+        self.staged = []
+        self.original, gw.update_score = gw.update_score, lambda *args: self.staged.append(args)
+
+    def tearDown(self):
+        gw.update_score = self.original
+
+    def test_bad_payloads_counted_not_raised(self):
+        inbox, errors = gw.MqttInbox(), gw.mqtt_stats['errors']
+        for payload in (b'{"hr": 80, "ts": "x"}', b'not json', b'[1, 2]', b'{"hr": 75, "ts": 5}'):
+            inbox.put(["p1"], payload)
+            inbox.drain()
+        self.assertEqual(self.staged, [("p1", 75, 5)])
+        self.assertEqual(gw.mqtt_stats['errors'] - errors, 3)
+
+    def test_only_latest_message_parsed(self):
+        inbox = gw.MqttInbox()
+        for bpm in (70, 71, 72): inbox.put(["p1"], json.dumps({"hr": bpm}).encode())
+        inbox.drain()
+        self.assertEqual(self.staged, [("p1", 72, None)])
+        self.assertEqual(inbox.coalesced, 2)
+
+class WildcardSubscriptionTest(unittest.TestCase):
+    def test_single_topic_subscribed_directly(self):
+        self.assertEqual(gw.wildcard_subscription(["hr/room/p1"]), "hr/room/p1")
+
+    def test_common_prefix(self):
+        self.assertEqual(gw.wildcard_subscription(["hr/room/p1", "hr/room/p2", "hr/lobby/p3"]), "hr/#")
+
+    def test_no_common_prefix(self):
+        self.assertIsNone(gw.wildcard_subscription(["a/p1", "b/p2"]))
+
+    def test_stops_at_wildcards_and_empty_levels(self):
+        self.assertIsNone(gw.wildcard_subscription(["/p1", "/p2"]))
+        self.assertEqual(gw.wildcard_subscription(["hr/+/p1", "hr/+/p2"]), "hr/#")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""本地输出 (文件 / 数据报)：模板在启动时检查，运行中套不上数据时计入 errors，输出线程继续运行。
+
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hr
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline: time.sleep(0.01)
+    return condition()
+
+class FileOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "hr.txt")
+
+    def test_bad_templates_rejected_at_startup(self):
+        for template in ("{nope}", "{0}", "{hr:q}", "{rmssd:.0f}", "{hr"): # 没有的字段 / 位置参数 / 格式错误 / HRV 为 null / 括号不配对
+            with self.subTest(template=template), self.assertRaises(ValueError): hr.FileOutput(self.path, template)
+
+    def test_start_outputs_skips_invalid_spec(self):
+        started = hr.start_outputs([{"type": "file", "path": self.path, "format": "HRV {rmssd:.0f}"}, {"type": "file"}])
+        self.assertEqual([s for s in started if s.name == f"file:{self.path}"], [])
+
+    def test_render_error_counted_and_thread_survives(self):
+        sink = hr.FileOutput(self.path, "{hr}")
+        sink._accept = lambda sample: sample.device == "test-output"
+        sink.start()
+        self.addCleanup(sink.close)
+        data = {**hr.EMPTY_SNAPSHOT, "hr": 80}
+        sink.format = "{rmssd:.0f}" # 运行中 HRV 为 null
+        hr.bus.publish("hr", "test-output", bpm=80, connected=True, data=data)
+        self.assertTrue(wait_until(lambda: sink.errors == 1))
+        sink.format = "{hr}"
+        hr.bus.publish("hr", "test-output", bpm=80, connected=True, data=data)
+        self.assertTrue(wait_until(lambda: sink.writes == 1))
+        with open(self.path, encoding="utf-8") as f: self.assertEqual(f.read(), "80")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""网关玩家列表文件：校验 (整个文件要么全部有效、要么不用) 与热加载切换。
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gateway import gw
+
+class ValidatePlayersTest(unittest.TestCase):
+    def test_valid(self):
+        players = {"Steve": {"type": "http", "source": "http://[::1]:8088/api/hr"},
+                   "Alex": {"type": "mqtt", "topic": "hr/alex"},
+                   "Bob": {"type": "push", "token": "secret"}}
+        self.assertIs(gw.validate_players(players), players)
+
+    def test_invalid(self):
+        cases = [
+            [],                                                      # 顶层不是对象
+            {"": {"type": "push", "token": "t"}},                    # 空 ID
+            {"Steve heart_rate 0\nop Steve": {"type": "push", "token": "t"}}, # 会被拼进 RCON 指令
+            {"Steve": {"type": "ftp"}},
+            {"Steve": "http://x"},
+            {"Steve": {"type": "http"}},                             # 缺少 source
+            {"Steve": {"type": "mqtt", "topic": 5}},                 # 不是字符串
+            {"Steve": {"type": "mqtt", "topic": ["hr/a"]}},
+            {"Steve": {"type": "http", "source": ""}},
+            {"Steve": {"type": "push"}},                             # 缺少 token
+            {"Steve": {"type": "push", "token": 123}},
+        ]
+        for data in cases:
+            with self.subTest(data=data), self.assertRaises(ValueError): gw.validate_players(data)
+
+class RegistryReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "players.json")
+        self.registry = gw.PlayerRegistry(self.path)
+
+    def write(self, data):
+        with open(self.path, "w", encoding="utf-8") as f: f.write(data if isinstance(data, str) else json.dumps(data))
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 1_000_000)) # 保证修改时间变化
+
+    def test_reload_only_on_change(self):
+        players = {"A": {"type": "mqtt", "topic": "hr/a"}}
+        self.write(players)
+        self.assertEqual(self.registry.check(), players)
+        self.assertIsNone(self.registry.check())
+
+    def test_invalid_file_keeps_current_list(self):
+        self.write('{"A": {"type": "mqtt", "topic": 5}}')
+        self.assertIsNone(self.registry.check())
+        self.write('{"A": ')
+        self.assertIsNone(self.registry.check())
+        self.assertEqual(self.registry.errors, 2)
+
+class ApplyPlayersTest(unittest.TestCase):
+    """切换失败时 PLAYERS_CONFIG 保持不变"""
+    def test_unusable_config_not_swapped(self):
+        current = gw.PLAYERS_CONFIG
+        errors = gw.player_registry.errors
+        gw.apply_players({"A": {"type": "mqtt"}}, poller=None) # 绕过校验：缺少 topic
+        self.assertIs(gw.PLAYERS_CONFIG, current)
+        self.assertEqual(gw.player_registry.errors, errors + 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+"""网关的多进程轮询：工作进程用 spawn 启动，运行中退出后可以随时重新拉起。
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+from gateway import gw
+from stubs import HRSourceStub
+
+class ProcessPollerTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = HRSourceStub()
+        self.addCleanup(self.stub.close)
+        self.poller = gw.ProcessPoller(1, threads=2)
+        self.addCleanup(self.poller.close)
+        self.poller.set_sources({"p1": self.stub.url("p1")})
+
+    def poll(self, seconds=5.0):
+        done, _ = self.poller.poll_round(time.monotonic() + seconds)
+        return [(src.player, outcome) for src, outcome, _, _ in done]
+
+    def test_poll_through_worker(self):
+        self.assertEqual(self.poll(), [("p1", "ok")])
+
+    def test_worker_respawned_after_exit(self):
+        self.assertEqual(self.poll(), [("p1", "ok")])
+        proc = self.poller.workers[0][0]
+        proc.kill()
+        proc.join()
+        self.assertEqual(self.poll(0.2), []) # 本轮发现进程已退出并重新拉起
+        self.assertIsNot(self.poller.workers[0][0], proc)
+        self.assertEqual(self.poll(), [("p1", "ok")]) # 新进程收到原来的数据源
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""网关的 RCON 写入：每轮每个玩家最多一条、值没变不重发、超出时间预算的顺延到下一轮最前面。
+用假的 RCON 连接和假时钟 (每条指令耗时 1 秒)，结果与机器快慢无关。
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gateway import gw
+
+class FakeRcon:
+    def __init__(self, clock):
+        self.clock = clock
+        self.commands = []
+        self.fail = set() # 这些玩家的下一条指令抛出异常 (连接断开)
+
+    def connect(self): pass
+    def disconnect(self): pass
+
+    def command(self, cmd):
+        _, _, _, player, _, value = cmd.split() # scoreboard players set <玩家> heart_rate <值>
+        if player in self.fail:
+            self.fail.discard(player)
+            raise ConnectionResetError("broken pipe")
+        self.clock.now += 1.0
+        self.commands.append((player, int(value)))
+
+class RconWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        clock = types.SimpleNamespace(monotonic=lambda: self.now, perf_counter=time.perf_counter, time=time.time)
+        self.rcon = FakeRcon(self)
+        for patch in (mock.patch.object(gw, "time", clock), mock.patch.object(gw, "MCRcon", lambda *args, **kwargs: self.rcon),
+                      mock.patch.object(gw, "RCON_WRITE_BUDGET", 0)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.writer = gw.RconWriter("127.0.0.1", "test", 25575)
+
+    def flush(self, **values):
+        for player, hr in values.items(): self.writer.stage(player, hr)
+        del self.rcon.commands[:]
+        self.writer.flush()
+        return self.rcon.commands
+
+    def test_latest_value_per_round(self):
+        self.writer.stage("p1", 70)
+        self.assertEqual(self.flush(p1=71), [("p1", 71)])
+        self.assertEqual(self.writer.suppressed, 1)
+
+    def test_unchanged_value_suppressed_until_resend_interval(self):
+        self.assertEqual(self.flush(p1=80), [("p1", 80)])
+        self.assertEqual(self.flush(p1=80), [])
+        self.assertEqual(self.writer.suppressed, 1)
+        self.assertEqual(self.flush(p1=81), [("p1", 81)])
+        self.now += gw.RCON_RESEND_INTERVAL
+        self.assertEqual(self.flush(p1=81), [("p1", 81)]) # 定期重写，防止计分板被手动清掉
+
+    def test_budget_defers_rest_to_front_of_next_round(self):
+        with mock.patch.object(gw, "RCON_WRITE_BUDGET", 2.5):
+            self.assertEqual(self.flush(p1=61, p2=62, p3=63, p4=64, p5=65), [("p1", 61), ("p2", 62), ("p3", 63)])
+            self.assertEqual(self.writer.deferred, 2)
+            # 顺延的排在前面，期间到达的新值覆盖顺延的旧值
+            self.assertEqual(self.flush(p6=66, p4=74), [("p4", 74), ("p5", 65), ("p6", 66)])
+
+    def test_error_requeues_from_failed_player(self):
+        self.rcon.fail.add("p2")
+        self.assertEqual(self.flush(p1=61, p2=62, p3=63), [("p1", 61)])
+        self.assertEqual(self.writer.errors, 1)
+        # 重连后全部重写 (服务器可能重启过)，未写入的仍在前面
+        self.assertEqual(self.flush(p1=61), [("p2", 62), ("p3", 63), ("p1", 61)])
+
+    def test_forget_drops_pending(self):
+        self.writer.stage("p1", 70)
+        self.writer.forget(["p1"])
+        self.assertEqual(self.flush(), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""会话记录：写盘后按时间区间读回、写了一半的尾部记录、历史降采样。
+
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hr
+
+class RecordingTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.old_dir, hr.RECORD_DIR = hr.RECORD_DIR, self.dir.name
+        self.addCleanup(setattr, hr, "RECORD_DIR", self.old_dir)
+
+    def record(self, samples, device="TEST"):
+        """samples: [(时间戳, BPM, (RR, ...))]；返回会话文件路径"""
+        recorder = hr.SessionRecorder(self.dir.name, device)
+        recorder.start()
+        path = recorder.current.path
+        for t, bpm, rr in samples: recorder.add(t, bpm, rr)
+        recorder.stop()
+        recorder.join()
+        return path
+
+    def test_round_trip(self):
+        self.record([(100.0, 70, (800,)), (101.0, 71, (810, 820)), (102.0, 72, ())])
+        self.assertEqual(list(hr.iter_records(0, 1000, "TEST")),
+                         [(100.0, 70, 800), (101.0, 71, 810), (101.0, 71, 820), (102.0, 72, 0)])
+
+    def test_time_range_and_device(self):
+        self.record([(100.0 + i, 70 + i, ()) for i in range(10)])
+        self.record([(103.5, 90, ())], device="OTHER")
+        self.assertEqual([bpm for _, bpm, _ in hr.iter_records(103, 106, "TEST")], [73, 74, 75])
+        self.assertEqual(sorted(bpm for _, bpm, _ in hr.iter_records(103, 104)), [73, 90]) # 不指定设备时读所有文件 (按文件顺序)
+
+    def test_truncated_trailing_record_ignored(self):
+        path = self.record([(100.0, 70, ()), (101.0, 71, ())])
+        with open(path, "ab") as f: f.write(hr.RECORD.pack(102.0, 72, 0)[:5]) # 写到一半时崩溃
+        self.assertEqual([bpm for _, bpm, _ in hr.iter_records(0, 1000, "TEST")], [70, 71])
+        self.assertEqual([p["hr"] for p in hr.query_history(100, 110, 1, "TEST")["points"]], [70, 71])
+
+    def test_history_skips_zero_and_out_of_range(self):
+        self.record([(100.0, 80, ()), (100.5, 0, ()), (101.0, 90, ()), (101.5, hr.HR_VALID_MAX + 1, ()), (103.0, 0, ())])
+        points = hr.query_history(100, 110, 2, "TEST")["points"]
+        self.assertEqual(points, [{"t": 100, "hr": 85.0, "min": 80, "max": 90, "rr": None}]) # 只有 0 的区间不出点
+        self.assertIn(b"100.500,0,", hr._history_csv(100, 110, "TEST")) # 导出保留原始记录
+
+if __name__ == "__main__":
+    unittest.main()
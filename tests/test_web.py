@@ -0,0 +1,49 @@
+"""内置 Web 服务器的请求处理：接口都不需要请求体，带请求体的请求不读取、直接拒绝并断开。
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hr
+
+class RequestBodyTest(unittest.TestCase):
+    def exchange(self, request):
+        """发出请求后一直读到对方断开 (2 秒内)，返回收到的全部内容"""
+        async def run():
+            server = hr.WebServer()
+            @server.route('/ping')
+            async def ping(req): return hr.json_response({"ok": True})
+            await server.start(0)
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+                writer.write(request)
+                try: return await asyncio.wait_for(reader.read(), 2)
+                finally: writer.close()
+            finally:
+                server.server.close()
+        return asyncio.run(run())
+
+    def test_without_body(self):
+        response = self.exchange(b"GET /ping HTTP/1.1\r\nHost: x\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 200"))
+
+    def test_body_rejected_without_reading(self):
+        # 声明 1 GB 却不发送：不能等着读，要立即回复并断开
+        for header in (b"Content-Length: 1000000000", b"Content-Length: 5", b"Transfer-Encoding: chunked"):
+            with self.subTest(header=header):
+                response = self.exchange(b"POST /ping HTTP/1.1\r\nHost: x\r\n" + header + b"\r\n\r\n")
+                self.assertTrue(response.startswith(b"HTTP/1.1 413"))
+                self.assertIn(b"Connection: close", response)
+
+    def test_invalid_length(self):
+        for value in (b"-1", b"abc"):
+            with self.subTest(value=value):
+                response = self.exchange(b"GET /ping HTTP/1.1\r\nContent-Length: " + value + b"\r\n\r\n")
+                self.assertTrue(response.startswith(b"HTTP/1.1 400"))
+
+if __name__ == "__main__":
+    unittest.main()
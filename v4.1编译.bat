@@ -1 +1 @@
-pyinstaller --noconsole --onefile --collect-all customtkinter --collect-all bleak --collect-all winsdk --hidden-import=winrt.windows.foundation.collections --name "HeartRateMonitor_v4.1" hr.py
\ No newline at end of file
+pyinstaller --noconsole --onefile --collect-all customtkinter --collect-all bleak --collect-all winsdk --hidden-import=winrt.windows.foundation.collections --hidden-import=hr_gui --name "HeartRateMonitor_v4.1" hr.py
\ No newline at end of file